@@ -0,0 +1,315 @@
+"""Column-at-a-time version of normalize -> clean -> enrich -> validate for pandas chunks.
+
+Each canonical column is factorized once (``pd.factorize``) and cleaned and
+validated on its *distinct* values with pandas column operations: ``.str``
+methods for ids, statuses and name checks, ``astype(float)`` for amounts and
+``pd.to_datetime(format=...)`` for the accepted date shapes. The results go
+back to the rows with numpy takes, and error reasons are built once per
+distinct combination of per-field messages (integer codes), not per row.
+The few distinct values outside the shapes the column ops cover (amounts
+that fail cleaning, dates that are not zero-padded, names that are not all
+letters) and the word capitalization of ``clean_customer_name`` (which has
+no exact ``.str`` equivalent) go through the per-row functions, so the
+result is identical to running ``process_order`` row by row (see
+``tests/test_batch_transform.py``).
+
+Measured with ``benchmarks/bench_validation.py`` (100k rows) this runs at
+about 5-6x the per-row path's throughput, roughly 170-250 ms per 100k-row
+chunk, not a few milliseconds: the cost left is O(rows) work on Python
+string objects (stripping order ids, factorize, takes, building the frames)
+that no pandas string op avoids without an Arrow-backed string dtype.
+
+Input columns are expected to hold strings (read CSVs with ``dtype=str,
+keep_default_na=False``); None/NaN cells are treated as missing.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .content_hash import HASHED_COLUMNS, SEPARATOR, digest
+from .dedup import match_key
+from .mappings import source_mapping
+from .transform import AMOUNT_JUNK_RE, CANONICAL_COLUMNS, FIELD_CLEANERS
+from .validation import (
+    CustomerNameStrategy,
+    OrderDateStrategy,
+    OrderIdStrategy,
+    StatusStrategy,
+    TotalAmountStrategy,
+    ValidationStrategy,
+)
+
+# Field each strategy checks, in ``OrderValidator`` order (which fixes the error_reason order).
+FIELD_STRATEGIES: Tuple[Tuple[str, ValidationStrategy], ...] = (
+    ("order_id", OrderIdStrategy()),
+    ("customer_name", CustomerNameStrategy()),
+    ("total_amount", TotalAmountStrategy()),
+    ("order_date", OrderDateStrategy()),
+    ("status", StatusStrategy()),
+)
+
+_CLEANERS = dict(FIELD_CLEANERS)
+_STRATEGIES = dict(FIELD_STRATEGIES)
+
+# Shapes the column ops handle; anything else is left to the per-row functions. ASCII digits only:
+# the amount cleaner keeps every Unicode digit, which ``float`` reads but ``[0-9]`` does not.
+_PLAIN_AMOUNT = r"[0-9]+\.?[0-9]*|\.[0-9]+"
+# Year 0 is a valid pandas date but not a ``datetime.date``.
+_ISO_DATE = r"(?!0000)[0-9]{4}-[0-9]{2}-[0-9]{2}"
+_DMY_DATE = r"[0-9]{2}([/-])[0-9]{2}\1(?!0000)[0-9]{4}"
+
+# (final values, fixed flags, error messages) of a column's distinct values.
+Checked = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _factorized(
+    frame: pd.DataFrame, names: Sequence[str], default: str, distinct: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(codes, uniques) of the first non-empty value among the ``names`` columns per row, else ``default``.
+
+    ``distinct`` columns (order ids) are not worth hashing: every row is its own "unique".
+    """
+    present = [name for name in names if name in frame.columns]
+    if not present:
+        return np.zeros(len(frame), dtype=np.intp), np.array([default], dtype=object)
+    result = None
+    for name in reversed(present):
+        if distinct:
+            values = frame[name].to_numpy(dtype=object, na_value="")
+            result = np.where(values != "", values, default if result is None else result)
+            continue
+        codes, uniques = pd.factorize(frame[name], use_na_sentinel=False)
+        uniques = np.asarray(uniques, dtype=object)
+        filled = ~pd.isna(uniques) & (uniques != "")
+        if len(present) == 1:
+            return codes, np.where(filled, uniques, default).astype(object)
+        result = np.where(filled[codes], uniques[codes], default if result is None else result)
+    if distinct:
+        return np.arange(len(frame)), result.astype(object)
+    codes, uniques = pd.factorize(result, use_na_sentinel=False)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def _factorized_columns(frame: pd.DataFrame, source: str) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """``normalize_order`` as (codes, uniques) per canonical column, using the aliases present in the frame."""
+    columns = {}
+    for item in source_mapping(source).fields:
+        if item.name == "source":
+            columns["source"] = np.zeros(len(frame), dtype=np.intp), np.array([source], dtype=object)
+        else:
+            columns[item.name] = _factorized(frame, item.columns, item.default, distinct=item.name == "order_id")
+    return columns
+
+
+def normalize_frame(frame: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Vectorized ``normalize_order``: map source columns into the canonical schema."""
+    columns = {name: uniques[codes] for name, (codes, uniques) in _factorized_columns(frame, source).items()}
+    return pd.DataFrame(columns, index=frame.index, dtype=object)
+
+
+def _row_by_row(field: str, values: np.ndarray) -> Checked:
+    """The per-row cleaner and strategy of ``field`` on each value (for values the column ops do not cover)."""
+    cleaner = _CLEANERS.get(field)
+    strategy = _STRATEGIES.get(field)
+    final = np.empty(len(values), dtype=object)
+    fixed = np.zeros(len(values), dtype=bool)
+    messages = np.full(len(values), "", dtype=object)
+    for position, original in enumerate(values):
+        value = original
+        if cleaner is not None:
+            cleaned = cleaner(original)
+            if cleaned is not None:
+                value = cleaned
+                fixed[position] = cleaned != original
+        record = {field: value}
+        if strategy is not None:
+            messages[position] = "; ".join(strategy.validate(record))
+        # OrderDateStrategy rewrites the date into ISO form in place.
+        final[position] = record[field]
+    return final, fixed, messages
+
+
+def _with_fallback(field: str, values: pd.Series, checked: Checked, covered: np.ndarray) -> Checked:
+    """``checked``, with the values outside ``covered`` redone by ``_row_by_row``."""
+    if covered.all():
+        return checked
+    # Copies: the column ops may hand back read-only views of pandas data.
+    final, fixed, messages = (part.copy() for part in checked)
+    rest = ~covered
+    final[rest], fixed[rest], messages[rest] = _row_by_row(field, values.to_numpy()[rest])
+    return final, fixed, messages
+
+
+def _messages(flags: np.ndarray, message: str) -> np.ndarray:
+    """``message`` where ``flags`` is set, "" elsewhere."""
+    messages = np.full(len(flags), "", dtype=object)
+    messages[flags] = message
+    return messages
+
+
+def _check_order_ids(values: pd.Series) -> Checked:
+    stripped = values.str.strip().to_numpy()
+    return stripped, stripped != values.to_numpy(), _messages(stripped == "", "order_id missing")
+
+
+def _name_messages(names: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """``CustomerNameStrategy`` messages, and which names the column checks settled."""
+    stripped = names.str.strip()
+    missing = (stripped == "").to_numpy()
+    letters = stripped.str.replace(" ", "", regex=False).str.isalpha().to_numpy(dtype=bool)
+    too_long = (stripped.str.len() > 50).to_numpy()
+    messages = np.where(missing, "customer_name missing", np.where(too_long, "customer_name too long", ""))
+    # Only a name with something besides letters and spaces can have digits in it.
+    return messages.astype(object), missing | letters
+
+
+def _check_names(values: pd.Series) -> Checked:
+    # The distinct names go through the (memoized) row cleaner: its per-word capitalization
+    # is not ``str.title`` for hyphenated or mixed-script words.
+    cleaned = values.map(_CLEANERS["customer_name"])
+    final = cleaned.where(cleaned.notna(), values)
+    messages, covered = _name_messages(final)
+    checked = (final.to_numpy(dtype=object), (final != values).to_numpy(), messages)
+    return _with_fallback("customer_name", values, checked, covered)
+
+
+def _check_amounts(values: pd.Series) -> Checked:
+    cleaned = values.str.replace(AMOUNT_JUNK_RE, "", regex=True)
+    number = cleaned.where(cleaned.str.fullmatch(_PLAIN_AMOUNT).fillna(False).astype(bool)).astype(float)
+    # Amounts the cleaner turns into a positive number; the rest keep their raw value and are judged by the row path.
+    covered = (number > 0).to_numpy()
+    final = np.where(covered, number.to_numpy().astype(str).astype(object), values.to_numpy())
+    checked = (final, covered & (final != values.to_numpy()), np.full(len(values), "", dtype=object))
+    return _with_fallback("total_amount", values, checked, covered)
+
+
+def _check_dates(values: pd.Series) -> Checked:
+    cleaned = values.str.strip()
+    # Zero-padded shapes: the ISO form is the text itself or its parts reordered; to_datetime only vets the date.
+    dmy = cleaned.where(cleaned.str.fullmatch(_DMY_DATE))
+    iso = cleaned.where(cleaned.str.fullmatch(_ISO_DATE)).fillna(
+        dmy.str.slice(6, 10) + "-" + dmy.str.slice(3, 5) + "-" + dmy.str.slice(0, 2)
+    )
+    # NaT: another shape, an impossible date or a year out of pandas' range; the row path decides.
+    covered = pd.to_datetime(iso, format="%Y-%m-%d", errors="coerce").notna().to_numpy()
+    final = np.where(covered, iso.to_numpy(dtype=object), cleaned.to_numpy(dtype=object))
+    checked = (final, cleaned.to_numpy() != values.to_numpy(), np.full(len(values), "", dtype=object))
+    return _with_fallback("order_date", values, checked, covered)
+
+
+def _check_statuses(values: pd.Series) -> Checked:
+    final = values.str.strip().str.upper()
+    missing = (final.str.strip() == "").to_numpy()
+    return final.to_numpy(), final.to_numpy() != values.to_numpy(), _messages(missing, "status missing")
+
+
+_COLUMN_CHECKS: Dict[str, Callable[[pd.Series], Checked]] = {
+    "order_id": _check_order_ids,
+    "customer_name": _check_names,
+    "total_amount": _check_amounts,
+    "order_date": _check_dates,
+    "status": _check_statuses,
+}
+
+
+def _enrich_names(
+    customer_ids: Tuple[np.ndarray, np.ndarray], names: np.ndarray, customers: Mapping[str, str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized ``enrich_customer``: (names, changed flags), one lookup per distinct customer_id."""
+    codes, uniques = customer_ids
+    reference = pd.Series(uniques, dtype=object).str.strip().map(dict(customers)).to_numpy(dtype=object)[codes]
+    known = ~pd.isna(reference)
+    enriched = np.where(known, reference, names)
+    return enriched, known & (enriched != names)
+
+
+def _error_reasons(messages: List[Tuple[np.ndarray, np.ndarray]], size: int) -> np.ndarray:
+    """``"; "``-joined messages per row, from (row codes, messages of the distinct values) per field.
+
+    Each field contributes one of a handful of messages, so the rows are keyed
+    by their combination of message codes and each combination is joined once.
+    """
+    key = np.zeros(size, dtype=np.int64)
+    labels = []
+    for codes, by_value in messages:
+        message_codes, texts = pd.factorize(by_value, use_na_sentinel=False)
+        key = key * len(texts) + message_codes[codes]
+        labels.append(texts)
+    combos, keys = pd.factorize(key)
+    reasons = np.empty(len(keys), dtype=object)
+    for position, combo in enumerate(keys.tolist()):
+        parts = []
+        for texts in reversed(labels):
+            combo, code = divmod(combo, len(texts))
+            parts.append(texts[code])
+        reasons[position] = "; ".join(part for part in reversed(parts) if part)
+    return reasons[combos]
+
+
+def clean_and_validate_frame(
+    frame: pd.DataFrame, source: str, customers: Optional[Mapping[str, str]] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Vectorized normalize + ``clean_and_fix_errors`` + ``enrich_customer`` + ``validate_order``.
+
+    Returns ``(clean_df, error_df)``: both carry the canonical columns (as
+    strings, dates ISO-formatted when parseable) plus ``was_fixed``;
+    ``error_df`` also has ``error_reason``. The original index is preserved.
+    Without ``customers`` the enrich stage is skipped, as in ``process_order``.
+    """
+    factorized = _factorized_columns(frame, source)
+    columns: Dict[str, np.ndarray] = {}
+    messages: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    was_fixed = np.zeros(len(frame), dtype=bool)
+    for column in CANONICAL_COLUMNS:
+        codes, uniques = factorized[column]
+        check = _COLUMN_CHECKS.get(column)
+        if check is None:
+            columns[column] = uniques[codes]
+            continue
+        final, fixed, messages[column] = check(pd.Series(uniques, dtype=object))
+        columns[column] = final[codes]
+        was_fixed |= fixed[codes]
+        if column == "customer_name" and customers is not None:
+            # Enrichment sits between clean and validate: validate the enriched names instead.
+            columns[column], enriched = _enrich_names(factorized["customer_id"], columns[column], customers)
+            codes, uniques = pd.factorize(columns[column], use_na_sentinel=False)
+            names = pd.Series(np.asarray(uniques, dtype=object), dtype=object)
+            by_name, covered = _name_messages(names)
+            by_name[~covered] = _row_by_row(column, names.to_numpy()[~covered])[2]
+            messages[column] = codes, by_name
+            was_fixed |= enriched
+        else:
+            messages[column] = codes, messages[column]
+
+    error_reason = _error_reasons([messages[field] for field, _ in FIELD_STRATEGIES], len(frame))
+    result = pd.DataFrame(columns, index=frame.index, dtype=object)
+    result["was_fixed"] = was_fixed
+
+    is_valid = error_reason == ""
+    clean_df = result[is_valid]
+    error_df = result[~is_valid].assign(error_reason=error_reason[~is_valid])
+    return clean_df, error_df
+
+
+def frame_hashes(frame: pd.DataFrame, columns: Sequence[str] = HASHED_COLUMNS) -> pd.Series:
+    """``content_hash`` of every row, equal to the per-row function on the same values."""
+    if frame.empty:
+        return pd.Series([], index=frame.index, dtype=object)
+    return frame[list(columns)].fillna("").astype(str).agg(SEPARATOR.join, axis=1).map(digest)
+
+
+def frame_match_keys(frame: pd.DataFrame) -> pd.Series:
+    """``dedup.match_key`` of every clean row, one call per distinct (customer, name, date, amount)."""
+    if frame.empty:
+        return pd.Series([], index=frame.index, dtype=object)
+    columns = ["customer_id", "customer_name", "order_date", "total_amount"]
+    keys = {
+        values: match_key(dict(zip(columns, values)))
+        for values in frame[columns].drop_duplicates().itertuples(index=False, name=None)
+    }
+    return pd.Series(
+        [keys[values] for values in frame[columns].itertuples(index=False, name=None)], index=frame.index, dtype=object
+    )
@@ -0,0 +1,347 @@
+"""Bulk CSV ingestion that bypasses RabbitMQ.
+
+Each chunk goes through ``clean_and_validate_frame`` -- the vectorized
+equivalent of the consumer's ``process_order`` stage, enriched from the same
+customer cache (``app.customers``) -- is staged with
+``COPY`` into temp tables and then merged into
+``orders``, ``orders_clean`` and ``orders_error`` with set-based
+``INSERT ... SELECT ... ON CONFLICT``; rows whose ``content_hash`` is unchanged
+are left alone (see ``app.content_hash``), clean rows repeating an order of
+the other source are flagged (see ``app.dedup``) and the rollups follow each
+merge (see ``app.rollups``). Within a chunk the last row per ``order_id`` wins,
+exactly as sequential per-message upserts would resolve it.
+
+Usage::
+
+    python -m app.bulk_load offline upload/offline_orders.csv --chunk-size 20000
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import logging
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .batch_transform import clean_and_validate_frame, frame_hashes, frame_match_keys, normalize_frame
+from .config import get_settings
+from .content_hash import ERROR_HASHED_COLUMNS, count_unchanged
+from .customers import FETCH_CUSTOMERS_SQL, CustomerCache, customer_cache, resolve
+from .db import create_tables, get_engine, partitioned
+from .dedup import FETCH_PRIMARIES_SQL, LOCK_KEYS_SQL, RecentKeys, flag_duplicates, recent_keys
+from .jobs import JOB_PROGRESS_SQL
+from .logging_conf import configure_logging
+from .metrics import CLEAN_ROWS, ERROR_ROWS, FIXED_ROWS, timed
+from .notify import NOTIFY_SQL, ORDERS_CHANNEL, change_payload
+from .partitions import casts_for, lock_sql, upsert_sql
+from .rollups import ROLLUPS, delta_sql
+
+LOGGER = logging.getLogger("bulk.load")
+
+RAW_COLUMNS = (
+    "order_id",
+    "source",
+    "order_date",
+    "customer_id",
+    "customer_name",
+    "total_amount",
+    "status",
+    "job_id",
+    "content_hash",
+)
+CLEAN_COLUMNS = RAW_COLUMNS + ("match_key", "duplicate_of")
+ERROR_COLUMNS = RAW_COLUMNS + ("error_reason",)
+# Staged as text like job_id; the merges turn '' back into NULL.
+NULLABLE_COLUMNS = ("job_id", "match_key", "duplicate_of")
+
+STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS orders_stage (
+    seq BIGINT, order_id TEXT, source TEXT, order_date TEXT, customer_id TEXT,
+    customer_name TEXT, total_amount TEXT, status TEXT, job_id TEXT, content_hash TEXT
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS orders_clean_stage (
+    LIKE orders_stage, match_key TEXT, duplicate_of TEXT
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS orders_error_stage (LIKE orders_stage, error_reason TEXT) ON COMMIT DELETE ROWS;
+"""
+
+STAGE_DROP = "DROP TABLE IF EXISTS orders_stage, orders_clean_stage, orders_error_stage"
+
+MERGE_ORDERS = """
+INSERT INTO orders (
+    order_id, source, order_date, customer_id, customer_name, total_amount, status, job_id, content_hash
+)
+SELECT DISTINCT ON (order_id) order_id, source, order_date, customer_id, customer_name, total_amount, status,
+    NULLIF(job_id, ''), content_hash
+FROM orders_stage
+ORDER BY order_id, seq DESC
+ON CONFLICT (order_id) DO UPDATE SET
+    source = EXCLUDED.source,
+    order_date = EXCLUDED.order_date,
+    customer_id = EXCLUDED.customer_id,
+    customer_name = EXCLUDED.customer_name,
+    total_amount = EXCLUDED.total_amount,
+    status = EXCLUDED.status,
+    job_id = EXCLUDED.job_id,
+    content_hash = EXCLUDED.content_hash
+WHERE orders.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+"""
+
+MERGE_CLEAN = """
+INSERT INTO orders_clean (
+    order_id, source, order_date, customer_id, customer_name, total_amount, status, job_id, content_hash,
+    match_key, duplicate_of
+)
+SELECT DISTINCT ON (order_id) order_id, source, order_date::date, customer_id, customer_name,
+    total_amount::numeric, status, NULLIF(job_id, ''), content_hash, NULLIF(match_key, ''), NULLIF(duplicate_of, '')
+FROM orders_clean_stage
+ORDER BY order_id, seq DESC
+ON CONFLICT (order_id) DO UPDATE SET
+    source = EXCLUDED.source,
+    order_date = EXCLUDED.order_date,
+    customer_id = EXCLUDED.customer_id,
+    customer_name = EXCLUDED.customer_name,
+    total_amount = EXCLUDED.total_amount,
+    status = EXCLUDED.status,
+    job_id = EXCLUDED.job_id,
+    content_hash = EXCLUDED.content_hash,
+    match_key = EXCLUDED.match_key,
+    duplicate_of = EXCLUDED.duplicate_of
+WHERE orders_clean.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+"""
+
+MERGE_ERROR = """
+INSERT INTO orders_error (
+    order_id, source, order_date, customer_id, customer_name, total_amount, status, job_id, content_hash, error_reason
+)
+SELECT DISTINCT ON (order_id) order_id, source, order_date, customer_id, customer_name, total_amount, status,
+    NULLIF(job_id, ''), content_hash, error_reason
+FROM orders_error_stage
+ORDER BY order_id, seq DESC
+ON CONFLICT (order_id) DO UPDATE SET
+    source = EXCLUDED.source,
+    order_date = EXCLUDED.order_date,
+    customer_id = EXCLUDED.customer_id,
+    customer_name = EXCLUDED.customer_name,
+    total_amount = EXCLUDED.total_amount,
+    status = EXCLUDED.status,
+    job_id = EXCLUDED.job_id,
+    content_hash = EXCLUDED.content_hash,
+    error_reason = EXCLUDED.error_reason
+WHERE orders_error.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+"""
+
+MERGES = (("orders", MERGE_ORDERS), ("orders_clean", MERGE_CLEAN), ("orders_error", MERGE_ERROR))
+
+
+def _latest_staged(table: str, columns: Sequence[str]) -> str:
+    """Last staged row per order_id of ``table``, typed like the target columns."""
+    casts = casts_for(table, columns)
+
+    def expression(column: str) -> str:
+        if column in NULLABLE_COLUMNS:
+            return f"NULLIF({column}, '') AS {column}"
+        if column in casts:
+            return f"CAST({column} AS {casts[column]}) AS {column}"
+        return column
+
+    projection = ", ".join(expression(column) for column in columns)
+    return f"SELECT DISTINCT ON (order_id) {projection} FROM {table}_stage ORDER BY order_id, seq DESC"
+
+
+# Partitioned layout (app/partitions.py): replace-if-changed instead of ON CONFLICT.
+PARTITIONED_MERGES = tuple(
+    (table, upsert_sql(table, columns, _latest_staged(table, columns)))
+    for table, columns in (("orders", RAW_COLUMNS), ("orders_clean", CLEAN_COLUMNS), ("orders_error", ERROR_COLUMNS))
+)
+LOCK_STAGED = lock_sql("SELECT order_id FROM orders_stage")
+# Rollups (app/rollups.py): retract before and add after each merge, for the staged order ids.
+STAGED_DELTAS = {
+    table: tuple(delta_sql(table, f"SELECT order_id FROM {table}_stage", sign) for sign in (-1, 1))
+    for table in ROLLUPS
+}
+
+
+def iter_chunks(rows: Iterable[Dict[str, str]], size: int) -> Iterator[List[Dict[str, str]]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _copy(cursor, table: str, columns: Sequence[str], frame: pd.DataFrame) -> None:
+    # The frame index is the row's position in the load (seq). QUOTE_ALL keeps
+    # empty strings as '' instead of NULL, matching what the ORM upserts store.
+    buffer = io.StringIO()
+    frame.to_csv(buffer, columns=list(columns), header=False, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} (seq, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _chunk_customers(cursor, cache: Optional[CustomerCache], raw_df: pd.DataFrame) -> Optional[Dict[str, str]]:
+    """Reference names for the chunk's customer ids (cache misses: one query)."""
+    if cache is None:
+        return None
+
+    def fetch(ids: List[str]):
+        cursor.execute(FETCH_CUSTOMERS_SQL, (ids,))
+        return cursor.fetchall()
+
+    ids = {value.strip() for value in raw_df["customer_id"].unique() if isinstance(value, str) and value.strip()}
+    return resolve(cache, ids, fetch)
+
+
+def _chunk_duplicates(cursor, dedup: RecentKeys, clean_df: pd.DataFrame) -> Tuple[pd.Series, List[tuple]]:
+    """``duplicate_of`` of the chunk's clean rows and its new primaries (see ``dedup.flag_duplicates``)."""
+
+    def fetch(keys: List[str]):
+        cursor.execute(LOCK_KEYS_SQL, {"keys": keys})
+        cursor.execute(FETCH_PRIMARIES_SQL, {"keys": keys, "hours": dedup.window / 3600})
+        return cursor.fetchall()
+
+    rows = clean_df[["order_id", "source", "match_key"]].to_dict("records")
+    primaries = flag_duplicates(dedup, rows, fetch)
+    return pd.Series([row.get("duplicate_of") for row in rows], index=clean_df.index, dtype=object), primaries
+
+
+def _stage_chunk(
+    cursor,
+    source: str,
+    chunk: pd.DataFrame,
+    job_id: Optional[str],
+    customers: Optional[CustomerCache] = None,
+    dedup: Optional[RecentKeys] = None,
+) -> Tuple[Dict[str, int], Dict[str, int], List[tuple]]:
+    """Stage a chunk and lock its orders.
+
+    Returns the job counts, the distinct order ids staged per table and the
+    new duplicate-match primaries.
+    """
+    raw_df = normalize_frame(chunk, source)
+    clean_df, error_df = clean_and_validate_frame(chunk, source, _chunk_customers(cursor, customers, raw_df))
+    job = job_id or ""  # staged as text; the merges turn '' back into NULL
+    _copy(cursor, "orders_stage", RAW_COLUMNS, raw_df.assign(job_id=job, content_hash=frame_hashes(raw_df)))
+    # Order locks before match-key locks, as in the consumers.
+    cursor.execute(LOCK_STAGED)
+    clean_df = clean_df.assign(job_id=job, content_hash=frame_hashes(clean_df), match_key=frame_match_keys(clean_df))
+    primaries: List[tuple] = []
+    duplicate_of = None
+    if dedup is not None and not clean_df.empty:
+        duplicate_of, primaries = _chunk_duplicates(cursor, dedup, clean_df)
+    _copy(cursor, "orders_clean_stage", CLEAN_COLUMNS, clean_df.assign(duplicate_of=duplicate_of))
+    _copy(
+        cursor,
+        "orders_error_stage",
+        ERROR_COLUMNS,
+        error_df.assign(job_id=job, content_hash=frame_hashes(error_df, ERROR_HASHED_COLUMNS)),
+    )
+    counts = {
+        "clean": len(clean_df),
+        "error": len(error_df),
+        "fixed": int(clean_df["was_fixed"].sum() + error_df["was_fixed"].sum()),
+    }
+    staged = {
+        "orders": raw_df["order_id"].nunique(),
+        "orders_clean": clean_df["order_id"].nunique(),
+        "orders_error": error_df["order_id"].nunique(),
+    }
+    return counts, staged, primaries
+
+
+def load_rows(
+    source: str,
+    rows: Iterable[Dict[str, str]],
+    engine,
+    chunk_size: int | None = None,
+    job_id: Optional[str] = None,
+) -> Dict[str, int]:
+    """Stream rows into Postgres chunk by chunk; each chunk commits on its own.
+
+    With ``job_id`` the rows are stamped with it and each chunk's counts are
+    added to the upload job in the chunk's transaction.
+    """
+    chunk_size = chunk_size or get_settings().bulk_chunk_size
+    merges = PARTITIONED_MERGES if partitioned() else MERGES
+    customers = customer_cache(get_settings())
+    dedup = recent_keys(get_settings())
+    totals = {"loaded": 0, "clean": 0, "error": 0, "fixed": 0}
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(STAGE_DDL)
+        connection.commit()
+        for chunk in iter_chunks(rows, chunk_size):
+            frame = pd.DataFrame(chunk, index=pd.RangeIndex(totals["loaded"], totals["loaded"] + len(chunk)))
+            try:
+                counts, staged, primaries = _stage_chunk(cursor, source, frame, job_id, customers, dedup)
+                written = {}
+                with timed("upsert"):
+                    for table, merge in merges:
+                        retract, add = STAGED_DELTAS.get(table, (None, None))
+                        if retract:
+                            cursor.execute(retract)
+                        cursor.execute(merge)
+                        written[table] = cursor.rowcount
+                        if add:
+                            cursor.execute(add)
+                if job_id is not None:
+                    cursor.execute(
+                        JOB_PROGRESS_SQL,
+                        {"job_id": job_id, "processed": len(chunk), **counts},
+                    )
+                cursor.execute(NOTIFY_SQL, (ORDERS_CHANNEL, change_payload(source, counts["clean"], counts["error"])))
+                with timed("commit"):
+                    connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            if dedup is not None:
+                dedup.remember(primaries)
+            for table, rows in staged.items():
+                count_unchanged(table, rows, written[table])
+            CLEAN_ROWS.labels(source=source).inc(counts["clean"])
+            ERROR_ROWS.labels(source=source).inc(counts["error"])
+            FIXED_ROWS.labels(source=source).inc(counts["fixed"])
+            totals["loaded"] += len(chunk)
+            for key, value in counts.items():
+                totals[key] += value
+            LOGGER.info("Bulk loaded %d %s rows so far", totals["loaded"], source)
+        cursor.execute(STAGE_DROP)
+        connection.commit()
+    finally:
+        connection.close()
+    return totals
+
+
+def load_csv(source: str, path: Path, engine, chunk_size: int | None = None) -> Dict[str, int]:
+    with path.open(encoding="utf-8", newline="") as handle:
+        return load_rows(source, csv.DictReader(handle), engine, chunk_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk load an orders CSV straight into Postgres.")
+    parser.add_argument("source", choices=["online", "offline"])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    configure_logging(settings=settings)
+    engine = get_engine(settings)
+    try:
+        create_tables(engine)
+        totals = load_csv(args.source, args.path, engine, args.chunk_size)
+        LOGGER.info("Bulk load finished: %s", totals)
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
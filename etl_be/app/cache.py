@@ -0,0 +1,61 @@
+"""In-process cache for the read endpoints.
+
+Entries are keyed by (model, filters, cursor, limit), expire after a TTL and
+are evicted least-recently-used beyond ``max_entries``. Every committed write
+bumps ``version`` (via ``ChangeListener``), which drops all entries at once;
+the version also goes into the ETag, together with a per-process nonce so
+tags from an earlier process (whose counter restarted) never match.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 30.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self._nonce = uuid.uuid4().hex[:12]
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def etag(self) -> str:
+        return f'"{self._nonce}-{self.version}"'
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic() or entry.etag != self.etag():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, body: bytes, etag: str) -> None:
+        """Store ``body`` computed while the version was ``etag``; stale results are dropped."""
+        with self._lock:
+            if etag != self.etag():
+                return
+            self._entries[key] = CachedResponse(body, etag, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, _payloads: object = None) -> None:
+        """Bump the version and drop every entry (usable directly as a ChangeListener handler)."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
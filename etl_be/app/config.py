@@ -14,8 +14,26 @@ class Settings:
     rabbitmq_host: str = os.getenv("RABBITMQ_HOST", "localhost")
     rabbitmq_port: int = int(os.getenv("RABBITMQ_PORT", "5672"))
     rabbitmq_queue: str = os.getenv("RABBITMQ_QUEUE", "orders_raw")
+    # Opt-in direct exchange routing by source to lane queues <RABBITMQ_QUEUE>.<source> (see app/routing.py);
+    # empty (default) = publish straight to RABBITMQ_QUEUE. Drain RABBITMQ_QUEUE before switching.
+    rabbitmq_exchange: str = os.getenv("RABBITMQ_EXCHANGE", "")
     rabbitmq_user: str = os.getenv("RABBITMQ_USER", "guest")
     rabbitmq_password: str = os.getenv("RABBITMQ_PASSWORD", "guest")
+    rabbitmq_heartbeat: int = int(os.getenv("RABBITMQ_HEARTBEAT", "60"))
+    # Long-lived publisher connections shared by the API and producer scripts.
+    publisher_pool_size: int = int(os.getenv("PUBLISHER_POOL_SIZE", "4"))
+    # Rows packed into one AMQP message (1 = legacy single-row {"data": row} envelope).
+    publisher_rows_per_message: int = int(os.getenv("PUBLISHER_ROWS_PER_MESSAGE", "1"))
+    # Message body codec (json | msgpack, see utils.CODECS); consumers read every codec whatever this says.
+    message_codec: str = os.getenv("MESSAGE_CODEC", "json")
+    # Batched envelopes as {"v": 3, "columns": [...], "rows": [[...], ...]}: column names once per message.
+    message_positional_rows: bool = os.getenv("MESSAGE_POSITIONAL_ROWS", "false").lower() in {"1", "true", "yes", "on"}
+    # Publisher confirms: pipelined publishing with at most N unconfirmed messages in flight.
+    publisher_confirms: bool = os.getenv("PUBLISHER_CONFIRMS", "false").lower() in {"1", "true", "yes", "on"}
+    publisher_confirm_window: int = int(os.getenv("PUBLISHER_CONFIRM_WINDOW", "256"))
+    publisher_confirm_timeout: float = float(os.getenv("PUBLISHER_CONFIRM_TIMEOUT", "30"))
+    publisher_max_retries: int = int(os.getenv("PUBLISHER_MAX_RETRIES", "3"))
+    publisher_reconnect_delay: float = float(os.getenv("PUBLISHER_RECONNECT_DELAY", "2"))
 
     postgres_host: str = os.getenv("POSTGRES_HOST", "localhost")
     postgres_port: int = int(os.getenv("POSTGRES_PORT", "5432"))
@@ -23,6 +41,89 @@ class Settings:
     postgres_password: str = os.getenv("POSTGRES_PASSWORD", "orders_pass")
     postgres_db: str = os.getenv("POSTGRES_DB", "orders_db")
 
+    # Consumer micro-batching: flush after N messages or T milliseconds, whichever comes first.
+    consumer_batch_size: int = int(os.getenv("CONSUMER_BATCH_SIZE", "100"))
+    consumer_batch_linger_ms: int = int(os.getenv("CONSUMER_BATCH_LINGER_MS", "200"))
+    # Worker processes started by `python -m app.consumer_orders` (override with --workers).
+    consumer_workers: int = int(os.getenv("CONSUMER_WORKERS", "1"))
+    # Per-worker prefetch; 0 means two batches' worth.
+    consumer_prefetch: int = int(os.getenv("CONSUMER_PREFETCH", "0"))
+    # "blocking" (pika + SQLAlchemy) or "async" (aio-pika + asyncpg, see app/consumer_async.py).
+    consumer_engine: str = os.getenv("CONSUMER_ENGINE", "blocking")
+    # Async engine: messages in flight at once and size of its asyncpg pool.
+    consumer_concurrency: int = int(os.getenv("CONSUMER_CONCURRENCY", "64"))
+    async_db_pool_size: int = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+    consumer_drain_timeout: float = float(os.getenv("CONSUMER_DRAIN_TIMEOUT", "30"))
+    consumer_restart_backoff: float = float(os.getenv("CONSUMER_RESTART_BACKOFF", "1"))
+    # Lanes a consumer subscribes to (comma separated, empty = all; or --lanes) and per-lane
+    # worker count / prefetch (0 = CONSUMER_WORKERS / CONSUMER_PREFETCH). The online lane is a
+    # priority queue with this many levels (0 = plain queue).
+    consumer_lanes: str = os.getenv("CONSUMER_LANES", "")
+    online_lane_workers: int = int(os.getenv("ONLINE_LANE_WORKERS", "0"))
+    online_lane_prefetch: int = int(os.getenv("ONLINE_LANE_PREFETCH", "0"))
+    online_lane_max_priority: int = int(os.getenv("ONLINE_LANE_MAX_PRIORITY", "10"))
+    offline_lane_workers: int = int(os.getenv("OFFLINE_LANE_WORKERS", "0"))
+    offline_lane_prefetch: int = int(os.getenv("OFFLINE_LANE_PREFETCH", "0"))
+    # Failed messages: up to N retries through delay queues (base delay doubling per attempt),
+    # then the parking queue. DB outages pause consumption with a backoff between the two delays, at most
+    # DB_BREAKER_MAX_PAUSES times per batch; after that the batch is bisected and retried/parked as usual.
+    consumer_max_retries: int = int(os.getenv("CONSUMER_MAX_RETRIES", "5"))
+    consumer_retry_base_delay_ms: int = int(os.getenv("CONSUMER_RETRY_BASE_DELAY_MS", "1000"))
+    db_breaker_base_delay: float = float(os.getenv("DB_BREAKER_BASE_DELAY", "1"))
+    db_breaker_max_delay: float = float(os.getenv("DB_BREAKER_MAX_DELAY", "60"))
+    db_breaker_max_pauses: int = int(os.getenv("DB_BREAKER_MAX_PAUSES", "10"))
+    # Per-process LRU of the content hash last committed per (table, order_id): unchanged rows are
+    # dropped before reaching the database (0 = off; the upserts skip them either way, see app/content_hash.py).
+    consumer_seen_cache_size: int = int(os.getenv("CONSUMER_SEEN_CACHE_SIZE", "0"))
+    # Opt-in enrichment from the customers table (app/customers.py): per-process LRU of customer_id -> name,
+    # entries expire after the TTL (seconds) and are dropped early on a customers_changed notification.
+    customer_enrichment: bool = os.getenv("CUSTOMER_ENRICHMENT", "false").lower() in {"1", "true", "yes", "on"}
+    customer_cache_size: int = int(os.getenv("CUSTOMER_CACHE_SIZE", "50000"))
+    customer_cache_ttl: float = float(os.getenv("CUSTOMER_CACHE_TTL", "300"))
+    # Opt-in cross-source duplicate flagging (app/dedup.py): an order matching one from another source that
+    # was stored within the window gets duplicate_of; each process remembers up to DEDUP_CACHE_SIZE recent keys.
+    dedup_enabled: bool = os.getenv("DEDUP_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+    dedup_window_hours: float = float(os.getenv("DEDUP_WINDOW_HOURS", "72"))
+    dedup_cache_size: int = int(os.getenv("DEDUP_CACHE_SIZE", "100000"))
+    # Prometheus metrics HTTP port of the consumer (worker i of --workers N uses port + i); 0 disables it.
+    consumer_metrics_port: int = int(os.getenv("CONSUMER_METRICS_PORT", "9108"))
+
+    # Range-partitioned orders tables (see app/partitions.py) with monthly partitions prepared this many
+    # months ahead; existing plain tables are converted with `python -m app.partitions migrate`.
+    orders_partitioned: bool = os.getenv("ORDERS_PARTITIONED", "false").lower() in {"1", "true", "yes", "on"}
+    partition_months_ahead: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+    # JSON file of per-source column mappings (see app/mappings.py); empty = app/source_mappings.json.
+    source_mappings_file: str = os.getenv("SOURCE_MAPPINGS_FILE", "")
+
+    # Rows per COPY/merge chunk for bulk uploads (POST /upload/{source}?mode=bulk, app.bulk_load).
+    bulk_chunk_size: int = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+
+    # GET /orders/*: largest page a client may ask for, and rows per server-side fetch when exporting.
+    orders_max_page_size: int = int(os.getenv("ORDERS_MAX_PAGE_SIZE", "1000"))
+    orders_export_batch_size: int = int(os.getenv("ORDERS_EXPORT_BATCH_SIZE", "2000"))
+
+    # In-process cache for GET /orders/clean|error, invalidated by LISTEN/NOTIFY from the writers.
+    read_cache_enabled: bool = os.getenv("READ_CACHE_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+    read_cache_ttl: float = float(os.getenv("READ_CACHE_TTL", "30"))
+    read_cache_max_entries: int = int(os.getenv("READ_CACHE_MAX_ENTRIES", "256"))
+    # GET /orders/live (SSE): bursts of commits within the window are sent as frames of at most N rows per table;
+    # ids skipped over (a lower id may commit after a higher one) are looked up again for LIVE_FEED_GAP_SECONDS
+    # (keep it around the longest write transaction; ids burned by upsert conflicts are looked up until then).
+    live_feed_enabled: bool = os.getenv("LIVE_FEED_ENABLED", "true").lower() in {"1", "true", "yes", "on"}
+    live_feed_coalesce_ms: int = int(os.getenv("LIVE_FEED_COALESCE_MS", "500"))
+    live_feed_max_rows: int = int(os.getenv("LIVE_FEED_MAX_ROWS", "200"))
+    live_feed_gap_seconds: float = float(os.getenv("LIVE_FEED_GAP_SECONDS", "5"))
+
+    # Logging: LOG_FORMAT text|json; LOG_ASYNC moves console/file output to a background thread;
+    # LOG_SAMPLE limits per-order loggers ("logger=N/s" or "logger=fraction"), with a summary
+    # of suppressed lines every LOG_SUMMARY_INTERVAL seconds.
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_format: str = os.getenv("LOG_FORMAT", "text")
+    log_async: bool = os.getenv("LOG_ASYNC", "true").lower() in {"1", "true", "yes", "on"}
+    log_sample: str = os.getenv("LOG_SAMPLE", "consumer.orders.rows=100/s")
+    log_summary_interval: float = float(os.getenv("LOG_SUMMARY_INTERVAL", "10"))
+
     upload_dir: Path = Path(os.getenv("UPLOAD_DIR", "upload")).resolve()
     migrate_on_start: bool = os.getenv("MIGRATE_ON_START", "true").lower() in {"1", "true", "yes", "on"}
 
@@ -0,0 +1,321 @@
+"""asyncio consumer engine (aio-pika + asyncpg).
+
+Keeps up to ``consumer_concurrency`` messages in flight at once instead of
+blocking on the broker and the database for each one. Every message runs the
+unchanged pipeline (normalize -> clean -> enrich -> validate) and is
+written in its own transaction; on success it is acked. Failures follow the
+same rules as the blocking engine (``app.retry``): a failing message goes to a
+delay queue or the parking queue and is acked, while transient database errors
+pause the handlers behind a shared circuit breaker. Each lane (``app.routing``)
+gets its own channel, prefetch and in-flight budget on the shared connection.
+
+Selected with ``python -m app.consumer_orders --engine async`` or
+``CONSUMER_ENGINE=async``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aio_pika
+import asyncpg
+
+from .config import Settings
+from .consumer_orders import (
+    QUEUE_DEPTH_INTERVAL,
+    changes_by_source,
+    decode_envelope,
+    log_outcomes,
+    process_envelope,
+    rows_by_table,
+)
+from .content_hash import RecentHashes, count_unchanged, recent_hashes
+from .customers import CustomerCache, customer_cache, customer_ids, resolve_async
+from .db import CLEAN_UPDATE_COLUMNS, ERROR_UPDATE_COLUMNS, ORDER_UPDATE_COLUMNS, partitioned
+from .dedup import RecentKeys, flag_duplicates_async, recent_keys
+from .jobs import job_counts, parked_rows
+from .metrics import (
+    CONSUMED_MESSAGES,
+    QUEUE_DEPTH,
+    REQUEUED_MESSAGES,
+    record_orders,
+    timed,
+    watch_asyncpg_pool,
+)
+from .notify import ORDERS_CHANNEL, change_payload
+from .partitions import casts_for, lock_sql, text_columns, unnest_sql, upsert_sql
+from .pipeline import ProcessedOrder
+from .rollups import delta_statements
+from .retry import CircuitBreaker, is_transient, log_route, next_route, parking_queue, retry_queues
+from .routing import RETRY_PRIORITY, Lane, select_lanes
+
+LOGGER = logging.getLogger("consumer.orders.async")
+
+RAW_COLUMNS = (
+    "order_id",
+    "source",
+    "order_date",
+    "customer_id",
+    "customer_name",
+    "total_amount",
+    "status",
+    "job_id",
+    "content_hash",
+)
+
+
+def _unnest_upsert(table: str, columns: Sequence[str], update_columns: Sequence[str], casts: dict) -> str:
+    """One set-based upsert: each column is passed as a text[] and unnested into rows."""
+    params = ", ".join(f"${i}::text[]" for i in range(1, len(columns) + 1))
+    projection = ", ".join(f"{column}::{casts[column]}" if column in casts else column for column in columns)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in update_columns)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"SELECT {projection} FROM unnest({params}) AS t({', '.join(columns)}) "
+        f"ON CONFLICT (order_id) DO UPDATE SET {updates} "
+        f"WHERE {table}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+    )
+
+
+UPSERT_ORDERS = _unnest_upsert("orders", RAW_COLUMNS, ORDER_UPDATE_COLUMNS, {})
+CLEAN_COLUMNS = RAW_COLUMNS + ("match_key", "duplicate_of")
+UPSERT_CLEAN = _unnest_upsert(
+    "orders_clean", CLEAN_COLUMNS, CLEAN_UPDATE_COLUMNS, {"order_date": "date", "total_amount": "numeric"}
+)
+UPSERT_ERROR = _unnest_upsert("orders_error", RAW_COLUMNS + ("error_reason",), ERROR_UPDATE_COLUMNS, {})
+UPSERTS = {
+    "orders": (UPSERT_ORDERS, RAW_COLUMNS),
+    "orders_clean": (UPSERT_CLEAN, CLEAN_COLUMNS),
+    "orders_error": (UPSERT_ERROR, RAW_COLUMNS + ("error_reason",)),
+}
+
+
+def _partitioned_upsert(table: str, columns: Sequence[str]) -> str:
+    params = [f"${i}" for i in range(1, len(columns) + 1)]
+    return upsert_sql(table, columns, unnest_sql(columns, params, casts_for(table, columns)))
+
+
+# Partitioned layout (app/partitions.py): replace-if-changed instead of ON CONFLICT.
+PARTITIONED_UPSERTS = {table: (_partitioned_upsert(table, columns), columns) for table, (_, columns) in UPSERTS.items()}
+LOCK_ORDERS = lock_sql("SELECT unnest($1::text[]) AS order_id")
+ROLLUP_DELTAS = delta_statements("SELECT unnest($1::text[])")
+JOB_PROGRESS = (
+    "INSERT INTO upload_job_progress (job_id, processed, clean, error, fixed) VALUES ($1, $2, $3, $4, $5)"
+)
+JOB_PARKED = "INSERT INTO upload_job_progress (job_id, parked) VALUES ($1, $2)"
+
+
+async def write_orders_async(
+    connection,
+    orders: Sequence[ProcessedOrder],
+    recent: Optional[RecentHashes] = None,
+    dedup: Optional[RecentKeys] = None,
+) -> Tuple[Dict[str, List[dict]], List[Tuple[str, str, str]]]:
+    """Same writes and return value as ``consumer_orders.write_orders``."""
+    tables = rows_by_table(orders)
+    primaries: List[Tuple[str, str, str]] = []
+    upserts = PARTITIONED_UPSERTS if partitioned() else UPSERTS
+    await connection.execute(LOCK_ORDERS, [row["order_id"] for row in tables["orders"]])
+    for table, rows in tables.items():
+        if recent is not None:
+            rows = recent.changed(table, rows)
+        if not rows:
+            continue
+        if table == "orders_clean" and dedup is not None:
+            primaries = await flag_duplicates_async(dedup, rows, connection)
+        statement, columns = upserts[table]
+        retract, add = ROLLUP_DELTAS.get(table, (None, None))
+        order_ids = [row["order_id"] for row in rows]
+        if retract:
+            await connection.execute(retract, order_ids)
+        # Every parameter is a text[]; typed clean values (date, amount) are cast back in SQL.
+        status = await connection.execute(statement, *text_columns(rows, columns))
+        # "INSERT 0 <n>": rows inserted or changed.
+        count_unchanged(table, len(rows), int(status.rsplit(" ", 1)[-1]))
+        if add:
+            await connection.execute(add, order_ids)
+    for job_id, counter in job_counts(orders).items():
+        await connection.execute(
+            JOB_PROGRESS, job_id, counter["processed"], counter["clean"], counter["error"], counter["fixed"]
+        )
+    for source, (clean_count, error_count) in changes_by_source(orders).items():
+        payload = change_payload(source, clean_count, error_count)
+        await connection.execute("SELECT pg_notify($1, $2)", ORDERS_CHANNEL, payload)
+    return tables, primaries
+
+
+async def handle_message_async(
+    body: bytes,
+    pool,
+    recent: Optional[RecentHashes] = None,
+    customers: Optional[CustomerCache] = None,
+    dedup: Optional[RecentKeys] = None,
+    content_type: Optional[str] = None,
+) -> None:
+    source, job_id, rows = decode_envelope(body, content_type)
+    async with pool.acquire() as connection:
+        names = None
+        if customers is not None:
+            names = await resolve_async(customers, customer_ids(source, rows), connection)
+        orders = process_envelope(source, job_id, rows, names)
+        transaction = connection.transaction()
+        await transaction.start()
+        try:
+            with timed("upsert"):
+                written, primaries = await write_orders_async(connection, orders, recent, dedup)
+        except BaseException:
+            await transaction.rollback()
+            raise
+        with timed("commit"):
+            await transaction.commit()
+    if recent is not None:
+        recent.remember_all(written)
+    if dedup is not None:
+        dedup.remember(primaries)
+    record_orders(orders)
+    log_outcomes(orders)
+
+
+async def consume(settings: Settings, stop: asyncio.Event, lanes: Optional[Sequence[Lane]] = None) -> None:
+    """Consume ``lanes`` (default: ``select_lanes``), each on its own channel, until ``stop`` is set."""
+    lanes = list(lanes) if lanes is not None else select_lanes(settings)
+    concurrency = max(1, settings.consumer_concurrency)
+    pool = await asyncpg.create_pool(
+        host=settings.postgres_host,
+        port=settings.postgres_port,
+        user=settings.postgres_user,
+        password=settings.postgres_password,
+        database=settings.postgres_db,
+        min_size=1,
+        max_size=settings.async_db_pool_size,
+    )
+    watch_asyncpg_pool("consumer", pool)
+    connection = await aio_pika.connect_robust(
+        host=settings.rabbitmq_host,
+        port=settings.rabbitmq_port,
+        login=settings.rabbitmq_user,
+        password=settings.rabbitmq_password,
+        heartbeat=settings.rabbitmq_heartbeat,
+    )
+    # One in-flight budget per lane, so a backlog on one lane never takes the slots of another.
+    in_flight = {lane.name: asyncio.Semaphore(concurrency) for lane in lanes}
+    breaker = CircuitBreaker(settings.db_breaker_base_delay, settings.db_breaker_max_delay)
+    recent = recent_hashes(settings)
+    customers = customer_cache(settings)
+    dedup = recent_keys(settings)
+
+    async def wait_out_outage(exc: BaseException) -> bool:
+        # Handlers failing together share one pause instead of each doubling it.
+        delay = breaker.remaining if breaker.is_open else breaker.record_failure(exc)
+        try:
+            await asyncio.wait_for(stop.wait(), delay)
+        except asyncio.TimeoutError:
+            return True
+        return False
+
+    async def start_lane(lane: Lane):
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=lane.prefetch or concurrency)
+        queue = await channel.declare_queue(lane.queue, durable=True, arguments=lane.arguments)
+        if settings.rabbitmq_exchange:
+            exchange = await channel.declare_exchange(
+                settings.rabbitmq_exchange, aio_pika.ExchangeType.DIRECT, durable=True
+            )
+            await queue.bind(exchange, routing_key=lane.name)
+        for name, arguments in retry_queues(settings, lane.queue):
+            await channel.declare_queue(name, durable=True, arguments=arguments)
+        await channel.declare_queue(parking_queue(lane.queue), durable=True)
+
+        async def retry_or_park(message: aio_pika.abc.AbstractIncomingMessage, exc: BaseException) -> None:
+            routing_key, headers = next_route(settings, lane.queue, dict(message.headers or {}), exc)
+            retry = aio_pika.Message(
+                message.body,
+                headers=headers,
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                priority=RETRY_PRIORITY,
+            )
+            await channel.default_exchange.publish(retry, routing_key=routing_key)
+            log_route(lane.queue, routing_key, headers)
+            if routing_key != parking_queue(lane.queue):
+                return
+            # Best effort, like consumer_orders.count_parked: the database may be what failed.
+            parked = parked_rows([(message.body, message.content_type)])
+            try:
+                await pool.executemany(JOB_PARKED, list(parked.items()))
+            except Exception:
+                LOGGER.warning("Could not count parked rows of jobs %s", ", ".join(sorted(parked)), exc_info=True)
+
+        async def on_message(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+            async with in_flight[lane.name]:
+                pauses_left = settings.db_breaker_max_pauses
+                while True:
+                    try:
+                        await handle_message_async(
+                            message.body, pool, recent, customers, dedup, content_type=message.content_type
+                        )
+                        break
+                    except Exception as exc:
+                        if is_transient(exc) and pauses_left > 0:
+                            pauses_left -= 1
+                            if await wait_out_outage(exc):
+                                continue
+                            await message.nack(requeue=True)
+                            REQUEUED_MESSAGES.inc()
+                            return
+                        LOGGER.exception("Failed to handle message")
+                        await retry_or_park(message, exc)
+                        await message.ack()
+                        return
+                breaker.record_success()
+                await message.ack()
+                CONSUMED_MESSAGES.inc()
+
+        async def watch_depth() -> None:
+            while True:
+                try:
+                    declared = await channel.declare_queue(lane.queue, durable=True, passive=True)
+                    QUEUE_DEPTH.labels(queue=lane.queue).set(declared.declaration_result.message_count)
+                except Exception:
+                    LOGGER.warning("Could not read the depth of queue %s", lane.queue, exc_info=True)
+                await asyncio.sleep(QUEUE_DEPTH_INTERVAL)
+
+        consumer_tag = await queue.consume(on_message)
+        LOGGER.info(
+            "Async consumer for lane %s started (queue %s, concurrency %d). Waiting for messages...",
+            lane.name,
+            lane.queue,
+            concurrency,
+        )
+        return queue, consumer_tag, asyncio.create_task(watch_depth())
+
+    try:
+        started = [await start_lane(lane) for lane in lanes]
+        await stop.wait()
+
+        # Graceful drain: stop deliveries, then let in-flight handlers finish.
+        for queue, consumer_tag, depth_task in started:
+            await queue.cancel(consumer_tag)
+            depth_task.cancel()
+        for semaphore in in_flight.values():
+            for _ in range(concurrency):
+                await semaphore.acquire()
+        LOGGER.info("Consumer stopped.")
+    finally:
+        await connection.close()
+        await pool.close()
+
+
+def run_async_consumer(settings: Settings, lanes: Optional[Sequence[Lane]] = None) -> None:
+    """Run the async engine on ``lanes`` until SIGTERM/SIGINT."""
+
+    async def runner() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await consume(settings, stop, lanes)
+
+    asyncio.run(runner())
@@ -1,144 +1,552 @@
 from __future__ import annotations
 
+import argparse
 import logging
-from datetime import date
-from typing import Dict
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
 
 import pika
-from sqlalchemy.dialects.postgresql import insert
 
 from .config import get_settings
+from .content_hash import RecentHashes, count_unchanged, recent_hashes
+from .customers import CustomerCache, Fetch, customer_cache, customer_ids, fetch_customers, resolve
+from .dedup import RecentKeys, fetch_primaries, flag_duplicates, recent_keys
 from .db import (
-    OrdersClean,
-    OrdersError,
     create_tables,
     get_engine,
     get_session_factory,
-    upsert_order,
+    last_per_order_id,
+    lock_orders,
+    upsert_clean_many,
+    upsert_error_many,
+    upsert_orders_many,
 )
-from .logging_conf import configure_logging
-from .transform import clean_and_fix_errors, normalize_order
-from .utils import json_loads
-from .validation import validate_order
+from .jobs import parked_rows, record_parked, record_progress
+from .logging_conf import (
+    WORKER_LOG_FORMAT,
+    build_handlers,
+    configure_logging,
+    configure_worker_logging,
+    shutdown_logging,
+    start_listener,
+)
+from .metrics import (
+    CONSUMED_MESSAGES,
+    QUEUE_DEPTH,
+    REQUEUED_MESSAGES,
+    StageTimer,
+    observe_stage,
+    record_orders,
+    serve_metrics,
+    timed,
+    watch_engine_pool,
+)
+from .notify import notify_orders_changed
+from .pipeline import ProcessedOrder, process_rows
+from .publisher import POSITIONAL_ENVELOPE_VERSION, connection_parameters
+from .rollups import add_to_rollups, retract_from_rollups
+from .routing import Lane, declare_lanes, select_lanes
+from .retry import (
+    CircuitBreaker,
+    MalformedMessage,
+    declare_retry_topology,
+    is_transient,
+    parking_queue,
+    retry_or_park,
+)
+from .utils import decode_body
 
 LOGGER = logging.getLogger("consumer.orders")
+# Per-order lines; sampled or rate limited through LOG_SAMPLE.
+ROW_LOGGER = logging.getLogger("consumer.orders.rows")
+
+# How often the consumer refreshes the queue depth gauge (passive queue.declare).
+QUEUE_DEPTH_INTERVAL = 5.0
+
+# (body, AMQP content_type) of one message; the content type is None for messages published without one.
+Message = Tuple[bytes, Optional[str]]
+# (delivery tag, body, AMQP headers, AMQP content_type) of one received message.
+Delivery = Tuple[int, bytes, Optional[Dict[str, Any]], Optional[str]]
+
 
-def handle_message(body: bytes, settings, SessionLocal) -> None:
-    message: Dict[str, object] = json_loads(body)
+def decode_envelope(body: bytes, content_type: Optional[str] = None) -> Tuple[str, Optional[str], List[object]]:
+    """``(source, job_id, rows)`` of a single-row (``data``), batched (``rows``) or positional envelope.
+
+    The body is decoded with the codec its ``content_type`` names; a message
+    without one is sniffed (``utils.codec_for``). Positional rows (``"v": 3``)
+    are zipped back with the envelope's ``columns``. A body that is not an
+    envelope at all raises ``MalformedMessage``.
+    """
+    started = time.perf_counter()
+    try:
+        message: Dict[str, object] = decode_body(body, content_type)
+    except ValueError as exc:  # bad UTF-8, JSON or msgpack, or an unsupported content type
+        raise MalformedMessage(f"message body cannot be decoded: {exc}") from exc
+    if not isinstance(message, dict):
+        raise MalformedMessage("envelope must be an object")
     source = str(message.get("source", "unknown"))
-    data = dict(message.get("data", {}))
-
-    canonical = normalize_order(source, data)
-    raw_record = canonical.copy()
-    
-    # Tự động sửa lỗi nếu có thể (Nếu chỉnh sửa được thì thực hiện)
-    canonical, was_fixed = clean_and_fix_errors(canonical)
-    if was_fixed:
-        LOGGER.info("Auto-fixed errors in order %s from source %s", canonical.get("order_id"), source)
-    
-    is_valid, errors = validate_order(canonical)
+    job_id = message.get("job_id")
+    if "rows" in message:
+        rows = message["rows"]
+        if not isinstance(rows, list):
+            raise MalformedMessage("envelope 'rows' must be a list")
+        if message.get("v") == POSITIONAL_ENVELOPE_VERSION:
+            columns = message.get("columns")
+            if not isinstance(columns, list):
+                raise MalformedMessage("positional envelope needs a 'columns' list")
+            rows = [dict(zip(columns, values)) if isinstance(values, list) else values for values in rows]
+    else:
+        rows = [message.get("data", {})]
+    observe_stage("decode", time.perf_counter() - started)
+    return source, None if job_id is None else str(job_id), rows
+
+
+def process_envelope(
+    source: str, job_id: Optional[str], rows: Sequence[object], customers: Optional[Mapping[str, str]] = None
+) -> List[ProcessedOrder]:
+    """Run every row through the pipeline.
+
+    A bad row becomes an ``orders_error`` entry instead of failing the message,
+    so one broken row never causes the whole batch to be redelivered.
+    """
+    timer = StageTimer()
+    orders = process_rows(source, rows, timer, customers)
+    timer.observe()
+    if job_id is not None:
+        for order in orders:
+            order.job_id = job_id
+    return orders
+
+
+def decode_message(
+    body: bytes, customers: Optional[Mapping[str, str]] = None, content_type: Optional[str] = None
+) -> List[ProcessedOrder]:
+    """Decode an envelope into per-row outcomes (``customers``: see ``app.customers``)."""
+    return process_envelope(*decode_envelope(body, content_type), customers)
+
+
+def decode_batch(messages: Sequence[Message], cache: Optional[CustomerCache], fetch: Fetch) -> List[ProcessedOrder]:
+    """Decode several envelopes; their customer ids are resolved together (cache misses: one ``fetch``)."""
+    envelopes = [decode_envelope(body, content_type) for body, content_type in messages]
+    customers = None
+    if cache is not None:
+        ids = set().union(*(customer_ids(source, rows) for source, _, rows in envelopes))
+        customers = resolve(cache, ids, fetch)
+    return [order for envelope in envelopes for order in process_envelope(*envelope, customers)]
+
+
+def changes_by_source(orders: Sequence[ProcessedOrder]) -> Dict[str, Tuple[int, int]]:
+    """(clean, error) row counts per source, for the change notification."""
+    counts: Dict[str, Tuple[int, int]] = {}
+    for order in orders:
+        clean, error = counts.get(order.source, (0, 0))
+        counts[order.source] = (clean + 1, error) if order.is_valid else (clean, error + 1)
+    return counts
+
+
+def rows_by_table(orders: Sequence[ProcessedOrder]) -> Dict[str, List[dict]]:
+    """Column values per table, last row per order_id."""
+    return {
+        "orders": last_per_order_id([order.raw_values() for order in orders]),
+        "orders_clean": last_per_order_id([order.clean_values() for order in orders if order.is_valid]),
+        "orders_error": last_per_order_id([order.error_values() for order in orders if not order.is_valid]),
+    }
+
+
+UPSERTS = {"orders": upsert_orders_many, "orders_clean": upsert_clean_many, "orders_error": upsert_error_many}
+
+
+def write_orders(
+    session,
+    orders: Sequence[ProcessedOrder],
+    recent: Optional[RecentHashes] = None,
+    dedup: Optional[RecentKeys] = None,
+) -> Tuple[Dict[str, List[dict]], List[Tuple[str, str, str]]]:
+    """Write a batch with one multi-row upsert per table (caller owns the transaction).
+
+    Rows whose content hash is unchanged are skipped by ``recent`` (if given)
+    or by the upsert itself; clean rows repeating an order from the other
+    source are flagged through ``dedup`` (app/dedup.py); the rollups
+    (app/rollups.py) are moved by each upsert's net change. Upload job
+    counters and the change notification go into the same transaction, so
+    both move exactly when the batch becomes visible. Returns the rows per
+    table and the new duplicate-match primaries, for ``recent.remember_all``
+    and ``dedup.remember`` once committed.
+    """
+    tables = rows_by_table(orders)
+    primaries: List[Tuple[str, str, str]] = []
+    lock_orders(session, [row["order_id"] for row in tables["orders"]])
+    for table, rows in tables.items():
+        if recent is not None:
+            rows = recent.changed(table, rows)
+        if not rows:
+            continue
+        if table == "orders_clean" and dedup is not None:
+            primaries = flag_duplicates(dedup, rows, lambda keys: fetch_primaries(session, keys, dedup.window / 3600))
+        order_ids = [row["order_id"] for row in rows]
+        retract_from_rollups(session, table, order_ids)
+        count_unchanged(table, len(rows), UPSERTS[table](session, rows))
+        add_to_rollups(session, table, order_ids)
+    record_progress(session, orders)
+    for source, (clean, error) in changes_by_source(orders).items():
+        notify_orders_changed(session, source, clean, error)
+    return tables, primaries
+
+
+def handle_batch(messages: Sequence[Message], settings, SessionLocal) -> None:
+    recent = recent_hashes(settings)
+    dedup = recent_keys(settings)
 
     session = SessionLocal()
     try:
-        upsert_order(session, raw_record)
-        if is_valid:
-            stmt = insert(OrdersClean).values(
-                order_id=canonical["order_id"],
-                source=canonical["source"],
-                order_date=date.fromisoformat(canonical["order_date"]) if canonical["order_date"] else None,
-                customer_id=canonical["customer_id"],
-                customer_name=canonical["customer_name"],
-                total_amount=float(canonical["total_amount"]),
-                status=canonical["status"],
-            )
-            session.execute(
-                stmt.on_conflict_do_update(
-                    index_elements=[OrdersClean.order_id],
-                    set_={
-                        "source": stmt.excluded.source,
-                        "order_date": stmt.excluded.order_date,
-                        "customer_id": stmt.excluded.customer_id,
-                        "customer_name": stmt.excluded.customer_name,
-                        "total_amount": stmt.excluded.total_amount,
-                        "status": stmt.excluded.status,
-                    },
-                )
+        orders = decode_batch(messages, customer_cache(settings), lambda ids: fetch_customers(session, ids))
+        with timed("upsert"):
+            written, primaries = write_orders(session, orders, recent, dedup)
+        with timed("commit"):
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    if recent is not None:
+        recent.remember_all(written)
+    if dedup is not None:
+        dedup.remember(primaries)
+    record_orders(orders)
+    log_outcomes(orders)
+
+
+def log_outcomes(orders: Sequence[ProcessedOrder]) -> None:
+    """One line per stored order, with the order fields as structured ``extra``."""
+    if not ROW_LOGGER.isEnabledFor(logging.WARNING):
+        return
+    for order in orders:
+        extra = {"order_id": order.order_id, "source": order.source, "job_id": order.job_id}
+        if order.was_fixed:
+            ROW_LOGGER.info("Auto-fixed errors in order %s from source %s", order.order_id, order.source, extra=extra)
+        if order.is_valid:
+            ROW_LOGGER.info(
+                "Accepted %s order %s -> stored in orders_clean", order.source, order.order_id, extra=extra
             )
-            LOGGER.info("Accepted %s order %s -> stored in orders_clean", source, canonical["order_id"])
         else:
-            error_reason = "; ".join(errors)
-            stmt = insert(OrdersError).values(
-                order_id=canonical["order_id"],
-                source=canonical["source"],
-                order_date=canonical["order_date"],
-                customer_id=canonical["customer_id"],
-                customer_name=canonical["customer_name"],
-                total_amount=canonical["total_amount"],
-                status=canonical["status"],
-                error_reason=error_reason,
-            )
-            session.execute(
-                stmt.on_conflict_do_update(
-                    index_elements=[OrdersError.order_id],
-                    set_={
-                        "source": stmt.excluded.source,
-                        "order_date": stmt.excluded.order_date,
-                        "customer_id": stmt.excluded.customer_id,
-                        "customer_name": stmt.excluded.customer_name,
-                        "total_amount": stmt.excluded.total_amount,
-                        "status": stmt.excluded.status,
-                        "error_reason": stmt.excluded.error_reason,
-                    },
-                )
+            ROW_LOGGER.warning(
+                "Rejected %s order %s -> %s",
+                order.source,
+                order.order_id,
+                order.error_reason,
+                extra={**extra, "error_reason": order.error_reason},
             )
-            LOGGER.warning("Rejected %s order %s -> %s", source, canonical["order_id"], error_reason)
+
+
+def handle_message(body: bytes, settings, SessionLocal, content_type: Optional[str] = None) -> None:
+    handle_batch([(body, content_type)], settings, SessionLocal)
+
+
+def count_parked(SessionLocal, messages: Sequence[Message]) -> None:
+    """Count the rows of newly parked messages against their upload jobs (best effort: the database may be down)."""
+    parked = parked_rows(messages)
+    if not parked:
+        return
+    session = SessionLocal()
+    try:
+        record_parked(session, parked)
         session.commit()
     except Exception:
         session.rollback()
-        raise
+        LOGGER.warning("Could not count parked rows of jobs %s", ", ".join(sorted(parked)), exc_info=True)
     finally:
         session.close()
 
 
-def main() -> None:
-    settings = get_settings()
-    configure_logging()
+def wait_out_outage(channel, breaker: CircuitBreaker, exc: BaseException, stop: Optional[threading.Event]) -> bool:
+    """Pause (servicing heartbeats) while the breaker is open; False if asked to stop meanwhile."""
+    deadline = time.monotonic() + breaker.record_failure(exc)
+    while time.monotonic() < deadline:
+        if stop is not None and stop.is_set():
+            return False
+        channel.connection.sleep(min(0.5, max(deadline - time.monotonic(), 0.0)))
+    return stop is None or not stop.is_set()
+
+
+def settle_batch(
+    channel,
+    batch: List[Delivery],
+    settings,
+    SessionLocal,
+    breaker: Optional[CircuitBreaker] = None,
+    stop: Optional[threading.Event] = None,
+    queue: Optional[str] = None,
+    pauses_left: Optional[int] = None,
+) -> None:
+    """Process and ack a batch from ``queue``; on failure bisect it to isolate the poison message.
+
+    A single message that still fails on its own goes to its next delay queue
+    (or the parking queue, see ``app.retry``) and is acked; every half that
+    succeeds is acked with one ``multiple=True`` ack. A transient database
+    error holds the batch, unacked, behind the circuit breaker and tries it
+    again, up to ``db_breaker_max_pauses`` times; after that (or if the error
+    was not that transient after all) the batch is bisected like any other
+    failure. If the consumer is stopping meanwhile it is handed back to the broker.
+    """
+    breaker = breaker or CircuitBreaker(settings.db_breaker_base_delay, settings.db_breaker_max_delay)
+    queue = queue or settings.rabbitmq_queue
+    if pauses_left is None:
+        pauses_left = settings.db_breaker_max_pauses
+    while True:
+        try:
+            handle_batch([(body, content_type) for _, body, _, content_type in batch], settings, SessionLocal)
+            break
+        except Exception as exc:
+            if is_transient(exc) and pauses_left > 0:
+                pauses_left -= 1
+                if wait_out_outage(channel, breaker, exc, stop):
+                    continue
+                channel.basic_nack(delivery_tag=batch[-1][0], multiple=True, requeue=True)
+                REQUEUED_MESSAGES.inc(len(batch))
+                return
+            if len(batch) == 1:
+                LOGGER.exception("Failed to handle message")
+                delivery_tag, body, headers, content_type = batch[0]
+                if retry_or_park(channel, settings, queue, body, headers, exc, content_type) == parking_queue(queue):
+                    count_parked(SessionLocal, [(body, content_type)])
+                channel.basic_ack(delivery_tag=delivery_tag)
+                return
+            LOGGER.warning("Batch of %d messages failed, splitting to isolate the bad message", len(batch))
+            middle = len(batch) // 2
+            settle_batch(channel, batch[:middle], settings, SessionLocal, breaker, stop, queue, pauses_left)
+            settle_batch(channel, batch[middle:], settings, SessionLocal, breaker, stop, queue, pauses_left)
+            return
+    breaker.record_success()
+    channel.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+    CONSUMED_MESSAGES.inc(len(batch))
+
+
+def update_queue_depth(channel, queue: str) -> None:
+    try:
+        declared = channel.queue_declare(queue=queue, durable=True, passive=True)
+    except Exception:
+        LOGGER.warning("Could not read the depth of queue %s", queue, exc_info=True)
+        return
+    QUEUE_DEPTH.labels(queue=queue).set(declared.method.message_count)
+
+
+def consume_batches(
+    channel, settings, SessionLocal, stop: Optional[threading.Event] = None, queue: Optional[str] = None
+) -> None:
+    """Consume ``queue`` (default ``rabbitmq_queue``): gather up to ``consumer_batch_size``
+    messages or ``consumer_batch_linger_ms`` and settle them.
+
+    When ``stop`` is set the pending batch is flushed and the consumer is
+    cancelled, which hands any prefetched but unprocessed messages back to
+    the broker (graceful drain).
+    """
+    batch_size = max(1, settings.consumer_batch_size)
+    linger = max(settings.consumer_batch_linger_ms, 1) / 1000.0
+    batch: List[Delivery] = []
+    started = 0.0
+    depth_at = 0.0
+    breaker = CircuitBreaker(settings.db_breaker_base_delay, settings.db_breaker_max_delay)
+    queue = queue or settings.rabbitmq_queue
+
+    try:
+        for method, properties, body in channel.consume(queue, inactivity_timeout=linger):
+            if time.monotonic() >= depth_at:
+                update_queue_depth(channel, queue)
+                depth_at = time.monotonic() + QUEUE_DEPTH_INTERVAL
+            if method is not None:
+                if not batch:
+                    started = time.monotonic()
+                batch.append((method.delivery_tag, body, properties.headers, properties.content_type))
+            if batch and (len(batch) >= batch_size or time.monotonic() - started >= linger):
+                settle_batch(channel, batch, settings, SessionLocal, breaker, stop, queue)
+                batch = []
+            if stop is not None and stop.is_set():
+                break
+    finally:
+        if batch:
+            settle_batch(channel, batch, settings, SessionLocal, breaker, stop, queue)
+        channel.cancel()
+
 
+def prefetch_count(settings, lane: Optional[Lane] = None) -> int:
+    # Default: two batches in flight so the next batch is buffered while one commits.
+    prefetch = lane.prefetch if lane is not None else settings.consumer_prefetch
+    return prefetch or max(10, 2 * settings.consumer_batch_size)
+
+
+def run_consumer(settings, stop: Optional[threading.Event] = None, lane: Optional[Lane] = None) -> None:
+    """Consume one lane until ``stop`` is set, with a dedicated engine and AMQP connection."""
+    lane = lane or select_lanes(settings)[0]
     engine = get_engine(settings)
-    create_tables(engine)
     SessionLocal = get_session_factory(engine)
+    watch_engine_pool("consumer", engine)
+
+    connection = pika.BlockingConnection(connection_parameters(settings))
+    try:
+        channel = connection.channel()
+        declare_lanes(channel, settings)
+        declare_retry_topology(channel, settings, lane.queue)
+        channel.basic_qos(prefetch_count=prefetch_count(settings, lane))
+        LOGGER.info(
+            "Consumer for lane %s started (queue %s, batch size %d, linger %d ms, prefetch %d). "
+            "Waiting for messages...",
+            lane.name,
+            lane.queue,
+            settings.consumer_batch_size,
+            settings.consumer_batch_linger_ms,
+            prefetch_count(settings, lane),
+        )
+        consume_batches(channel, settings, SessionLocal, stop, lane.queue)
+        LOGGER.info("Consumer for lane %s stopped.", lane.name)
+    finally:
+        if connection.is_open:
+            connection.close()
+        engine.dispose()
+
+
+def _stop_on_signals(stop: threading.Event) -> None:
+    def request_stop(signum, _frame) -> None:
+        LOGGER.info("Received %s, draining consumer", signal.Signals(signum).name)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
 
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=settings.rabbitmq_host,
-            port=settings.rabbitmq_port,
-            credentials=pika.PlainCredentials(settings.rabbitmq_user, settings.rabbitmq_password),
+def run_engine(
+    engine: str, settings, metrics_port: Optional[int] = None, lane_names: Optional[Sequence[str]] = None
+) -> None:
+    """Consume the given lanes in this process (blocking engine: one thread and connection per lane)."""
+    serve_metrics(settings.consumer_metrics_port if metrics_port is None else metrics_port)
+    lanes = select_lanes(settings, lane_names)
+    if engine == "async":
+        from .consumer_async import run_async_consumer
+
+        run_async_consumer(settings, lanes)
+        return
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    if len(lanes) == 1:
+        run_consumer(settings, stop, lanes[0])
+        return
+    threads = [
+        threading.Thread(target=run_consumer, args=(settings, stop, lane), name=f"lane-{lane.name}") for lane in lanes
+    ]
+    for thread in threads:
+        thread.start()
+    # Join with a timeout so the main thread still takes SIGTERM; one lane dying stops them all.
+    while all(thread.is_alive() for thread in threads):
+        threads[0].join(0.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+def _worker_main(log_queue, engine: str, metrics_port: int, lane_name: str) -> None:
+    configure_worker_logging(log_queue)
+    try:
+        run_engine(engine, get_settings(), metrics_port, [lane_name])
+    except Exception:
+        LOGGER.exception("Worker crashed")
+        sys.exit(1)
+
+
+def supervise(assignments: Sequence[Lane], settings, engine: str = "blocking") -> None:
+    """Run one consumer process per entry of ``assignments`` (a lane may appear several times),
+    restart crashed ones, drain all on SIGTERM.
+
+    Worker ``i`` serves its metrics on ``consumer_metrics_port + i``.
+    """
+    workers = len(assignments)
+    context = multiprocessing.get_context("spawn")
+    log_queue = context.Queue()
+    start_listener(build_handlers(fmt=WORKER_LOG_FORMAT, json_format=settings.log_format == "json"), log_queue)
+    configure_worker_logging(log_queue, settings)
+
+    stop = threading.Event()
+    _stop_on_signals(stop)
+
+    started_at = [0.0] * workers
+    restarts = [0] * workers
+    restart_at = [0.0] * workers
+
+    def spawn(index: int):
+        port = settings.consumer_metrics_port + index if settings.consumer_metrics_port else 0
+        lane = assignments[index]
+        process = context.Process(
+            target=_worker_main, args=(log_queue, engine, port, lane.name), name=f"consumer-{lane.name}-{index}"
         )
+        process.start()
+        started_at[index] = time.monotonic()
+        LOGGER.info("Started worker %s (pid %s)", process.name, process.pid)
+        return process
+
+    processes = [spawn(index) for index in range(workers)]
+    try:
+        while not stop.wait(1.0):
+            now = time.monotonic()
+            for index, process in enumerate(processes):
+                if process.is_alive():
+                    continue
+                if restart_at[index] == 0.0:
+                    # A worker that ran for a while before dying starts its backoff over.
+                    restarts[index] = 1 if now - started_at[index] > 60.0 else restarts[index] + 1
+                    delay = min(settings.consumer_restart_backoff * 2 ** (restarts[index] - 1), 60.0)
+                    restart_at[index] = now + delay
+                    LOGGER.error(
+                        "Worker %s exited with code %s, restarting in %.1fs", process.name, process.exitcode, delay
+                    )
+                elif now >= restart_at[index]:
+                    restart_at[index] = 0.0
+                    processes[index] = spawn(index)
+    finally:
+        LOGGER.info("Stopping %d workers", len(processes))
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + settings.consumer_drain_timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                LOGGER.warning("Worker %s did not drain in time, killing it", process.name)
+                process.kill()
+                process.join()
+        shutdown_logging()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Consume orders from RabbitMQ into Postgres.")
+    parser.add_argument("--workers", type=int, default=None, help="consumer processes per lane")
+    parser.add_argument("--engine", choices=["blocking", "async"], default=None, help="consumer engine")
+    parser.add_argument(
+        "--lanes", default=None, help="comma separated lanes to consume (default: CONSUMER_LANES or all)"
     )
-    channel = connection.channel()
-    channel.queue_declare(queue=settings.rabbitmq_queue, durable=True)
+    args = parser.parse_args(argv)
 
-    def callback(ch, method, properties, body):
-        try:
-            handle_message(body, settings, SessionLocal)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception:
-            LOGGER.exception("Failed to handle message, requeueing")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-
-    channel.basic_qos(prefetch_count=10)
-    channel.basic_consume(queue=settings.rabbitmq_queue, on_message_callback=callback)
-    LOGGER.info("Consumer started. Waiting for messages...")
+    settings = get_settings()
+    engine_name = args.engine or settings.consumer_engine
+    lane_names = [name.strip() for name in args.lanes.split(",") if name.strip()] if args.lanes else None
+    lanes = select_lanes(settings, lane_names)
+    assignments = [lane for lane in lanes for _ in range(args.workers or lane.workers)]
+
+    engine = get_engine(settings)
     try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
-        LOGGER.info("Consumer stopped.")
-        channel.stop_consuming()
+        create_tables(engine)
     finally:
-        connection.close()
         engine.dispose()
 
+    if len(assignments) > len(lanes):
+        supervise(assignments, settings, engine_name)
+        return
+
+    configure_logging(settings=settings)
+    run_engine(engine_name, settings, lane_names=[lane.name for lane in lanes])
+
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,99 @@
+"""Change detection: skip rewriting rows whose content did not change.
+
+Every row stored in ``orders``, ``orders_clean`` and ``orders_error`` carries
+``content_hash``, an MD5 of its canonical text values (``HASHED_COLUMNS``, plus
+``error_reason`` for errors). The upserts only update a conflicting row when
+the hash differs (``ON CONFLICT ... DO UPDATE ... WHERE content_hash IS
+DISTINCT FROM EXCLUDED.content_hash``), so replaying an upload writes no new
+tuples and no WAL for unchanged rows. ``job_id`` is not hashed: an unchanged
+row re-sent by a later upload keeps the job that first stored it.
+
+``RecentHashes`` is an optional per-process LRU of the last hash committed per
+``(table, order_id)`` (``CONSUMER_SEEN_CACHE_SIZE``); rows it recognises are
+dropped before the statement is even sent. It is exact (no false positives),
+but only knows what this process wrote: another worker changing the same
+order in between is not seen, so keep it off when several workers may write
+different versions of one order concurrently.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from .metrics import UNCHANGED_ROWS
+
+HASHED_COLUMNS = ("source", "order_date", "customer_id", "customer_name", "total_amount", "status")
+ERROR_HASHED_COLUMNS = HASHED_COLUMNS + ("error_reason",)
+
+SEPARATOR = "\x1f"
+
+
+def digest(text: str) -> str:
+    return hashlib.md5(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def content_hash(record: Mapping[str, object], columns: Sequence[str] = HASHED_COLUMNS) -> str:
+    """Hash of the canonical (text) values of ``columns``; missing and None count as ''."""
+    return digest(SEPARATOR.join("" if record.get(column) is None else str(record[column]) for column in columns))
+
+
+def count_unchanged(table: str, submitted: int, written: int, check: str = "database") -> None:
+    """Count rows an upsert (``check="database"``) or the LRU (``"cache"``) left alone."""
+    if submitted > written:
+        UNCHANGED_ROWS.labels(table=table, check=check).inc(submitted - written)
+
+
+class RecentHashes:
+    """Thread-safe LRU of the content hash last committed per ``(table, order_id)``."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._lock = threading.Lock()
+        self._hashes: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def changed(self, table: str, records: Sequence[dict]) -> List[dict]:
+        """``records`` minus those whose hash matches the one last committed (counted as skipped)."""
+        with self._lock:
+            hashes = self._hashes
+            kept = [
+                record
+                for record in records
+                if hashes.get((table, record["order_id"])) != record["content_hash"]
+            ]
+        count_unchanged(table, len(records), len(kept), check="cache")
+        return kept
+
+    def remember(self, table: str, records: Iterable[dict]) -> None:
+        """Record hashes once their transaction has committed."""
+        with self._lock:
+            hashes = self._hashes
+            for record in records:
+                key = (table, record["order_id"])
+                hashes[key] = record["content_hash"]
+                hashes.move_to_end(key)
+            while len(hashes) > self.size:
+                hashes.popitem(last=False)
+
+    def remember_all(self, written: Dict[str, List[dict]]) -> None:
+        for table, records in written.items():
+            self.remember(table, records)
+
+
+_recent: Optional[RecentHashes] = None
+_recent_lock = threading.Lock()
+
+
+def recent_hashes(settings) -> Optional[RecentHashes]:
+    """The process-wide LRU, or None when ``consumer_seen_cache_size`` is 0."""
+    global _recent
+    if settings.consumer_seen_cache_size <= 0:
+        return None
+    with _recent_lock:
+        if _recent is None:
+            _recent = RecentHashes(settings.consumer_seen_cache_size)
+        return _recent
@@ -0,0 +1,241 @@
+"""Customer enrichment: resolve ``customer_id`` against the ``customers`` table.
+
+The enrich stage (``transform.enrich_customer``, between clean and validate)
+replaces ``customer_name`` with the reference name of a known customer id.
+Lookups never happen per row: a consumer collects the customer ids of a whole
+message batch (a bulk load those of a chunk), serves what it can from a
+per-process ``CustomerCache`` and reads the misses with one
+``customer_id = ANY(...)`` query. Unknown ids are cached too, so an id that is
+not in the table costs one query per TTL, not one per batch.
+
+Entries expire after ``CUSTOMER_CACHE_TTL`` seconds and the cache holds at
+most ``CUSTOMER_CACHE_SIZE`` ids (least recently used go first). Writers of
+the table send ``NOTIFY customers_changed`` (``upsert_customers`` does; a
+payload ``{"customer_ids": [...]}`` drops those ids, any other payload drops
+everything), and every process with a cache ``LISTEN``s for it.
+
+Reference names are stored through ``clean_customer_name``, so an enriched
+order validates exactly like a cleaned one. Load or update customers with::
+
+    python -m app.customers load customers.csv
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import get_settings
+from .db import Customer, create_tables, get_engine
+from .logging_conf import configure_logging
+from .metrics import CUSTOMER_LOOKUPS, timed
+from .notify import ChangeListener
+from .mappings import RowMapper
+from .transform import clean_customer_name
+
+LOGGER = logging.getLogger("customers")
+
+CUSTOMERS_CHANNEL = "customers_changed"
+# Postgres caps a NOTIFY payload at 8000 bytes; larger changes invalidate everything.
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Cache misses of a batch, for the raw drivers.
+FETCH_CUSTOMERS_SQL = "SELECT customer_id, customer_name FROM customers WHERE customer_id = ANY(%s)"
+FETCH_CUSTOMERS_ASYNC = "SELECT customer_id, customer_name FROM customers WHERE customer_id = ANY($1::text[])"
+
+Fetch = Callable[[List[str]], Iterable[Tuple[str, str]]]
+
+
+def reference_name(name: str) -> str:
+    return clean_customer_name(name) or name.strip()
+
+
+class CustomerCache:
+    """Thread-safe LRU of customer_id -> reference name (None = not in the table), with a TTL."""
+
+    def __init__(self, size: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        # Bumped by every invalidation; a lookup that raced one does not store its (possibly stale) result.
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cached(self, customer_ids: Iterable[str]) -> Tuple[Dict[str, str], List[str], int]:
+        """Names of the cached known ids, the ids to read from the table, and the current generation."""
+        found: Dict[str, str] = {}
+        missing: List[str] = []
+        now = self._clock()
+        with self._lock:
+            entries = self._entries
+            for customer_id in customer_ids:
+                entry = entries.get(customer_id)
+                if entry is None or entry[1] <= now:
+                    missing.append(customer_id)
+                    continue
+                entries.move_to_end(customer_id)
+                if entry[0] is not None:
+                    found[customer_id] = entry[0]
+            generation = self.generation
+        CUSTOMER_LOOKUPS.labels(result="hit").inc(len(found))
+        CUSTOMER_LOOKUPS.labels(result="miss").inc(len(missing))
+        return found, missing, generation
+
+    def store(self, customer_ids: Sequence[str], names: Mapping[str, str], generation: int) -> None:
+        """Remember what the table said about ``customer_ids`` (ids absent from ``names`` are unknown)."""
+        expires_at = self._clock() + self.ttl
+        with self._lock:
+            if generation != self.generation:
+                return
+            entries = self._entries
+            for customer_id in customer_ids:
+                entries[customer_id] = (names.get(customer_id), expires_at)
+                entries.move_to_end(customer_id)
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+
+    def invalidate(self, payloads: Optional[List[Dict[str, object]]] = None) -> None:
+        """Drop the ids named in ``customers_changed`` payloads; anything else (or None) drops everything."""
+        with self._lock:
+            self.generation += 1
+            if payloads is None or any(not isinstance(p.get("customer_ids"), list) for p in payloads):
+                self._entries.clear()
+                return
+            for payload in payloads:
+                for customer_id in payload["customer_ids"]:
+                    self._entries.pop(str(customer_id), None)
+
+
+def customer_ids(source: str, rows: Iterable[object]) -> Set[str]:
+    """The customer ids of raw message rows, as the enrich stage will look them up."""
+    ids = set()
+    mapper = RowMapper(source)
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        customer_id = mapper(row)["customer_id"]
+        if isinstance(customer_id, str) and customer_id.strip():
+            ids.add(customer_id.strip())
+    return ids
+
+
+def resolve(cache: CustomerCache, ids: Iterable[str], fetch: Fetch) -> Dict[str, str]:
+    """customer_id -> reference name for the known ``ids``, reading only the cache misses (one query)."""
+    found, missing, generation = cache.cached(ids)
+    if missing:
+        with timed("customers"):
+            names = {customer_id: reference_name(name) for customer_id, name in fetch(missing)}
+        cache.store(missing, names, generation)
+        found.update(names)
+    return found
+
+
+async def resolve_async(cache: CustomerCache, ids: Iterable[str], connection) -> Dict[str, str]:
+    """``resolve`` for an asyncpg connection."""
+    found, missing, generation = cache.cached(ids)
+    if missing:
+        with timed("customers"):
+            rows = await connection.fetch(FETCH_CUSTOMERS_ASYNC, missing)
+        names = {row["customer_id"]: reference_name(row["customer_name"]) for row in rows}
+        cache.store(missing, names, generation)
+        found.update(names)
+    return found
+
+
+def fetch_customers(session, ids: Sequence[str]) -> List[Tuple[str, str]]:
+    stmt = select(Customer.customer_id, Customer.customer_name).where(Customer.customer_id.in_(ids))
+    return [tuple(row) for row in session.execute(stmt)]
+
+
+_cache: Optional[CustomerCache] = None
+_cache_lock = threading.Lock()
+
+
+def customer_cache(settings) -> Optional[CustomerCache]:
+    """The process-wide cache (listening for ``customers_changed``), or None when enrichment is off."""
+    global _cache
+    if not settings.customer_enrichment or settings.customer_cache_size <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = CustomerCache(settings.customer_cache_size, settings.customer_cache_ttl)
+            listener = ChangeListener(settings, channel=CUSTOMERS_CHANNEL)
+            listener.add_handler(_cache.invalidate)
+            listener.start()
+        return _cache
+
+
+def change_payloads(customer_ids: Sequence[str]) -> List[str]:
+    """``customers_changed`` payloads naming ``customer_ids``, each under the NOTIFY size limit."""
+    payloads: List[str] = []
+    batch: List[str] = []
+    for customer_id in customer_ids:
+        if batch and len(json.dumps({"customer_ids": batch + [customer_id]})) > MAX_NOTIFY_PAYLOAD:
+            payloads.append(json.dumps({"customer_ids": batch}))
+            batch = []
+        batch.append(customer_id)
+    if batch:
+        payloads.append(json.dumps({"customer_ids": batch}))
+    return payloads
+
+
+def upsert_customers(engine, rows: Iterable[Mapping[str, str]], chunk_size: int = 1000) -> int:
+    """Insert or rename customers; changed ids are announced on ``customers_changed`` at commit."""
+    latest: Dict[str, str] = {}
+    for row in rows:
+        customer_id = (row.get("customer_id") or "").strip()
+        name = (row.get("customer_name") or "").strip()
+        if customer_id and name:
+            latest[customer_id] = reference_name(name)
+    records = [{"customer_id": key, "customer_name": name} for key, name in latest.items()]
+
+    changed: List[str] = []
+    with engine.begin() as connection:
+        for start in range(0, len(records), chunk_size):
+            stmt = insert(Customer).values(records[start:start + chunk_size])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Customer.customer_id],
+                set_={"customer_name": stmt.excluded.customer_name, "updated_at": text("LOCALTIMESTAMP")},
+                where=Customer.customer_name.is_distinct_from(stmt.excluded.customer_name),
+            ).returning(Customer.customer_id)
+            changed.extend(connection.execute(stmt).scalars())
+        for payload in change_payloads(changed):
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"), {"channel": CUSTOMERS_CHANNEL, "payload": payload}
+            )
+    return len(changed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the customers reference table.")
+    parser.add_argument("command", choices=["load"])
+    parser.add_argument("path", type=Path, help="CSV with customer_id and customer_name columns")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    configure_logging(settings=settings)
+    engine = get_engine(settings)
+    try:
+        create_tables(engine)
+        with args.path.open(encoding="utf-8", newline="") as handle:
+            changed = upsert_customers(engine, csv.DictReader(handle))
+        LOGGER.info("Loaded %s: %d customers added or renamed", args.path, changed)
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+from typing import Dict, Iterable, List, Sequence
+
 from sqlalchemy import (
+    BigInteger,
     Column,
     Date,
     DateTime,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
     create_engine,
+    inspect,
     text,
 )
 from sqlalchemy.dialects.postgresql import insert
@@ -31,8 +36,23 @@ class OrdersClean(Base):
     customer_name = Column(String(100), nullable=False)
     total_amount = Column(Numeric(10, 2), nullable=False)
     status = Column(String(50))
+    job_id = Column(String(36))
+    # See app/content_hash.py: conflicting upserts only rewrite the row when this differs.
+    content_hash = Column(String(32))
+    # See app/dedup.py: customer/date/amount key, and the order from another source this one repeats.
+    match_key = Column(String(32))
+    duplicate_of = Column(String(50))
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
 
+    # Filtered keyset pages: WHERE <filter> AND id < :cursor ORDER BY id DESC.
+    __table_args__ = (
+        Index("ix_orders_clean_source_id", "source", "id"),
+        Index("ix_orders_clean_status_id", "status", "id"),
+        Index("ix_orders_clean_order_date_id", "order_date", "id"),
+        Index("ix_orders_clean_job_id_id", "job_id", "id"),
+        Index("ix_orders_clean_match_key", "match_key"),
+    )
+
 
 class OrdersError(Base):
     __tablename__ = "orders_error"
@@ -46,8 +66,17 @@ class OrdersError(Base):
     total_amount = Column(Text)
     status = Column(Text)
     error_reason = Column(Text)
+    job_id = Column(String(36))
+    content_hash = Column(String(32))
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
 
+    __table_args__ = (
+        Index("ix_orders_error_source_id", "source", "id"),
+        Index("ix_orders_error_status_id", "status", "id"),
+        Index("ix_orders_error_order_date_id", "order_date", "id"),
+        Index("ix_orders_error_job_id_id", "job_id", "id"),
+    )
+
 
 class Orders(Base):
     __tablename__ = "orders"
@@ -60,9 +89,81 @@ class Orders(Base):
     customer_name = Column(Text)
     total_amount = Column(Text)
     status = Column(Text)
+    job_id = Column(String(36))
+    content_hash = Column(String(32))
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
 
 
+class Customer(Base):
+    """Customers dimension: the reference name of each ``customer_id`` (see app/customers.py)."""
+
+    __tablename__ = "customers"
+
+    customer_id = Column(String(50), primary_key=True)
+    customer_name = Column(String(100), nullable=False)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+
+
+class OrdersDailyStats(Base):
+    """``orders_clean`` rolled up per day, source and status; kept current by app/rollups.py."""
+
+    __tablename__ = "orders_daily_stats"
+
+    order_date = Column(Date, primary_key=True)
+    # '' stands for a NULL source/status (primary key columns cannot be NULL).
+    source = Column(String(20), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    order_count = Column(BigInteger, nullable=False, server_default=text("0"))
+    total_amount = Column(Numeric(16, 2), nullable=False, server_default=text("0"))
+
+
+class OrdersErrorStats(Base):
+    """``orders_error`` counted per source and error_reason; kept current by app/rollups.py."""
+
+    __tablename__ = "orders_error_stats"
+
+    source = Column(String(20), primary_key=True)
+    error_reason = Column(Text, primary_key=True)
+    error_count = Column(BigInteger, nullable=False, server_default=text("0"))
+
+
+class UploadJob(Base):
+    """One upload: how many rows were published (its progress lives in ``upload_job_progress``)."""
+
+    __tablename__ = "upload_jobs"
+
+    id = Column(String(36), primary_key=True)
+    source = Column(String(20), nullable=False)
+    mode = Column(String(10), nullable=False)
+    # publishing -> published (all rows handed to RabbitMQ / bulk loaded) or failed.
+    status = Column(String(20), nullable=False, server_default=text("'publishing'"))
+    published = Column(Integer, nullable=False, server_default=text("0"))
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+    published_at = Column(DateTime)
+
+
+class UploadJobProgress(Base):
+    """Counter increments of an upload job, one row per batch (see app/jobs.py).
+
+    Append-only, so concurrent batches of one upload never queue on a shared
+    ``upload_jobs`` row lock; ``GET /jobs/{id}`` adds them up.
+    """
+
+    __tablename__ = "upload_job_progress"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(36), nullable=False)
+    processed = Column(Integer, nullable=False, server_default=text("0"))
+    clean = Column(Integer, nullable=False, server_default=text("0"))
+    error = Column(Integer, nullable=False, server_default=text("0"))
+    fixed = Column(Integer, nullable=False, server_default=text("0"))
+    # Rows of the job's messages moved to a parking queue (negative when replayed).
+    parked = Column(Integer, nullable=False, server_default=text("0"))
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+
+    __table_args__ = (Index("ix_upload_job_progress_job_id", "job_id"),)
+
+
 def get_engine(settings_override=None):
     s = settings_override or settings
     url = (
@@ -77,46 +178,135 @@ def get_session_factory(engine=None):
     return sessionmaker(bind=engine, expire_on_commit=False)
 
 
+def partitioned() -> bool:
+    """Whether the orders tables use the partitioned layout (``ORDERS_PARTITIONED``, see app/partitions.py)."""
+    return settings.orders_partitioned
+
+
 def create_tables(engine=None) -> None:
     engine = engine or get_engine()
+    from .rollups import ROLLUP_TABLES, rebuild
+
+    new_rollups = [name for name in ROLLUP_TABLES if not inspect(engine).has_table(name)]
+    if partitioned() and engine.dialect.name == "postgresql":
+        from .partitions import create_partitioned_tables
+
+        create_partitioned_tables(engine, settings.partition_months_ahead)
     Base.metadata.create_all(engine)
+    add_missing_columns(engine)
+    # create_all only adds indexes together with a new table; add ones declared
+    # later to tables that already exist.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    if new_rollups:
+        # First start with the rollups: fill them from the rows already stored.
+        rebuild(engine)
+
+
+def add_missing_columns(engine) -> None:
+    """``ALTER TABLE ... ADD COLUMN`` for nullable columns declared after a table was created."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+# job_id is overwritten too when a re-sent order changed: it then belongs to the later upload.
+# Unchanged orders (same content_hash) are not updated at all.
+ORDER_UPDATE_COLUMNS = (
+    "source", "order_date", "customer_id", "customer_name", "total_amount", "status", "job_id", "content_hash"
+)
+CLEAN_UPDATE_COLUMNS = ORDER_UPDATE_COLUMNS + ("match_key", "duplicate_of")
+ERROR_UPDATE_COLUMNS = ORDER_UPDATE_COLUMNS + ("error_reason",)
+
+
+def last_per_order_id(records: Sequence[dict]) -> List[dict]:
+    """Keep the last record per order_id.
+
+    Postgres rejects a multi-row ``ON CONFLICT DO UPDATE`` that touches the same
+    row twice, so duplicates inside one batch are collapsed the same way
+    sequential upserts would resolve them: last write wins.
+    """
+    latest: Dict[str, dict] = {}
+    for record in records:
+        latest.pop(record["order_id"], None)
+        latest[record["order_id"]] = record
+    return list(latest.values())
+
+
+def upsert_statement(model, rows: Sequence[dict], update_columns: Iterable[str]):
+    """Multi-row upsert that leaves a conflicting row alone when its ``content_hash`` is unchanged."""
+    stmt = insert(model).values(rows)
+    update_set = {column: stmt.excluded[column] for column in update_columns}
+    return stmt.on_conflict_do_update(
+        index_elements=[model.order_id],
+        set_=update_set,
+        where=model.content_hash.is_distinct_from(stmt.excluded.content_hash),
+    )
+
+
+def _upsert_many(session, model, records: Sequence[dict], update_columns: Iterable[str]) -> int:
+    rows = last_per_order_id(records)
+    if not rows:
+        return 0
+    if partitioned():
+        return _replace_changed(session, model.__tablename__, rows)
+    return session.execute(upsert_statement(model, rows, update_columns)).rowcount
+
+
+def _replace_changed(session, table: str, rows: Sequence[dict]) -> int:
+    from .partitions import casts_for, text_columns, unnest_sql, upsert_sql
+
+    columns = list(rows[0])
+    incoming = unnest_sql(columns, [f":{column}" for column in columns], casts_for(table, columns))
+    values = dict(zip(columns, text_columns(rows, columns)))
+    return session.execute(text(upsert_sql(table, columns, incoming)), values).rowcount
+
+
+def lock_orders(session, order_ids: Sequence[str]) -> None:
+    """Serialize writers of the same orders, so each sees the rows the other committed.
+
+    The partitioned layout needs it in place of ``ON CONFLICT``; the rollups
+    (app/rollups.py) need it to read an order's previous row reliably.
+    """
+    if not order_ids:
+        return
+    from .partitions import lock_sql
+
+    session.execute(text(lock_sql("SELECT unnest(CAST(:ids AS text[])) AS order_id")), {"ids": list(order_ids)})
 
 
 def upsert_clean(session, record: dict) -> None:
-    stmt = insert(OrdersClean).values(**record)
-    update_set = {
-        "source": stmt.excluded.source,
-        "order_date": stmt.excluded.order_date,
-        "customer_id": stmt.excluded.customer_id,
-        "customer_name": stmt.excluded.customer_name,
-        "total_amount": stmt.excluded.total_amount,
-        "status": stmt.excluded.status,
-    }
-    session.execute(stmt.on_conflict_do_update(index_elements=[OrdersClean.order_id], set_=update_set))
+    upsert_clean_many(session, [record])
 
 
 def upsert_error(session, record: dict) -> None:
-    stmt = insert(OrdersError).values(**record)
-    update_set = {
-        "source": stmt.excluded.source,
-        "order_date": stmt.excluded.order_date,
-        "customer_id": stmt.excluded.customer_id,
-        "customer_name": stmt.excluded.customer_name,
-        "total_amount": stmt.excluded.total_amount,
-        "status": stmt.excluded.status,
-        "error_reason": stmt.excluded.error_reason,
-    }
-    session.execute(stmt.on_conflict_do_update(index_elements=[OrdersError.order_id], set_=update_set))
+    upsert_error_many(session, [record])
 
 
 def upsert_order(session, record: dict) -> None:
-    stmt = insert(Orders).values(**record)
-    update_set = {
-        "source": stmt.excluded.source,
-        "order_date": stmt.excluded.order_date,
-        "customer_id": stmt.excluded.customer_id,
-        "customer_name": stmt.excluded.customer_name,
-        "total_amount": stmt.excluded.total_amount,
-        "status": stmt.excluded.status,
-    }
-    session.execute(stmt.on_conflict_do_update(index_elements=[Orders.order_id], set_=update_set))
+    upsert_orders_many(session, [record])
+
+
+def upsert_clean_many(session, records: Sequence[dict]) -> int:
+    """Upsert many ``orders_clean`` rows with a single multi-row statement.
+
+    Returns the number of rows inserted or changed (unchanged ones are skipped).
+    """
+    return _upsert_many(session, OrdersClean, records, CLEAN_UPDATE_COLUMNS)
+
+
+def upsert_error_many(session, records: Sequence[dict]) -> int:
+    """Upsert many ``orders_error`` rows with a single multi-row statement."""
+    return _upsert_many(session, OrdersError, records, ERROR_UPDATE_COLUMNS)
+
+
+def upsert_orders_many(session, records: Sequence[dict]) -> int:
+    """Upsert many raw ``orders`` rows with a single multi-row statement."""
+    return _upsert_many(session, Orders, records, ORDER_UPDATE_COLUMNS)
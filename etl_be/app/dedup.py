@@ -0,0 +1,193 @@
+"""Cross-source duplicate detection for clean orders.
+
+The same purchase often arrives from both feeds under different order ids
+(``ON-...`` online, ``OF-...`` offline). Every ``orders_clean`` row carries
+``match_key``, an MD5 of the normalized customer id, customer name (through
+``clean_customer_name``), order date and amount; rows lacking a customer id
+and name, a date or an amount get no key. A clean order whose key matches an
+order from *another* source stored within ``DEDUP_WINDOW_HOURS`` is flagged
+with ``duplicate_of = <that order_id>``; the first order stays the primary.
+Flagged rows are kept (and listed by ``GET /orders/clean``) but left out of
+the rollups behind ``GET /stats``.
+
+Matching is a hash lookup per row: each process keeps ``RecentKeys`` (key ->
+primary order, bounded by the window and ``DEDUP_CACHE_SIZE``), and the keys
+it does not know are read for the whole batch with one query on
+``ix_orders_clean_match_key``. An advisory lock per missing key, taken after
+the per-order locks, makes a concurrent writer of the matching order wait,
+so two halves of a pair committed at the same time are still matched.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from .content_hash import SEPARATOR, digest
+from .metrics import DUPLICATE_ROWS, timed
+from .transform import clean_customer_name
+
+# match_key -> (order_id, source) of the primary order.
+Primary = Tuple[str, str]
+Fetch = Callable[[List[str]], Iterable[Tuple[str, str, str]]]
+
+# First key of the two-int advisory locks on match keys ("DDUP"); order locks use another one.
+LOCK_NAMESPACE = 0x44445550
+
+PRIMARIES_QUERY = (
+    "SELECT DISTINCT ON (match_key) match_key, order_id, source FROM orders_clean "
+    "WHERE match_key = ANY({keys}) AND duplicate_of IS NULL "
+    "AND created_at >= LOCALTIMESTAMP - {hours} * INTERVAL '1 hour' "
+    "ORDER BY match_key, id"
+)
+
+
+def lock_keys_sql(keys: str) -> str:
+    return (
+        f"SELECT count(pg_advisory_xact_lock({LOCK_NAMESPACE}, hashtext(key))) "
+        f"FROM (SELECT DISTINCT unnest({keys}) AS key ORDER BY key) AS locked"
+    )
+
+
+# Session (named), asyncpg ($n) and psycopg2 (%s) flavours.
+LOCK_KEYS = lock_keys_sql("CAST(:keys AS text[])")
+FETCH_PRIMARIES = PRIMARIES_QUERY.format(keys="CAST(:keys AS text[])", hours=":hours")
+LOCK_KEYS_ASYNC = lock_keys_sql("$1::text[]")
+FETCH_PRIMARIES_ASYNC = PRIMARIES_QUERY.format(keys="$1::text[]", hours="$2::float8")
+LOCK_KEYS_SQL = lock_keys_sql("%(keys)s::text[]")
+FETCH_PRIMARIES_SQL = PRIMARIES_QUERY.format(keys="%(keys)s::text[]", hours="%(hours)s")
+
+
+def match_key(record: Mapping[str, object]) -> Optional[str]:
+    """Key of a clean record (canonical text values), or None when it cannot identify a purchase."""
+    customer_id = str(record.get("customer_id") or "").strip().upper()
+    name = (clean_customer_name(str(record.get("customer_name") or "")) or "").casefold()
+    order_date = str(record.get("order_date") or "")
+    try:
+        amount = f"{Decimal(str(record.get('total_amount'))):.2f}"
+    except InvalidOperation:
+        return None
+    if not (customer_id or name) or not order_date:
+        return None
+    return digest(SEPARATOR.join((customer_id, name, order_date, amount)))
+
+
+class RecentKeys:
+    """Thread-safe match key -> primary order index, forgetting keys after ``window`` seconds."""
+
+    def __init__(self, window: float, size: int, clock: Callable[[], float] = time.time) -> None:
+        self.window = window
+        self.size = size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now: float) -> None:
+        entries = self._entries
+        while entries and (len(entries) > self.size or next(iter(entries.values()))[2] <= now - self.window):
+            entries.popitem(last=False)
+
+    def primaries(self, keys: Iterable[str]) -> Tuple[Dict[str, Primary], List[str]]:
+        """Known primaries of ``keys`` and the keys to look up in the table."""
+        found: Dict[str, Primary] = {}
+        missing: List[str] = []
+        with self._lock:
+            self._expire(self._clock())
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(key)
+                else:
+                    found[key] = entry[:2]
+        return found, missing
+
+    def remember(self, primaries: Iterable[Tuple[str, str, str]]) -> None:
+        """Record committed ``(match_key, order_id, source)`` primaries; a known key keeps its first one."""
+        now = self._clock()
+        with self._lock:
+            for key, order_id, source in primaries:
+                if key not in self._entries:
+                    self._entries[key] = (order_id, source, now)
+            self._expire(now)
+
+
+def flag_duplicates(index: RecentKeys, rows: Sequence[dict], fetch: Fetch) -> List[Tuple[str, str, str]]:
+    """Set ``duplicate_of`` on the rows repeating an order from another source.
+
+    ``fetch`` locks and reads the primaries of the keys the index does not
+    know (one round trip per batch). Rows of the batch are matched against
+    each other too, in order. Returns the rows that became the primary of a
+    new key, for ``index.remember`` once the batch has committed.
+    """
+    primaries, missing = index.primaries({row["match_key"] for row in rows if row.get("match_key")})
+    fetched: List[Tuple[str, str, str]] = []
+    if missing:
+        with timed("dedup"):
+            fetched = [tuple(row) for row in fetch(missing)]
+    return _flag(index, rows, primaries, fetched)
+
+
+async def flag_duplicates_async(index: RecentKeys, rows: Sequence[dict], connection) -> List[Tuple[str, str, str]]:
+    """``flag_duplicates`` for an asyncpg connection."""
+    primaries, missing = index.primaries({row["match_key"] for row in rows if row.get("match_key")})
+    fetched: List[Tuple[str, str, str]] = []
+    if missing:
+        with timed("dedup"):
+            await connection.execute(LOCK_KEYS_ASYNC, missing)
+            found = await connection.fetch(FETCH_PRIMARIES_ASYNC, missing, index.window / 3600)
+            fetched = [tuple(row) for row in found]
+    return _flag(index, rows, primaries, fetched)
+
+
+def _flag(
+    index: RecentKeys, rows: Sequence[dict], primaries: Dict[str, Primary], fetched: List[Tuple[str, str, str]]
+) -> List[Tuple[str, str, str]]:
+    # Fetched primaries are committed already; the batch's own wait for its commit.
+    index.remember(fetched)
+    for key, order_id, source in fetched:
+        primaries.setdefault(key, (order_id, source))
+
+    flagged: Counter = Counter()
+    new_primaries = []
+    for row in rows:
+        key = row.get("match_key")
+        if not key:
+            continue
+        if key not in primaries:
+            primaries[key] = (row["order_id"], row["source"])
+            new_primaries.append((key, row["order_id"], row["source"]))
+            continue
+        order_id, source = primaries[key]
+        if source != row["source"] and order_id != row["order_id"]:
+            row["duplicate_of"] = order_id
+            flagged[row["source"]] += 1
+    for source, count in flagged.items():
+        DUPLICATE_ROWS.labels(source=source).inc(count)
+    return new_primaries
+
+
+def fetch_primaries(session, keys: List[str], window_hours: float) -> List[Tuple[str, str, str]]:
+    session.execute(text(LOCK_KEYS), {"keys": keys})
+    return [tuple(row) for row in session.execute(text(FETCH_PRIMARIES), {"keys": keys, "hours": window_hours})]
+
+
+_index: Optional[RecentKeys] = None
+_index_lock = threading.Lock()
+
+
+def recent_keys(settings) -> Optional[RecentKeys]:
+    """The process-wide index, or None when ``dedup_enabled`` is off."""
+    global _index
+    if not settings.dedup_enabled:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = RecentKeys(settings.dedup_window_hours * 3600, settings.dedup_cache_size)
+        return _index
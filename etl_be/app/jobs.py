@@ -0,0 +1,168 @@
+"""Upload jobs: link rows back to the upload that sent them and report progress.
+
+The API creates a job per upload and stamps its id into every envelope; the
+consumers record each batch's counts in the same transaction that stores the
+rows, so the counters never run ahead of the data. Counts are appended to
+``upload_job_progress`` (one row per job per batch) rather than added to the
+``upload_jobs`` row, so batches of one upload never wait on each other's row
+lock; ``get_job`` sums them. A message redelivered after a crash between
+commit and ack is counted again, so ``processed`` can slightly exceed
+``published``; progress is capped at 100%.
+
+Rows of a message that ends up in a parking queue are counted as ``parked``
+(and taken back off when it is replayed): a job whose rows are all either
+processed or parked is finished, ``done_with_errors`` if any were parked.
+"""
+from __future__ import annotations
+
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import func, insert, select, update
+
+from .db import UploadJob, UploadJobProgress
+from .pipeline import ProcessedOrder
+from .utils import decode_body
+
+JOB_COUNTERS = ("processed", "clean", "error", "fixed")
+
+# Same insert for the raw drivers (bulk loader: psycopg2 paramstyle).
+JOB_PROGRESS_SQL = """
+INSERT INTO upload_job_progress (job_id, processed, clean, error, fixed)
+VALUES (%(job_id)s, %(processed)s, %(clean)s, %(error)s, %(fixed)s)
+"""
+
+
+def new_job_id() -> str:
+    return str(uuid.uuid4())
+
+
+def create_job(engine, source: str, mode: str) -> str:
+    job_id = new_job_id()
+    with engine.begin() as connection:
+        connection.execute(UploadJob.__table__.insert().values(id=job_id, source=source, mode=mode))
+    return job_id
+
+
+def finish_publishing(engine, job_id: str, published: Optional[int], failed: bool = False) -> None:
+    """Record the final count of rows handed on (queued, or bulk loaded); None leaves it unchanged."""
+    values = {"status": "failed" if failed else "published", "published_at": func.localtimestamp()}
+    if published is not None:
+        values["published"] = published
+    with engine.begin() as connection:
+        connection.execute(update(UploadJob).where(UploadJob.id == job_id).values(**values))
+
+
+def job_counts(orders: Sequence[ProcessedOrder]) -> Dict[str, Counter]:
+    """Per-job counter increments for a batch (rows without a job are skipped)."""
+    counts: Dict[str, Counter] = {}
+    for order in orders:
+        if order.job_id is None:
+            continue
+        counter = counts.setdefault(order.job_id, Counter())
+        counter["processed"] += 1
+        counter["clean" if order.is_valid else "error"] += 1
+        counter["fixed"] += order.was_fixed
+    return counts
+
+
+def record_progress(session, orders: Sequence[ProcessedOrder]) -> None:
+    """Append a batch's counts for its jobs (caller owns the transaction)."""
+    rows = [
+        {"job_id": job_id, **{name: counter[name] for name in JOB_COUNTERS}}
+        for job_id, counter in job_counts(orders).items()
+    ]
+    if rows:
+        session.execute(insert(UploadJobProgress), rows)
+
+
+def parked_rows(messages: Iterable[Tuple[bytes, Optional[str]]]) -> Dict[str, int]:
+    """Rows per job in ``(body, content_type)`` envelopes; undecodable or job-less messages are skipped."""
+    counts: Counter = Counter()
+    for body, content_type in messages:
+        try:
+            message = decode_body(body, content_type)
+        except ValueError:
+            continue
+        if not isinstance(message, dict) or message.get("job_id") is None:
+            continue
+        rows = message.get("rows")
+        counts[str(message["job_id"])] += len(rows) if isinstance(rows, list) else 1
+    return dict(counts)
+
+
+def record_parked(connection, parked: Dict[str, int]) -> None:
+    """Count rows parked (positive) or replayed from a parking queue (negative) per job."""
+    rows = [{"job_id": job_id, "parked": count} for job_id, count in parked.items() if count]
+    if rows:
+        connection.execute(insert(UploadJobProgress), rows)
+
+
+def record_replayed(engine, messages: Iterable[Tuple[bytes, Optional[str]]]) -> None:
+    """Take replayed parking-queue messages back off their jobs' ``parked`` count."""
+    parked = parked_rows(messages)
+    if parked:
+        with engine.begin() as connection:
+            record_parked(connection, {job_id: -count for job_id, count in parked.items()})
+
+
+def job_report(job: Dict[str, object], now: datetime) -> Dict[str, object]:
+    """Progress, throughput and ETA for a job row (timestamps from the database clock)."""
+    published = int(job["published"])
+    processed = int(job["processed"])
+    parked = max(int(job.get("parked") or 0), 0)
+    finished_rows = processed + parked
+    if job["status"] in ("publishing", "failed"):
+        state = job["status"]
+    elif finished_rows < published:
+        state = "processing"
+    else:
+        state = "done_with_errors" if parked else "done"
+
+    started = job["created_at"]
+    # Once finished, updated_at is when the last batch landed.
+    done = state in ("done", "done_with_errors")
+    finished = job["updated_at"] if done and job["updated_at"] else now
+    elapsed = max((finished - started).total_seconds(), 0.0) if started else 0.0
+    rate = processed / elapsed if elapsed > 0 else None
+    remaining = max(published - finished_rows, 0)
+    eta = remaining / rate if state == "processing" and rate else None
+
+    return {
+        "job_id": job["id"],
+        "source": job["source"],
+        "mode": job["mode"],
+        "state": state,
+        "published": published,
+        "processed": processed,
+        "clean": int(job["clean"]),
+        "error": int(job["error"]),
+        "fixed": int(job["fixed"]),
+        "parked": parked,
+        "progress": min(finished_rows / published, 1.0) if published and state != "publishing" else None,
+        "rows_per_second": round(rate, 1) if rate is not None else None,
+        "elapsed_seconds": round(elapsed, 1),
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "created_at": started.isoformat() if started else None,
+        "published_at": job["published_at"].isoformat() if job["published_at"] else None,
+    }
+
+
+def get_job(engine, job_id: str) -> Optional[Dict[str, object]]:
+    # The job's counters are the sums of its progress rows; the newest one is when the last batch landed.
+    sums = [
+        func.coalesce(func.sum(getattr(UploadJobProgress, name)), 0).label(name) for name in (*JOB_COUNTERS, "parked")
+    ]
+    progress = select(*sums, func.max(UploadJobProgress.created_at).label("updated_at")).where(
+        UploadJobProgress.job_id == job_id
+    )
+    with engine.connect() as connection:
+        job = connection.execute(
+            select(UploadJob.__table__, func.localtimestamp().label("now")).where(UploadJob.id == job_id)
+        ).mappings().first()
+        if job is None:
+            return None
+        totals = connection.execute(progress).mappings().one()
+    return job_report({**job, **totals}, job["now"])
@@ -0,0 +1,237 @@
+"""Server-Sent Events feed of newly committed orders.
+
+One ``LiveFeed`` per API process turns ``orders_changed`` notifications into
+frames for every connected dashboard:
+
+- notifications only wake the broadcaster; a burst arriving within
+  ``coalesce_ms`` becomes a single frame;
+- per wake-up, the broadcaster reads the rows committed since the previous
+  one, oldest first in pages of ``max_rows`` per table (one frame per page),
+  no matter how many clients are connected, and fans the frames out to each
+  client's queue;
+- a client that falls behind loses its oldest frames rather than slowing the
+  others down.
+
+Ids are drawn from a sequence at insert time, so with several writers a lower
+id can commit after a higher one has been sent. Every id the feed steps over is
+remembered as a gap and looked up again on each wake-up, but only briefly: a
+writer's batch commits within a few seconds of drawing its ids, while ids
+burned by upsert conflicts or rollbacks never show up at all, so gaps expire
+after ``gap_seconds`` (default 5) and at most ``MAX_GAPS`` ranges per table
+are kept, keeping the ``OR``-ed id ranges of each wake-up query short.
+
+Rows updated in place by an upsert keep their id, so they show up in the
+counts but not as new rows.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, select
+
+from .db import OrdersClean, OrdersError
+from .queries import OrderFilters, build_query, row_to_dict
+from .utils import json_dumps
+
+LOGGER = logging.getLogger("api.live")
+
+KEEPALIVE_SECONDS = 15.0
+# Gap ranges kept per table; beyond this the oldest are given up first.
+MAX_GAPS = 32
+
+
+def sse_frame(event: str, data: Dict[str, Any]) -> bytes:
+    return b"event: " + event.encode("ascii") + b"\ndata: " + json_dumps(data) + b"\n\n"
+
+
+class FeedPosition:
+    """Ids of one table already sent: everything up to ``last_id`` except the open gaps."""
+
+    def __init__(self, last_id: int = 0, gap_seconds: float = 5.0) -> None:
+        self.last_id = last_id
+        self.gap_seconds = gap_seconds
+        # [first id, last id, expiry (monotonic)] of id ranges stepped over but not seen yet.
+        self.gaps: List[List[float]] = []
+
+    def reset(self, last_id: int) -> None:
+        self.last_id = last_id
+        self.gaps.clear()
+
+    def unsent(self, column):
+        """Condition matching the ids not sent yet: newer than ``last_id`` or inside a gap."""
+        return or_(column > self.last_id, *(column.between(first, last) for first, last, _ in self.gaps))
+
+    def advance(self, ids: List[int], now: float) -> None:
+        """Record ``ids`` (ascending) as sent."""
+        for row_id in ids:
+            if row_id > self.last_id:
+                if row_id > self.last_id + 1:
+                    self.gaps.append([self.last_id + 1, row_id - 1, now + self.gap_seconds])
+                self.last_id = row_id
+                continue
+            for gap in self.gaps:
+                first, last, expires = gap
+                if first <= row_id <= last:
+                    self.gaps.remove(gap)
+                    self.gaps.extend(
+                        [start, end, expires]
+                        for start, end in ((first, row_id - 1), (row_id + 1, last))
+                        if start <= end
+                    )
+                    break
+
+    def expire(self, now: float) -> None:
+        self.gaps = [gap for gap in self.gaps if gap[2] > now]
+        if len(self.gaps) > MAX_GAPS:
+            self.gaps.sort(key=lambda gap: gap[2])
+            LOGGER.debug("Live feed gives up %d id gaps early", len(self.gaps) - MAX_GAPS)
+            del self.gaps[: len(self.gaps) - MAX_GAPS]
+
+
+class LiveFeed:
+    def __init__(
+        self,
+        engine,
+        coalesce_ms: int = 500,
+        max_rows: int = 200,
+        client_buffer: int = 32,
+        gap_seconds: float = 5.0,
+    ) -> None:
+        self._engine = engine
+        self._coalesce = coalesce_ms / 1000.0
+        self._max_rows = max_rows
+        self._client_buffer = client_buffer
+        self._clients: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._positions = {model: FeedPosition(0, gap_seconds) for model in (OrdersClean, OrdersError)}
+        # Notification counts since the last frame / since the feed started, per source.
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await run_in_threadpool(self._skip_to_end)
+        self._task = asyncio.create_task(self._broadcast())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def on_change(self, payloads: Optional[List[Dict[str, object]]]) -> None:
+        """ChangeListener handler (runs on the listener thread)."""
+        with self._lock:
+            for payload in payloads or ():
+                counts = self._pending.setdefault(str(payload.get("source", "unknown")), {"clean": 0, "error": 0})
+                for key in ("clean", "error"):
+                    counts[key] += int(payload.get(key, 0) or 0)
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Frames for one client, with periodic keep-alive comments."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._client_buffer)
+        self._clients.add(queue)
+        try:
+            with self._lock:
+                totals = {source: dict(counts) for source, counts in self._totals.items()}
+            yield sse_frame("hello", {"totals": totals})
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self._clients.discard(queue)
+
+    def _skip_to_end(self) -> None:
+        with self._engine.connect() as connection:
+            for model, position in self._positions.items():
+                position.reset(connection.execute(select(func.coalesce(func.max(model.id), 0))).scalar_one())
+
+    def _fetch_new(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Frames of unsent rows, oldest page first (newest row first within a frame), and whether more remain.
+
+        At most ``client_buffer`` pages per table are read per call, so a burst
+        larger than that is sent over the following wake-ups instead of being
+        held in memory at once.
+        """
+        pages: Dict[str, List[List[Dict[str, Any]]]] = {}
+        more = False
+        now = time.monotonic()
+        with self._engine.connect() as connection:
+            for model, key in ((OrdersClean, "clean"), (OrdersError, "error")):
+                position = self._positions[model]
+                position.expire(now)
+                unsent = position.unsent(model.id)
+                pages[key] = []
+                after = 0
+                while True:
+                    if len(pages[key]) == self._client_buffer:
+                        more = True
+                        break
+                    stmt = build_query(model, OrderFilters()).where(unsent, model.id > after)
+                    stmt = stmt.order_by(None).order_by(model.id.asc()).limit(self._max_rows)
+                    rows = connection.execute(stmt).mappings().all()
+                    if not rows:
+                        break
+                    position.advance([row["id"] for row in rows], now)
+                    pages[key].append([row_to_dict(row, model is OrdersClean) for row in reversed(rows)])
+                    after = rows[-1]["id"]
+                    if len(rows) < self._max_rows:
+                        break
+        count = max(1, len(pages["clean"]), len(pages["error"]))
+        frames = [
+            {key: pages[key][index] if index < len(pages[key]) else [] for key in ("clean", "error")}
+            for index in range(count)
+        ]
+        return frames, more
+
+    async def _broadcast(self) -> None:
+        assert self._wake is not None
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self._coalesce)
+            self._wake.clear()
+            if not self._clients:
+                # Nobody is watching: skip the queries but keep the position current.
+                await run_in_threadpool(self._skip_to_end)
+                self._take_counts()
+                continue
+            try:
+                frames, more = await run_in_threadpool(self._fetch_new)
+            except Exception:
+                LOGGER.exception("Live feed query failed")
+                continue
+            if more:
+                self._wake.set()
+            counts, totals = self._take_counts()
+            for index, frame in enumerate(frames):
+                # The notification counts go out once, with the first page.
+                frame["counts"], frame["totals"] = counts if index == 0 else {}, totals
+                data = sse_frame("orders", frame)
+                for queue in list(self._clients):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(data)
+
+    def _take_counts(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for source, counts in pending.items():
+                totals = self._totals.setdefault(source, {"clean": 0, "error": 0})
+                for key, value in counts.items():
+                    totals[key] += value
+            return pending, {source: dict(counts) for source, counts in self._totals.items()}
@@ -1,18 +1,218 @@
+"""Logging setup shared by the API, consumers, producers and the bulk loader.
+
+With ``LOG_ASYNC`` (default) callers only put records on an in-memory queue;
+a ``QueueListener`` thread does the formatting and the console/file I/O.
+``LOG_FORMAT=json`` writes one JSON object per line, including any ``extra``
+fields. ``LOG_SAMPLE`` limits chatty per-order loggers, e.g.
+``consumer.orders.rows=100/s`` or ``consumer.orders.rows=0.01``: ``N/s`` keeps at most N
+records per second, a fraction keeps that share of them (``0`` drops all),
+and every ``LOG_SUMMARY_INTERVAL`` seconds a summary line reports how many
+were suppressed.
+"""
+from __future__ import annotations
+
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import Settings, get_settings
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+# Used when several consumer worker processes share one set of handlers.
+WORKER_LOG_FORMAT = "%(asctime)s [%(levelname)s] %(processName)s %(name)s: %(message)s"
+
+SUMMARY_LOGGER = logging.getLogger("logging.sampling")
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_filters: List["SamplingFilter"] = []
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, process, message, extras, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, object] = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a share (``rate`` < 1) or at most ``per_second`` records of one logger."""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 1.0,
+        per_second: Optional[float] = None,
+        summary_interval: float = 10.0,
+    ) -> None:
+        super().__init__(name)
+        self.rate = rate
+        self.per_second = per_second
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._count = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._summary_start = self._window_start
+        self._seen = 0
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._seen += 1
+            keep = self._keep(now)
+            if not keep:
+                self._suppressed[record.levelname] = self._suppressed.get(record.levelname, 0) + 1
+            due = now - self._summary_start >= self.summary_interval
+        if due:
+            self.flush(now)
+        return keep
+
+    def _keep(self, now: float) -> bool:
+        if self.per_second is not None:
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            return self._window_count <= self.per_second
+        # Deterministic 1-in-N: keep the record whenever count * rate reaches the next whole number.
+        self._count += 1
+        return int(self._count * self.rate) > int((self._count - 1) * self.rate)
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """Log (and reset) the suppressed-record summary, if anything was suppressed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            seen, suppressed, started = self._seen, self._suppressed, self._summary_start
+            self._seen, self._suppressed, self._summary_start = 0, {}, now
+        if suppressed:
+            SUMMARY_LOGGER.info(
+                "%s: suppressed %d of %d records in the last %.0fs (%s)",
+                self.name,
+                sum(suppressed.values()),
+                seen,
+                now - started,
+                ", ".join(f"{level} {count}" for level, count in sorted(suppressed.items())),
+                extra={"sampled_logger": self.name, "suppressed": suppressed, "seen": seen},
+            )
 
 
-def configure_logging(log_dir: Path | None = None) -> None:
+def parse_sampling(spec: str, summary_interval: float = 10.0) -> List[SamplingFilter]:
+    """``logger=0.01,other=100/s`` -> one filter per logger."""
+    filters = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name, value = name.strip(), value.strip()
+        if not name or not value:
+            raise ValueError(f"invalid LOG_SAMPLE entry {item!r}, expected logger=rate or logger=N/s")
+        if value.endswith("/s"):
+            filters.append(SamplingFilter(name, per_second=float(value[:-2]), summary_interval=summary_interval))
+        else:
+            filters.append(SamplingFilter(name, rate=float(value), summary_interval=summary_interval))
+    return filters
+
+
+def build_formatter(fmt: str = LOG_FORMAT, json_format: bool = False) -> logging.Formatter:
+    return JsonFormatter() if json_format else logging.Formatter(fmt)
+
+
+def build_handlers(
+    log_dir: Path | None = None, fmt: str = LOG_FORMAT, json_format: bool = False
+) -> list[logging.Handler]:
     log_dir = log_dir or Path("logs")
     log_dir.mkdir(parents=True, exist_ok=True)
     log_file = log_dir / "pipeline.log"
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(log_file, encoding="utf-8"),
-        ],
-    )
+    formatter = build_formatter(fmt, json_format)
+    handlers: list[logging.Handler] = [
+        logging.StreamHandler(),
+        logging.FileHandler(log_file, encoding="utf-8"),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def install_sampling(settings: Settings) -> None:
+    """Attach ``LOG_SAMPLE`` filters to their loggers (replacing earlier ones)."""
+    for sampling in _filters:
+        logging.getLogger(sampling.name).removeFilter(sampling)
+    _filters[:] = parse_sampling(settings.log_sample, settings.log_summary_interval)
+    for sampling in _filters:
+        logging.getLogger(sampling.name).addFilter(sampling)
+
+
+def start_listener(handlers: List[logging.Handler], log_queue=None) -> logging.handlers.QueueListener:
+    """Route root logging through ``log_queue`` to ``handlers`` on a background thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    log_queue = log_queue if log_queue is not None else queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def _skip_unused_record_fields() -> None:
+    # None of our formats print the caller's file/line or thread, so skip collecting
+    # them for every record (the "Optimization" section of the logging HOWTO).
+    logging._srcfile = None
+    logging.logThreads = False
+
+
+def configure_logging(log_dir: Path | None = None, settings: Optional[Settings] = None) -> None:
+    settings = settings or get_settings()
+    _skip_unused_record_fields()
+    handlers = build_handlers(log_dir, json_format=settings.log_format == "json")
+    if settings.log_async:
+        listener = start_listener(handlers)
+        handlers = [logging.handlers.QueueHandler(listener.queue)]
+    root = logging.getLogger()
+    root.handlers[:] = handlers
+    root.setLevel(settings.log_level.upper())
+    install_sampling(settings)
+
+
+def configure_worker_logging(log_queue, settings: Optional[Settings] = None) -> None:
+    """Send every record of a worker process to the supervisor's queue listener."""
+    settings = settings or get_settings()
+    _skip_unused_record_fields()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(settings.log_level.upper())
+    install_sampling(settings)
+
 
+@atexit.register
+def shutdown_logging() -> None:
+    """Write the last sampling summaries and drain the queue before the process exits."""
+    global _listener
+    for sampling in _filters:
+        sampling.flush()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,18 +1,31 @@
 from __future__ import annotations
 
-import csv
-import io
 import logging
-from typing import Iterable, Dict, Type, List, Any
+from datetime import date
+from typing import Iterable, Dict, Type, List, Any, Optional, Tuple
 
 import pika
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pika.exceptions import AMQPError
 from pydantic import BaseModel
 
+from .bulk_load import load_rows
+from .cache import ResponseCache
 from .config import get_settings
 from .db import create_tables, get_engine, get_session_factory, OrdersClean, OrdersError
+from .jobs import create_job, finish_publishing, get_job, record_replayed
+from .live_feed import LiveFeed
 from .logging_conf import configure_logging
+from .metrics import CONTENT_TYPE_LATEST, generate_latest, watch_engine_pool
+from .notify import ChangeListener
+from .publisher import PublishError, close_publisher, connection_parameters, get_publisher
+from .queries import InvalidCursor, OrderFilters, csv_chunks, fetch_page, fields_for, ndjson_chunks, stream_rows
+from .retry import parking_queue, peek_parked, replay_parked
+from .rollups import daily_stats, error_reasons, source_summary
+from .routing import SOURCES, Lane, all_lanes, select_lanes
+from .upload_stream import StreamingCsvUpload, UploadFormatError
 from .utils import json_dumps
 
 LOGGER = logging.getLogger("api")
@@ -20,49 +33,58 @@ app = FastAPI(title="Orders ETL API", version="1.0.0")
 settings = get_settings()
 engine = None
 SessionLocal = None
+read_cache = ResponseCache(settings.read_cache_max_entries, settings.read_cache_ttl)
+change_listener: Optional[ChangeListener] = None
+live_feed: Optional[LiveFeed] = None
 
 
 class OrdersResponse(BaseModel):
     items: List[Dict[str, Any]]
     count: int
+    next_cursor: Optional[str] = None
 
 
-def publish_rows(source: str, rows: Iterable[Dict[str, object]]) -> int:
-    """Publish rows to RabbitMQ with the given source label."""
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=settings.rabbitmq_host,
-            port=settings.rabbitmq_port,
-            credentials=pika.PlainCredentials(settings.rabbitmq_user, settings.rabbitmq_password),
-        )
-    )
-    channel = connection.channel()
-    channel.queue_declare(queue=settings.rabbitmq_queue, durable=True)
-
-    count = 0
-    for row in rows:
-        payload = {"source": source, "table": "orders", "data": row}
-        channel.basic_publish(
-            exchange="",
-            routing_key=settings.rabbitmq_queue,
-            body=json_dumps(payload),
-            properties=pika.BasicProperties(delivery_mode=2),
-        )
-        count += 1
-    connection.close()
-    return count
+def publish_rows(source: str, rows: Iterable[Dict[str, object]], job_id: Optional[str] = None) -> Dict[str, int]:
+    """Publish rows to RabbitMQ with the given source label (and upload job id)."""
+    return get_publisher(settings).publish_rows(source, rows, job_id=job_id).as_dict()
 
 
 @app.on_event("startup")
 async def startup_event() -> None:
-    configure_logging()
+    configure_logging(settings=settings)
     global engine
     engine = get_engine(settings)
     global SessionLocal
     SessionLocal = get_session_factory(engine)
+    watch_engine_pool("api", engine)
     if settings.migrate_on_start:
         await run_in_threadpool(create_tables, engine)
         LOGGER.info("Tables ensured on startup")
+    get_publisher(settings)
+    if settings.read_cache_enabled or settings.live_feed_enabled:
+        global change_listener, live_feed
+        change_listener = ChangeListener(settings)
+        if settings.read_cache_enabled:
+            change_listener.add_handler(read_cache.invalidate)
+        if settings.live_feed_enabled:
+            live_feed = LiveFeed(
+                engine,
+                settings.live_feed_coalesce_ms,
+                settings.live_feed_max_rows,
+                gap_seconds=settings.live_feed_gap_seconds,
+            )
+            await live_feed.start()
+            change_listener.add_handler(live_feed.on_change)
+        change_listener.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    if change_listener is not None:
+        change_listener.stop()
+    if live_feed is not None:
+        await live_feed.stop()
+    close_publisher()
 
 
 @app.get("/health")
@@ -70,63 +92,301 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus scrape endpoint (publish counters, bulk-load stages, DB pool)."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 def validate_source(source: str) -> str:
     normalized = source.lower()
-    if normalized not in {"online", "offline"}:
+    if normalized not in SOURCES:
         raise HTTPException(status_code=400, detail="source must be 'online' or 'offline'")
     return normalized
 
 
-@app.post("/upload/{source}")
-async def upload_csv(source: str, file: UploadFile = File(...)) -> dict[str, int]:
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+def _handed_on(result: Dict[str, Any]) -> Tuple[int, int]:
+    """(rows read, rows that will reach the database) of a publish or bulk load result."""
+    if "loaded" in result:
+        return result["loaded"], result["loaded"]
+    # With confirms, only confirmed rows will ever reach the consumers.
+    confirmed = result.get("confirmed")
+    return result["published"], result["published"] if confirmed is None else confirmed
+
+
+@app.post("/upload/{source}", openapi_extra=UPLOAD_OPENAPI)
+async def upload_csv(
+    source: str,
+    request: Request,
+    mode: str = Query("queue", pattern="^(queue|bulk)$"),
+) -> Dict[str, Any]:
+    """Parse the multipart body as it arrives and publish (or bulk load) rows while it streams in.
+
+    Every upload is an upload job; poll ``GET /jobs/{job_id}`` for its progress. The CSV header is
+    checked against the source's column mapping first: missing required columns fail the upload
+    with 400, columns the mapping does not use are listed in ``unknown_columns``.
+    """
     normalized = validate_source(source)
-    content = await file.read()
     try:
-        text_stream = io.StringIO(content.decode("utf-8"))
-    except UnicodeDecodeError as exc:
-        raise HTTPException(status_code=400, detail="Upload must be UTF-8 encoded CSV") from exc
+        upload = StreamingCsvUpload(request.headers.get("content-type", ""), source=normalized)
+    except UploadFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    reader = csv.DictReader(text_stream)
-    rows = list(reader)
-    if not rows:
-        raise HTTPException(status_code=400, detail="CSV file is empty")
+    job_id = await run_in_threadpool(create_job, engine, normalized, mode)
+    try:
+        if mode == "bulk":
+            result = await upload.process(
+                request.stream(), lambda rows: load_rows(normalized, rows, engine, job_id=job_id)
+            )
+        else:
+            result = await upload.process(request.stream(), lambda rows: publish_rows(normalized, rows, job_id))
+        count, published = _handed_on(result)
+    except UploadFormatError as exc:
+        # Rows before the broken part were already published or loaded; say so rather than hide them.
+        published = _handed_on(exc.partial)[1] if exc.partial else 0
+        await run_in_threadpool(finish_publishing, engine, job_id, published, True)
+        detail = str(exc)
+        if published:
+            verb = "loaded" if mode == "bulk" else "published"
+            detail += f"; {published} rows before the error were already {verb} (job {job_id})"
+        raise HTTPException(status_code=400, detail=detail) from exc
+    except PublishError as exc:
+        await run_in_threadpool(finish_publishing, engine, job_id, None, True)
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
 
-    count = await run_in_threadpool(publish_rows, normalized, rows)
-    return {"published": count}
+    await run_in_threadpool(finish_publishing, engine, job_id, published, not count)
+    if not count:
+        raise HTTPException(status_code=400, detail="CSV file is empty")
+    if upload.unknown_columns:
+        LOGGER.warning("Upload %s (%s) has unmapped columns: %s", job_id, normalized, upload.unknown_columns)
+        result = {**result, "unknown_columns": upload.unknown_columns}
+    return {**result, "job_id": job_id}
 
 
-def _row_to_dict(row: Any, is_clean: bool) -> Dict[str, Any]:
-    base = {
-        "order_id": row.order_id,
-        "source": row.source,
-        "order_date": row.order_date.isoformat() if is_clean and row.order_date else row.order_date,
-        "customer_id": row.customer_id,
-        "customer_name": row.customer_name,
-        "total_amount": float(row.total_amount) if is_clean and row.total_amount is not None else row.total_amount,
-        "status": row.status,
-        "created_at": row.created_at.isoformat() if row.created_at else None,
-    }
-    if not is_clean:
-        base["error_reason"] = row.error_reason
-    return base
+def order_filters(
+    source: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    job_id: Optional[str] = None,
+) -> OrderFilters:
+    return OrderFilters(
+        source=validate_source(source) if source else None,
+        status=status.strip().upper() if status else None,
+        date_from=date_from,
+        date_to=date_to,
+        job_id=job_id,
+    )
 
 
-def _fetch_rows(model: Type, limit: int, is_clean: bool) -> List[Dict[str, Any]]:
-    session = SessionLocal()
+def _page_body(model: Type, filters: OrderFilters, limit: int, cursor: Optional[str]) -> bytes:
     try:
-        rows = session.query(model).order_by(model.id.desc()).limit(limit).all()
-        return [_row_to_dict(r, is_clean=is_clean) for r in rows]
-    finally:
-        session.close()
+        items, next_cursor = fetch_page(engine, model, filters, limit, cursor)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    # Items are already plain JSON values; serialize once instead of re-validating them.
+    return json_dumps({"items": items, "count": len(items), "next_cursor": next_cursor})
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in header.split(",") if tag.strip())
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def _cacheable_response(request: Request, body: bytes, etag: str) -> Response:
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    # no-cache: browsers keep the body but revalidate every poll with If-None-Match.
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+async def _page(
+    request: Request, model: Type, filters: OrderFilters, limit: int, cursor: Optional[str]
+) -> Response:
+    if not 1 <= limit <= settings.orders_max_page_size:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {settings.orders_max_page_size}")
+    # Cached pages are only trusted while the listener is connected: without it
+    # a write could commit unnoticed.
+    caching = change_listener is not None and change_listener.connected
+    key = (model.__tablename__, filters, limit, cursor)
+    etag = read_cache.etag()
+    if caching:
+        # The ETag is the data version, not a digest of the body: a client that
+        # already holds the current one is answered without a cache entry or a query.
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        entry = read_cache.get(key)
+        if entry is not None:
+            return _cacheable_response(request, entry.body, entry.etag)
+
+    body = await run_in_threadpool(_page_body, model, filters, limit, cursor)
+    if not caching:
+        return Response(content=body, media_type="application/json")
+    read_cache.put(key, body, etag)
+    return _cacheable_response(request, body, etag)
+
+
+def _export(model: Type, filters: OrderFilters, fmt: str) -> StreamingResponse:
+    batches = stream_rows(engine, model, filters, settings.orders_export_batch_size)
+    if fmt == "csv":
+        return StreamingResponse(csv_chunks(batches, fields_for(model)), media_type="text/csv")
+    return StreamingResponse(ndjson_chunks(batches), media_type="application/x-ndjson")
 
 
 @app.get("/orders/clean", response_model=OrdersResponse)
-async def get_orders_clean(limit: int = 100) -> OrdersResponse:
-    items = await run_in_threadpool(_fetch_rows, OrdersClean, limit, True)
-    return OrdersResponse(items=items, count=len(items))
+async def get_orders_clean(
+    request: Request, limit: int = 100, cursor: Optional[str] = None, filters: OrderFilters = Depends(order_filters)
+) -> Response:
+    return await _page(request, OrdersClean, filters, limit, cursor)
 
 
 @app.get("/orders/error", response_model=OrdersResponse)
-async def get_orders_error(limit: int = 100) -> OrdersResponse:
-    items = await run_in_threadpool(_fetch_rows, OrdersError, limit, False)
-    return OrdersResponse(items=items, count=len(items))
+async def get_orders_error(
+    request: Request, limit: int = 100, cursor: Optional[str] = None, filters: OrderFilters = Depends(order_filters)
+) -> Response:
+    return await _page(request, OrdersError, filters, limit, cursor)
+
+
+@app.get("/stats")
+async def get_stats() -> Dict[str, Any]:
+    """Clean orders, revenue, errors and error rate per source (from the rollups, see app/rollups.py)."""
+    return await run_in_threadpool(source_summary, engine)
+
+
+@app.get("/stats/daily")
+async def get_daily_stats(
+    source: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Dict[str, Any]:
+    """Orders and revenue per day, source and status."""
+    filters = order_filters(source, status, date_from, date_to)
+    items = await run_in_threadpool(
+        daily_stats, engine, filters.source, filters.status, filters.date_from, filters.date_to
+    )
+    return {"items": items, "count": len(items)}
+
+
+@app.get("/stats/errors")
+async def get_error_stats(source: Optional[str] = None, limit: int = Query(50, ge=1, le=1000)) -> Dict[str, Any]:
+    """Most frequent error reasons."""
+    items = await run_in_threadpool(error_reasons, engine, validate_source(source) if source else None, limit)
+    return {"items": items, "count": len(items)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_upload_job(job_id: str) -> Dict[str, Any]:
+    """Progress of an upload: counts, rows per second and ETA."""
+    job = await run_in_threadpool(get_job, engine, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+def _parking_lanes(lane: Optional[str]) -> List[Lane]:
+    try:
+        return select_lanes(settings, [lane]) if lane else all_lanes(settings)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _on_parking_queues(action, lanes: List[Lane], limit: int) -> List[Any]:
+    """Run ``action(channel, queue, limit)`` for each lane on a short-lived connection (admin calls are rare)."""
+    connection = pika.BlockingConnection(connection_parameters(settings))
+    try:
+        channel = connection.channel()
+        results = []
+        for lane in lanes:
+            channel.queue_declare(queue=parking_queue(lane.queue), durable=True)
+            results.append(action(channel, lane.queue, limit))
+        return results
+    finally:
+        if connection.is_open:
+            connection.close()
+
+
+async def _parking_call(action, lanes: List[Lane], limit: int) -> List[Any]:
+    try:
+        return await run_in_threadpool(_on_parking_queues, action, lanes, limit)
+    except AMQPError as exc:
+        raise HTTPException(status_code=503, detail=f"RabbitMQ unavailable: {exc!r}") from exc
+
+
+@app.get("/parked")
+async def get_parked(
+    limit: int = Query(50, ge=1, le=500), lane: Optional[str] = Query(None)
+) -> Dict[str, Any]:
+    """Messages that exhausted their retries (or could not be decoded), oldest first; left in place.
+
+    ``limit`` applies per lane; without ``lane`` every lane's parking queue is listed.
+    """
+    lanes = _parking_lanes(lane)
+    results = await _parking_call(peek_parked, lanes, limit)
+    items = [{"lane": lane.name, **item} for lane, (parked, _) in zip(lanes, results) for item in parked]
+    return {"count": sum(count for _, count in results), "items": items}
+
+
+@app.post("/parked/replay")
+async def replay_parked_messages(
+    limit: int = Query(100, ge=1, le=100000), lane: Optional[str] = Query(None)
+) -> Dict[str, int]:
+    """Send parked messages back to their lane queue with a fresh retry budget (``limit`` per lane).
+
+    Their rows stop counting as parked on their upload jobs, which go back to ``processing``.
+    """
+    messages: List[Tuple[bytes, Optional[str]]] = []
+
+    def replay(channel, queue: str, limit: int) -> int:
+        return replay_parked(channel, queue, limit, lambda body, content_type: messages.append((body, content_type)))
+
+    replayed = sum(await _parking_call(replay, _parking_lanes(lane), limit))
+    if messages and engine is not None:
+        try:
+            await run_in_threadpool(record_replayed, engine, messages)
+        except Exception:
+            LOGGER.warning("Could not update the parked counts of replayed jobs", exc_info=True)
+    return {"replayed": replayed}
+
+
+@app.get("/orders/live")
+async def orders_live() -> StreamingResponse:
+    """Server-Sent Events: one ``orders`` frame per burst of commits, with new rows and counts."""
+    if live_feed is None:
+        raise HTTPException(status_code=503, detail="live feed is disabled")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(live_feed.subscribe(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/orders/clean/export")
+async def export_orders_clean(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"), filters: OrderFilters = Depends(order_filters)
+) -> StreamingResponse:
+    return _export(OrdersClean, filters, format)
+
+
+@app.get("/orders/error/export")
+async def export_orders_error(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"), filters: OrderFilters = Depends(order_filters)
+) -> StreamingResponse:
+    return _export(OrdersError, filters, format)
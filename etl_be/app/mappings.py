@@ -0,0 +1,230 @@
+"""Declarative per-source column mappings, compiled once per header.
+
+``source_mappings.json`` (or the file named by ``SOURCE_MAPPINGS_FILE``) lists,
+for each canonical field, the source columns that may carry it (the first
+non-empty one wins), a default and whether the column must be present. A
+source entry is merged over ``default`` field by field, so a feed whose header
+says ``order_no`` is onboarded with config only::
+
+    "partner": {"fields": {"order_id": {"columns": ["order_no"], "required": true}}}
+
+``SourceMapping.mapper`` resolves the aliases against a column list once and
+returns a ``ColumnMapper`` whose generated ``record`` function does one
+``itemgetter`` projection of the columns that are actually there and an
+``or`` per field, instead of a ``dict.get`` per alternative. Mapping runs
+exactly once per row, in the consumer or the bulk loader, so queued and staged
+rows always carry their source column names; ``RowMapper`` maps the rows of
+one message and only looks a mapper up again when the key set changes, which
+for a well-formed batch is once per message. Uploads ``compile`` the CSV
+header only to reject a file that lacks a required column (``HeaderError``)
+before the first row is published and to report the columns no field uses.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+from .config import get_settings
+
+CANONICAL_COLUMNS = [
+    "order_id",
+    "source",
+    "order_date",
+    "customer_id",
+    "customer_name",
+    "total_amount",
+    "status",
+]
+MAPPED_FIELDS = tuple(column for column in CANONICAL_COLUMNS if column != "source")
+
+DEFAULT_MAPPINGS_FILE = Path(__file__).with_name("source_mappings.json")
+DEFAULT_ENTRY = "default"
+# Column lists compiled per mapping (least recently used dropped first); a well-formed feed has one or two.
+MAX_COMPILED = 64
+
+
+class MappingConfigError(ValueError):
+    """The mappings file is missing or malformed."""
+
+
+class HeaderError(ValueError):
+    """A CSV header lacks columns that its source mapping requires."""
+
+    def __init__(self, source: str, missing: Sequence["FieldMapping"]) -> None:
+        wanted = "; ".join(f"{item.name} (one of: {', '.join(item.columns)})" for item in missing)
+        super().__init__(f"CSV header for source '{source}' is missing required columns: {wanted}")
+        self.source = source
+        self.missing = [item.name for item in missing]
+
+
+@dataclass(frozen=True)
+class FieldMapping:
+    name: str
+    columns: Tuple[str, ...]
+    default: str = ""
+    required: bool = False
+
+
+def _projection(keys: Sequence[Hashable]) -> Callable[[object], tuple]:
+    if len(keys) == 1:
+        get = itemgetter(keys[0])
+        return lambda row: (get(row),)
+    return itemgetter(*keys)
+
+
+def _builder(plan: Sequence[Tuple[str, Tuple[int, ...], str]], keys: Sequence[Hashable]) -> Callable[[object], dict]:
+    """Compile ``plan`` into one function: a single projection, then ``value or fallback or default`` per field.
+
+    Generated like ``collections.namedtuple`` does; only the validated field
+    names go into the source, defaults are bound as variables.
+    """
+    namespace: Dict[str, object] = {"_project": _projection(keys)} if keys else {}
+    items = []
+    for index, (name, positions, default) in enumerate(plan):
+        namespace[f"_d{index}"] = default
+        items.append(f"{name!r}: " + " or ".join([f"_v{position}" for position in positions] + [f"_d{index}"]))
+    body = f"    {''.join(f'_v{position}, ' for position in range(len(keys)))}= _project(row)\n" if keys else ""
+    exec(f"def build(row):\n{body}    return {{{', '.join(items)}}}\n", namespace)
+    return namespace["build"]
+
+
+class ColumnMapper:
+    """Builds canonical records for dict rows sharing one set of columns."""
+
+    def __init__(self, mapping: "SourceMapping", source: str, header: Sequence[str]) -> None:
+        where = set(header)
+        keys: List[Hashable] = []
+        plan: List[Tuple[str, Tuple[int, ...], str]] = []
+        for item in mapping.fields:
+            if item.name == "source":
+                plan.append(("source", (), source))
+                continue
+            present = [column for column in item.columns if column in where]
+            plan.append((item.name, tuple(range(len(keys), len(keys) + len(present))), item.default))
+            keys.extend(present)
+        self.source = source
+        self.header = tuple(header)
+        self.missing = [item for item in mapping.fields if item.required and not any(c in where for c in item.columns)]
+        self.unknown = [name for name in self.header if name not in mapping.known_columns]
+        # The compiled row -> canonical record function.
+        self.record = _builder(plan, keys)
+
+
+@dataclass(frozen=True)
+class SourceMapping:
+    name: str
+    fields: Tuple[FieldMapping, ...]
+    ignore: FrozenSet[str] = frozenset()
+    # (source, columns) -> compiled mapper, least recently used first.
+    _compiled: "OrderedDict[Tuple[str, Tuple[str, ...]], ColumnMapper]" = field(
+        default_factory=OrderedDict, compare=False, repr=False
+    )
+
+    @property
+    def known_columns(self) -> FrozenSet[str]:
+        return frozenset(column for item in self.fields for column in item.columns) | self.ignore
+
+    def compile(self, source: str, header: Sequence[str]) -> ColumnMapper:
+        """Mapper for rows under a CSV ``header``; raises ``HeaderError`` if a required column is absent."""
+        mapper = ColumnMapper(self, source, header)
+        if mapper.missing:
+            raise HeaderError(source, mapper.missing)
+        return mapper
+
+    def mapper(self, source: str, columns: Sequence[str]) -> ColumnMapper:
+        """The (cached) mapper for dict rows with ``columns``; missing columns fall back to the defaults."""
+        key = (source, tuple(columns))
+        mapper = self._compiled.get(key)
+        if mapper is None:
+            mapper = self._compiled[key] = ColumnMapper(self, source, key[1])
+            while len(self._compiled) > MAX_COMPILED:
+                self._compiled.popitem(last=False)
+        else:
+            try:
+                self._compiled.move_to_end(key)
+            except KeyError:  # evicted by another thread meanwhile
+                pass
+        return mapper
+
+    def normalize(self, source: str, row: Mapping[str, object]) -> Dict[str, object]:
+        """Canonical record of one dict row (for many rows use ``RowMapper``)."""
+        return self.mapper(source, tuple(row)).record(row)
+
+
+def _field(path: Path, entry: str, name: str, spec: object) -> FieldMapping:
+    if not isinstance(spec, dict) or not isinstance(spec.get("columns"), list) or not spec["columns"]:
+        raise MappingConfigError(f"{path}: {entry}.{name} needs a non-empty 'columns' list")
+    return FieldMapping(
+        name,
+        tuple(str(column) for column in spec["columns"]),
+        str(spec.get("default", "")),
+        bool(spec.get("required", False)),
+    )
+
+
+def load_mappings(path: Path) -> Dict[str, SourceMapping]:
+    """Parse a mappings file into ``SourceMapping`` per entry, each merged over ``default``."""
+    try:
+        config = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        raise MappingConfigError(f"cannot read source mappings {path}: {exc}") from exc
+    if not isinstance(config, dict) or not isinstance(config.get(DEFAULT_ENTRY), dict):
+        raise MappingConfigError(f"{path}: expected an object with a '{DEFAULT_ENTRY}' entry")
+
+    base = config[DEFAULT_ENTRY]
+    mappings = {}
+    for entry, spec in config.items():
+        if not isinstance(spec, dict):
+            raise MappingConfigError(f"{path}: entry '{entry}' must be an object")
+        specs = {**base.get("fields", {}), **spec.get("fields", {})}
+        unknown = sorted(set(specs) - set(MAPPED_FIELDS))
+        if unknown:
+            raise MappingConfigError(f"{path}: {entry} maps unknown fields {', '.join(unknown)}")
+        absent = [name for name in MAPPED_FIELDS if name not in specs]
+        if absent:
+            raise MappingConfigError(f"{path}: {entry} does not map {', '.join(absent)}")
+        fields = tuple(
+            FieldMapping("source", ()) if name == "source" else _field(path, entry, name, specs[name])
+            for name in CANONICAL_COLUMNS
+        )
+        ignore = frozenset(str(column) for column in (*base.get("ignore", ()), *spec.get("ignore", ())))
+        mappings[entry] = SourceMapping(entry, fields, ignore)
+    return mappings
+
+
+class RowMapper:
+    """Maps the dict rows of one message; the mapper is looked up again only when the key set changes."""
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.mapping = source_mapping(source)
+        self._keys = None
+        self._record: Optional[Callable[[object], dict]] = None
+
+    def __call__(self, row: Mapping[str, object]) -> Dict[str, object]:
+        keys = row.keys()
+        if keys != self._keys:
+            self._record = self.mapping.mapper(self.source, tuple(keys)).record
+            self._keys = keys
+        return self._record(row)
+
+
+_registry: Optional[Dict[str, SourceMapping]] = None
+_registry_lock = threading.Lock()
+
+
+def source_mapping(source: str) -> SourceMapping:
+    """The mapping of ``source`` (its own entry, else ``default``) from ``SOURCE_MAPPINGS_FILE``."""
+    global _registry
+    registry = _registry
+    if registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = load_mappings(get_settings().source_mappings_file or DEFAULT_MAPPINGS_FILE)
+            registry = _registry
+    return registry.get(source) or registry[DEFAULT_ENTRY]
@@ -0,0 +1,122 @@
+"""Prometheus metrics for the API (``GET /metrics``) and the consumers (HTTP port).
+
+Kept cheap enough to leave on: row outcomes are counted once per message or
+batch, not per row; the per-row stages (normalize, clean, enrich, validate) are timed
+with ``perf_counter`` into a ``StageTimer`` and observed once per message; DB
+pool gauges are read only when scraped.
+
+Stage histograms:
+
+- ``decode``, ``normalize``, ``clean``, ``enrich``, ``validate``: seconds per
+  message (summed over its rows for the per-row stages);
+- ``customers``, ``dedup``: seconds per table lookup for the cache misses of a
+  batch (customer names, duplicate match keys);
+- ``upsert``, ``commit``: seconds per database write (one batch or message).
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+PUBLISHED_ROWS = Counter("etl_published_rows_total", "Rows published to RabbitMQ.", ["source"])
+CONSUMED_MESSAGES = Counter("etl_consumed_messages_total", "Messages processed, stored and acked.")
+REQUEUED_MESSAGES = Counter("etl_requeued_messages_total", "Messages nacked back onto the queue.")
+RETRIED_MESSAGES = Counter("etl_retried_messages_total", "Failed messages sent to a delay queue for a retry.")
+PARKED_MESSAGES = Counter("etl_parked_messages_total", "Messages moved to the parking queue.")
+CLEAN_ROWS = Counter("etl_clean_rows_total", "Rows stored in orders_clean.", ["source"])
+ERROR_ROWS = Counter("etl_error_rows_total", "Rows stored in orders_error.", ["source"])
+FIXED_ROWS = Counter("etl_fixed_rows_total", "Rows changed by the auto-fix step.", ["source"])
+UNCHANGED_ROWS = Counter(
+    "etl_unchanged_rows_total",
+    "Rows not rewritten because their content hash matched (check: cache = consumer LRU, database = upsert).",
+    ["table", "check"],
+)
+DUPLICATE_ROWS = Counter(
+    "etl_duplicate_rows_total", "Clean rows flagged as a repeat of an order from another source.", ["source"]
+)
+CUSTOMER_LOOKUPS = Counter(
+    "etl_customer_lookups_total",
+    "customer_id lookups by the enrichment stage (result: hit = served by the cache, miss = read from the table).",
+    ["result"],
+)
+
+STAGE_SECONDS = Histogram(
+    "etl_stage_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+STAGES = ("decode", "normalize", "clean", "enrich", "validate", "customers", "dedup", "upsert", "commit")
+_STAGE = {stage: STAGE_SECONDS.labels(stage=stage) for stage in STAGES}
+
+QUEUE_DEPTH = Gauge("etl_queue_depth", "Messages ready in the RabbitMQ queue.", ["queue"])
+CIRCUIT_OPEN = Gauge("etl_db_circuit_open", "1 while consumption is paused because the database is unreachable.")
+DB_POOL_CONNECTIONS = Gauge("etl_db_pool_connections", "Database pool connections by state.", ["pool", "state"])
+
+
+class StageTimer:
+    """Accumulates per-row stage durations; ``observe`` records them once."""
+
+    __slots__ = ("normalize", "clean", "enrich", "validate")
+
+    def __init__(self) -> None:
+        self.normalize = 0.0
+        self.clean = 0.0
+        self.enrich = 0.0
+        self.validate = 0.0
+
+    def observe(self) -> None:
+        _STAGE["normalize"].observe(self.normalize)
+        _STAGE["clean"].observe(self.clean)
+        _STAGE["enrich"].observe(self.enrich)
+        _STAGE["validate"].observe(self.validate)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    _STAGE[stage].observe(seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _STAGE[stage].observe(time.perf_counter() - started)
+
+
+def record_orders(orders: Sequence) -> None:
+    """Count clean/error/fixed rows of a stored batch, one increment per source and outcome."""
+    clean: Tally = Tally()
+    error: Tally = Tally()
+    fixed: Tally = Tally()
+    for order in orders:
+        (clean if order.is_valid else error)[order.source] += 1
+        if order.was_fixed:
+            fixed[order.source] += 1
+    for counter, tally in ((CLEAN_ROWS, clean), (ERROR_ROWS, error), (FIXED_ROWS, fixed)):
+        for source, count in tally.items():
+            counter.labels(source=source).inc(count)
+
+
+def watch_engine_pool(name: str, engine) -> None:
+    """Expose a SQLAlchemy pool's in-use/idle connections (read at scrape time)."""
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CONNECTIONS.labels(pool=name, state="in_use").set_function(pool.checkedout)
+        DB_POOL_CONNECTIONS.labels(pool=name, state="idle").set_function(pool.checkedin)
+
+
+def watch_asyncpg_pool(name: str, pool) -> None:
+    DB_POOL_CONNECTIONS.labels(pool=name, state="in_use").set_function(lambda: pool.get_size() - pool.get_idle_size())
+    DB_POOL_CONNECTIONS.labels(pool=name, state="idle").set_function(pool.get_idle_size)
+
+
+def serve_metrics(port: int) -> None:
+    """Start the consumer's metrics HTTP server on a daemon thread (port 0 disables it)."""
+    if port:
+        start_http_server(port)
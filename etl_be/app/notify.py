@@ -0,0 +1,130 @@
+"""Write notifications over Postgres ``LISTEN/NOTIFY``.
+
+Writers (the consumers and the bulk loader) call ``notify_orders_changed``
+inside the transaction that stores a batch; Postgres delivers the notification
+only when that transaction commits, so listeners never hear about rows they
+cannot see yet. The API runs one ``ChangeListener`` thread that turns these
+notifications into callbacks (cache invalidation, live feed).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import select
+import threading
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import text
+
+from .config import Settings
+
+LOGGER = logging.getLogger("notify")
+
+ORDERS_CHANNEL = "orders_changed"
+NOTIFY_SQL = "SELECT pg_notify(%s, %s)"
+
+# A handler receives the decoded payloads of one wake-up, or None after a
+# (re)connect, when notifications may have been missed and state must be resynced.
+ChangeHandler = Callable[[Optional[List[Dict[str, object]]]], None]
+
+
+def change_payload(source: str, clean: int, error: int) -> str:
+    return json.dumps({"source": source, "clean": clean, "error": error})
+
+
+def notify_orders_changed(session, source: str, clean: int, error: int) -> None:
+    """Queue a notification in the session's transaction (sent on commit)."""
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": ORDERS_CHANNEL, "payload": change_payload(source, clean, error)},
+    )
+
+
+class ChangeListener:
+    """Background thread that ``LISTEN``s on ``channel`` (``orders_changed`` by default) and fans out to handlers."""
+
+    def __init__(
+        self,
+        settings: Settings,
+        poll_interval: float = 5.0,
+        reconnect_delay: float = 2.0,
+        channel: str = ORDERS_CHANNEL,
+    ) -> None:
+        self._settings = settings
+        self.channel = channel
+        self._poll_interval = poll_interval
+        self._reconnect_delay = reconnect_delay
+        self._handlers: List[ChangeHandler] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+
+    def add_handler(self, handler: ChangeHandler) -> None:
+        self._handlers.append(handler)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f"{self.channel}-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._poll_interval + 1)
+
+    def _dispatch(self, payloads: Optional[List[Dict[str, object]]]) -> None:
+        for handler in self._handlers:
+            try:
+                handler(payloads)
+            except Exception:
+                LOGGER.exception("Change handler failed")
+
+    def _connect(self):
+        settings = self._settings
+        connection = psycopg2.connect(
+            host=settings.postgres_host,
+            port=settings.postgres_port,
+            user=settings.postgres_user,
+            password=settings.postgres_password,
+            dbname=settings.postgres_db,
+        )
+        connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        connection.cursor().execute(f"LISTEN {self.channel}")
+        return connection
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                self.connected = True
+                LOGGER.info("Listening for %s notifications", self.channel)
+                self._dispatch(None)
+                self._listen(connection)
+            except Exception:
+                LOGGER.warning("Change listener disconnected, retrying in %.1fs", self._reconnect_delay, exc_info=True)
+            finally:
+                self.connected = False
+                if connection is not None and not connection.closed:
+                    connection.close()
+            self._stop.wait(self._reconnect_delay)
+
+    def _listen(self, connection) -> None:
+        while not self._stop.is_set():
+            if select.select([connection], [], [], self._poll_interval) == ([], [], []):
+                # Idle: a round trip surfaces a dead connection instead of waiting forever.
+                connection.cursor().execute("SELECT 1")
+                continue
+            connection.poll()
+            if not connection.notifies:
+                continue
+            # Everything that arrived in this wake-up is handled as one burst.
+            payloads = []
+            for notification in connection.notifies:
+                try:
+                    payloads.append(json.loads(notification.payload))
+                except ValueError:
+                    payloads.append({})
+            del connection.notifies[:]
+            self._dispatch(payloads)
@@ -0,0 +1,295 @@
+"""Optional partitioned layout for the orders tables (``ORDERS_PARTITIONED=true``).
+
+- ``orders_clean`` is range-partitioned by ``order_date``; ``orders`` and
+  ``orders_error`` (whose dates are unvalidated text) by ``created_at``. There
+  is one partition per month, ``<table>_pYYYYMM``, plus ``<table>_default``
+  for anything outside the prepared months.
+- ``ensure_partitions`` creates the partitions up to
+  ``PARTITION_MONTHS_AHEAD`` months ahead, plus one for every month that has
+  rows waiting in the default partition, moving those rows over. It runs on
+  startup (``create_tables``) and with ``python -m app.partitions ensure``,
+  e.g. from a daily cron job.
+- Postgres only allows unique indexes that contain the partition key, so
+  ``order_id`` cannot stay unique and the writers cannot use ``ON CONFLICT
+  (order_id)``. ``upsert_sql`` replaces it with one statement that deletes
+  the stored versions whose content hash differs and inserts the new ones,
+  leaving unchanged rows alone; ``lock_sql`` first takes a transaction-scoped
+  advisory lock per order id, so two batches carrying the same new order
+  cannot both insert it. A changed row gets a new ``id`` (and ``created_at``).
+- Besides the model indexes (propagated to every partition), ``order_id`` is
+  indexed for the writers and ``orders_clean`` gets a covering
+  ``(order_date, source, status) INCLUDE (total_amount)`` index for date-range
+  reports.
+
+``python -m app.partitions migrate`` converts existing plain tables: each is
+renamed to ``<table>_legacy`` (with its indexes), the partitioned table is
+created with partitions for every month in the data, rows are copied in
+``id`` order and the ``id`` sequence is handed over, so ids and API cursors
+stay valid. Stop the consumers while it runs; ``--drop-legacy`` removes the
+old tables afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import String, text
+from sqlalchemy.dialects import postgresql
+
+from .config import get_settings
+from .db import Orders, OrdersClean, OrdersError, add_missing_columns, get_engine
+
+LOGGER = logging.getLogger("db.partitions")
+
+PARTITION_KEYS: Dict[str, str] = {"orders": "created_at", "orders_clean": "order_date", "orders_error": "created_at"}
+MODELS = {"orders": Orders, "orders_clean": OrdersClean, "orders_error": OrdersError}
+
+# Extra indexes of the partitioned layout: (name, table, definition).
+EXTRA_INDEXES = (
+    ("ix_orders_order_id", "orders", "(order_id)"),
+    ("ix_orders_clean_order_id", "orders_clean", "(order_id)"),
+    ("ix_orders_error_order_id", "orders_error", "(order_id)"),
+    ("ix_orders_clean_report", "orders_clean", "(order_date, source, status) INCLUDE (total_amount)"),
+)
+
+# First key of the two-int advisory locks taken by the writers ("ORDR").
+LOCK_NAMESPACE = 0x4F52_4452
+
+
+def lock_sql(order_ids: str) -> str:
+    """Lock every order id produced by the ``order_ids`` query, in a fixed order (no deadlocks)."""
+    return (
+        f"SELECT count(pg_advisory_xact_lock({LOCK_NAMESPACE}, hashtext(order_id))) "
+        f"FROM (SELECT DISTINCT order_id FROM ({order_ids}) AS ids ORDER BY order_id) AS locked"
+    )
+
+
+def upsert_sql(table: str, columns: Sequence[str], incoming: str) -> str:
+    """Replace-if-changed for a partitioned table; ``incoming`` selects ``columns``, one row per order id.
+
+    Both sub-statements see the table as it was before the statement, so rows
+    with an unchanged hash are neither deleted nor inserted again. The
+    statement's row count is the number of rows inserted.
+    """
+    names = ", ".join(columns)
+    return (
+        f"WITH incoming AS ({incoming}), "
+        f"stale AS (DELETE FROM {table} AS t USING incoming AS i "
+        f"WHERE t.order_id = i.order_id AND t.content_hash IS DISTINCT FROM i.content_hash) "
+        f"INSERT INTO {table} ({names}) SELECT {names} FROM incoming AS i "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {table} AS t "
+        f"WHERE t.order_id = i.order_id AND t.content_hash = i.content_hash)"
+    )
+
+
+def unnest_sql(columns: Sequence[str], params: Sequence[str], casts: Dict[str, str]) -> str:
+    """``SELECT`` turning one text array parameter per column into rows (ORM and asyncpg writers)."""
+    projection = ", ".join(
+        f"CAST({column} AS {casts[column]}) AS {column}" if column in casts else column for column in columns
+    )
+    arrays = ", ".join(f"CAST({param} AS text[])" for param in params)
+    return f"SELECT {projection} FROM unnest({arrays}) AS t({', '.join(columns)})"
+
+
+def casts_for(table: str, columns: Sequence[str]) -> Dict[str, str]:
+    """SQL type of every non-text column, to cast the text array values back."""
+    table_columns = MODELS[table].__table__.columns
+    return {
+        column: table_columns[column].type.compile(dialect=postgresql.dialect())
+        for column in columns
+        if not isinstance(table_columns[column].type, String)
+    }
+
+
+def text_columns(records: Sequence[dict], columns: Sequence[str]) -> List[List[Optional[str]]]:
+    """One list of text values per column; typed values (date, amount) are cast back in SQL."""
+    return [[None if record[column] is None else str(record[column]) for record in records] for column in columns]
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return bool(
+        connection.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+            {"table": table},
+        ).scalar()
+    )
+
+
+def _table_exists(connection, name: str) -> bool:
+    return connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def _column_ddl(table: str, column, dialect) -> str:
+    if column.name == "id":
+        return f"id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq')"
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg.text}"
+    if not column.nullable or column.name == PARTITION_KEYS[table]:
+        ddl += " NOT NULL"
+    return ddl
+
+
+def table_ddl(table: str, dialect) -> str:
+    columns = [_column_ddl(table, column, dialect) for column in MODELS[table].__table__.columns]
+    key = PARTITION_KEYS[table]
+    return (
+        f"CREATE TABLE {table} ({', '.join(columns)}, PRIMARY KEY (id, {key})) "
+        f"PARTITION BY RANGE ({key})"
+    )
+
+
+def _create_table(connection, table: str) -> None:
+    connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {table}_id_seq"))
+    connection.execute(text(table_ddl(table, connection.dialect)))
+    connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+    connection.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+    for index in MODELS[table].__table__.indexes:
+        index.create(connection)
+    for name, indexed_table, definition in EXTRA_INDEXES:
+        if indexed_table == table:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}"))
+
+
+def add_partition(connection, table: str, month: date) -> bool:
+    """Create the partition of ``month``, moving its rows out of the default partition; False if it exists."""
+    name = partition_name(table, month)
+    if _table_exists(connection, name):
+        return False
+    key, lower, upper = PARTITION_KEYS[table], month, add_months(month, 1)
+    # ATTACH re-checks the default partition; keep new rows from landing there in the meantime.
+    connection.execute(text(f"LOCK TABLE {table}_default IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {table}_default WHERE {key} >= :lower AND {key} < :upper RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"lower": lower, "upper": upper},
+    )
+    connection.execute(
+        text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    )
+    LOGGER.info("Created partition %s", name)
+    return True
+
+
+def _months_with_rows(connection, relation: str, key: str) -> List[date]:
+    rows = connection.execute(
+        text(f"SELECT DISTINCT date_trunc('month', {key})::date FROM {relation} WHERE {key} IS NOT NULL")
+    )
+    return sorted(row[0] for row in rows)
+
+
+def ensure_partitions(connection, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """Create this month's and the next ``months_ahead`` partitions, and any month waiting in a default one."""
+    current = month_start(today or date.today())
+    created = []
+    for table, key in PARTITION_KEYS.items():
+        if not is_partitioned(connection, table):
+            continue
+        months = {add_months(current, offset) for offset in range(months_ahead + 1)}
+        months.update(_months_with_rows(connection, f"{table}_default", key))
+        for month in sorted(months):
+            if add_partition(connection, table, month):
+                created.append(partition_name(table, month))
+    return created
+
+
+def create_partitioned_tables(engine, months_ahead: int) -> None:
+    """Create missing orders tables in the partitioned layout and their upcoming partitions."""
+    with engine.begin() as connection:
+        for table in PARTITION_KEYS:
+            if not _table_exists(connection, table):
+                _create_table(connection, table)
+                LOGGER.info("Created partitioned table %s", table)
+            elif not is_partitioned(connection, table):
+                LOGGER.warning(
+                    "Table %s is not partitioned although ORDERS_PARTITIONED is on; "
+                    "run `python -m app.partitions migrate`",
+                    table,
+                )
+        ensure_partitions(connection, months_ahead)
+
+
+def _column_names(table: str) -> List[str]:
+    return [column.name for column in MODELS[table].__table__.columns]
+
+
+def migrate_table(connection, table: str, drop_legacy: bool = False) -> int:
+    """Move a plain table's rows into a new partitioned table; returns the number of rows copied."""
+    legacy = f"{table}_legacy"
+    connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    # Index names (primary key and unique constraint included) must be free for the new table.
+    indexes = connection.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy})
+    for (name,) in indexes.fetchall():
+        connection.execute(text(f'ALTER INDEX "{name}" RENAME TO "{name[:56]}_legacy"'))
+
+    _create_table(connection, table)
+    for month in _months_with_rows(connection, legacy, PARTITION_KEYS[table]):
+        add_partition(connection, table, month)
+    names = _column_names(table)
+    key = PARTITION_KEYS[table]
+    # The partition key is NOT NULL now; old rows without a created_at get the migration time.
+    values = ", ".join(f"COALESCE({name}, CURRENT_TIMESTAMP)" if name == key else name for name in names)
+    copied = connection.execute(
+        text(f"INSERT INTO {table} ({', '.join(names)}) SELECT {values} FROM {legacy} ORDER BY id")
+    ).rowcount
+    connection.execute(text(f"SELECT setval('{table}_id_seq', GREATEST((SELECT max(id) FROM {table}), 1))"))
+    if drop_legacy:
+        connection.execute(text(f"DROP TABLE {legacy}"))
+    LOGGER.info("Migrated %s: %d rows copied%s", table, copied, ", legacy table dropped" if drop_legacy else "")
+    return copied
+
+
+def migrate(engine, months_ahead: int, drop_legacy: bool = False) -> Dict[str, int]:
+    """Convert every plain orders table to the partitioned layout (one transaction per table)."""
+    copied = {}
+    for table in PARTITION_KEYS:
+        with engine.begin() as connection:
+            if not _table_exists(connection, table) or is_partitioned(connection, table):
+                continue
+            copied[table] = migrate_table(connection, table, drop_legacy)
+    with engine.begin() as connection:
+        ensure_partitions(connection, months_ahead)
+    return copied
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    from .logging_conf import configure_logging
+
+    parser = argparse.ArgumentParser(description="Partitioned layout for the orders tables.")
+    parser.add_argument("command", choices=["ensure", "migrate"])
+    parser.add_argument("--drop-legacy", action="store_true", help="migrate: drop <table>_legacy afterwards")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    settings = get_settings()
+    engine = get_engine(settings)
+    if args.command == "migrate":
+        # Columns added since the tables were created must exist before the copy.
+        add_missing_columns(engine)
+        LOGGER.info("Migration done: %s", migrate(engine, settings.partition_months_ahead, args.drop_legacy))
+    else:
+        with engine.begin() as connection:
+            LOGGER.info("Partitions created: %s", ensure_partitions(connection, settings.partition_months_ahead))
+
+
+if __name__ == "__main__":
+    main()
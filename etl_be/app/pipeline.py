@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Mapping, Optional
+
+from .content_hash import ERROR_HASHED_COLUMNS, content_hash
+from .dedup import match_key
+from .mappings import RowMapper
+from .transform import CANONICAL_COLUMNS, clean_and_fix_errors, enrich_customer, normalize_order
+from .validation import validate_order
+
+if TYPE_CHECKING:
+    from .metrics import StageTimer
+
+
+@dataclass
+class ProcessedOrder:
+    """Result of running one CSV row through normalize -> clean -> enrich -> validate."""
+
+    source: str
+    raw: Dict[str, str]
+    record: Dict[str, str]
+    is_valid: bool
+    errors: List[str] = field(default_factory=list)
+    was_fixed: bool = False
+    # Upload the row came from (None for rows published outside an upload job).
+    job_id: Optional[str] = None
+
+    @property
+    def order_id(self) -> str:
+        return self.record.get("order_id", "")
+
+    @property
+    def error_reason(self) -> str:
+        return "; ".join(self.errors)
+
+    def raw_values(self) -> Dict[str, object]:
+        """Column values for an ``orders`` row."""
+        return {**self.raw, "job_id": self.job_id, "content_hash": content_hash(self.raw)}
+
+    def clean_values(self) -> Dict[str, object]:
+        """Column values for an ``orders_clean`` row (only valid for accepted orders)."""
+        record = self.record
+        return {
+            "order_id": record["order_id"],
+            "source": record["source"],
+            "order_date": date.fromisoformat(record["order_date"]) if record["order_date"] else None,
+            "customer_id": record["customer_id"],
+            "customer_name": record["customer_name"],
+            "total_amount": float(record["total_amount"]),
+            "status": record["status"],
+            "job_id": self.job_id,
+            "content_hash": content_hash(record),
+            "match_key": match_key(record),
+            # Set by the writers' dedup stage (app/dedup.py).
+            "duplicate_of": None,
+        }
+
+    def error_values(self) -> Dict[str, object]:
+        """Column values for an ``orders_error`` row."""
+        record = self.record
+        values = {
+            "order_id": record["order_id"],
+            "source": record["source"],
+            "order_date": record["order_date"],
+            "customer_id": record["customer_id"],
+            "customer_name": record["customer_name"],
+            "total_amount": record["total_amount"],
+            "status": record["status"],
+            "error_reason": self.error_reason,
+            "job_id": self.job_id,
+        }
+        values["content_hash"] = content_hash(values, ERROR_HASHED_COLUMNS)
+        return values
+
+
+def process_order(
+    source: str,
+    data: Dict[str, str],
+    timer: Optional["StageTimer"] = None,
+    customers: Optional[Mapping[str, str]] = None,
+    normalize: Optional[Callable[[Dict[str, str]], Dict[str, str]]] = None,
+) -> ProcessedOrder:
+    """Normalize, auto-fix, enrich and validate a single row without touching the database.
+
+    ``customers`` (customer_id -> reference name) is resolved for the whole
+    batch beforehand (``app.customers``); without it the enrich stage is skipped.
+    With ``timer`` the time spent in each stage is added to it. ``normalize``
+    (default ``normalize_order``) maps the row into the canonical schema.
+    """
+    if timer is not None:
+        started = perf_counter()
+    canonical = normalize(data) if normalize is not None else normalize_order(source, data)
+    raw_record = canonical.copy()
+    if timer is not None:
+        normalized = perf_counter()
+        timer.normalize += normalized - started
+
+    # Tự động sửa lỗi nếu có thể (Nếu chỉnh sửa được thì thực hiện)
+    canonical, was_fixed = clean_and_fix_errors(canonical)
+    if timer is not None:
+        cleaned = perf_counter()
+        timer.clean += cleaned - normalized
+    if customers is not None:
+        canonical, enriched = enrich_customer(canonical, customers)
+        was_fixed = was_fixed or enriched
+    if timer is not None:
+        enriched_at = perf_counter()
+        timer.enrich += enriched_at - cleaned
+    is_valid, errors = validate_order(canonical)
+    if timer is not None:
+        timer.validate += perf_counter() - enriched_at
+    return ProcessedOrder(
+        source=source,
+        raw=raw_record,
+        record=canonical,
+        is_valid=is_valid,
+        errors=errors,
+        was_fixed=was_fixed,
+    )
+
+
+def failed_order(source: str, data: object, exc: Exception) -> ProcessedOrder:
+    """Error outcome for a row that could not even be normalized (e.g. wrong JSON types)."""
+    row = data if isinstance(data, dict) else {}
+    try:
+        raw = normalize_order(source, row)
+    except Exception:
+        raw = {column: "" for column in CANONICAL_COLUMNS}
+        raw["source"] = source
+    raw = {key: "" if value is None else str(value) for key, value in raw.items()}
+    return ProcessedOrder(
+        source=source,
+        raw=raw,
+        record=raw.copy(),
+        is_valid=False,
+        errors=[f"row could not be processed: {type(exc).__name__}: {exc}"],
+    )
+
+
+def process_row(
+    source: str,
+    data: object,
+    timer: Optional["StageTimer"] = None,
+    customers: Optional[Mapping[str, str]] = None,
+) -> ProcessedOrder:
+    """Like ``process_order`` but never raises: a broken row becomes an error outcome."""
+    try:
+        return process_order(source, dict(data), timer, customers)
+    except Exception as exc:
+        return failed_order(source, data, exc)
+
+
+def process_rows(
+    source: str,
+    rows: Iterable[object],
+    timer: Optional["StageTimer"] = None,
+    customers: Optional[Mapping[str, str]] = None,
+) -> List[ProcessedOrder]:
+    """``process_row`` for the rows of one message, mapped through one ``RowMapper``."""
+    mapper = RowMapper(source)
+    orders = []
+    for data in rows:
+        try:
+            orders.append(process_order(source, dict(data), timer, customers, mapper))
+        except Exception as exc:
+            orders.append(failed_order(source, data, exc))
+    return orders
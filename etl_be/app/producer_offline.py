@@ -2,48 +2,45 @@ from __future__ import annotations
 
 import csv
 import logging
+import sys
 from pathlib import Path
-
-import pika
+from typing import Optional
 
 from .config import get_settings
 from .logging_conf import configure_logging
-from .utils import json_dumps
+from .publisher import PublishResult, close_publisher, get_publisher
 
 LOGGER = logging.getLogger("producer.offline")
 
 
-def publish_csv(path: Path) -> None:
+def publish_csv(path: Path, rows_per_message: Optional[int] = None) -> PublishResult:
+    """Publish every row of ``path`` and log what the broker took (confirmed, with publisher confirms)."""
     settings = get_settings()
-    configure_logging()
-
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=settings.rabbitmq_host,
-            port=settings.rabbitmq_port,
-            credentials=pika.PlainCredentials(settings.rabbitmq_user, settings.rabbitmq_password),
-        )
-    )
-    channel = connection.channel()
-    channel.queue_declare(queue=settings.rabbitmq_queue, durable=True)
+    configure_logging(settings=settings)
 
     with path.open(encoding="utf-8") as handle:
-        reader = csv.DictReader(handle)
-        for row in reader:
-            payload = {"source": "offline", "table": "orders", "data": row}
-            channel.basic_publish(
-                exchange="",
-                routing_key=settings.rabbitmq_queue,
-                body=json_dumps(payload),
-                properties=pika.BasicProperties(delivery_mode=2),
-            )
-            LOGGER.info("Published offline order %s", row.get("order_id"))
-
-    connection.close()
+        result = get_publisher(settings).publish_rows("offline", csv.DictReader(handle), rows_per_message)
+    if result.confirmed is None:
+        LOGGER.info("Published %d offline rows from %s (no publisher confirms)", result.published, path)
+    else:
+        LOGGER.info(
+            "Published %d offline rows from %s: %d confirmed, %d failed",
+            result.published,
+            path,
+            result.confirmed,
+            result.failed,
+        )
+    return result
 
 
 if __name__ == "__main__":
     settings = get_settings()
     csv_path = settings.upload_dir / "offline_orders.csv"
-    publish_csv(csv_path)
-
+    try:
+        outcome = publish_csv(csv_path)
+    finally:
+        close_publisher()
+    if outcome.confirmed is not None and outcome.confirmed < outcome.published:
+        unconfirmed = outcome.published - outcome.confirmed
+        LOGGER.error("%d of %d rows were not confirmed by RabbitMQ", unconfirmed, outcome.published)
+        sys.exit(1)
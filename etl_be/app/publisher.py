@@ -0,0 +1,516 @@
+"""Shared RabbitMQ publishers.
+
+``PublisherPool`` is a bounded pool of long-lived connections/channels:
+opening a ``BlockingConnection`` per upload makes connection setup dominate
+and trips RabbitMQ's connection-churn alarms. The pool keeps up to
+``publisher_pool_size`` connections open, declares the queue once per
+connection, services heartbeats on idle connections from a background thread
+and transparently reconnects when a connection has died.
+
+``ConfirmingPublisher`` is used instead when ``publisher_confirms`` is on. It
+runs one asynchronous connection in publisher-confirm mode on an IO thread and
+keeps up to ``publisher_confirm_window`` messages in flight, so uploads get a
+broker guarantee without waiting for one round-trip per message. Nacked or
+returned messages are retried up to ``publisher_max_retries`` times.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import pika
+from pika.adapters.select_connection import IOLoop
+from pika.exceptions import AMQPError
+
+from .config import Settings, get_settings
+from .metrics import PUBLISHED_ROWS
+from .routing import FRESH_PRIORITY, declare_lanes, declare_lanes_async, routing_key
+from .utils import JSON_CODEC, Codec, get_codec
+
+LOGGER = logging.getLogger("publisher")
+
+BATCH_ENVELOPE_VERSION = 2
+POSITIONAL_ENVELOPE_VERSION = 3
+
+
+class PublishError(RuntimeError):
+    """The broker could not take or confirm messages in time."""
+
+
+@dataclass
+class PublishResult:
+    published: int
+    confirmed: Optional[int] = None
+    failed: Optional[int] = None
+
+    def as_dict(self) -> Dict[str, int]:
+        return {key: value for key, value in vars(self).items() if value is not None}
+
+
+class Envelope(NamedTuple):
+    body: bytes
+    rows: int
+
+
+def message_properties(codec: Codec, **extra) -> pika.BasicProperties:
+    """Persistent, fresh-priority properties announcing the body's codec."""
+    return pika.BasicProperties(delivery_mode=2, priority=FRESH_PRIORITY, content_type=codec.content_type, **extra)
+
+
+def positional_rows(batch: List[Dict[str, object]]) -> Tuple[List[str], List[List[object]]]:
+    """Column names (in first-seen order) and one value list per row; absent columns become None."""
+    columns = list(dict.fromkeys(key for row in batch for key in row))
+    width = len(columns)
+    values = [
+        list(row.values()) if len(row) == width and list(row) == columns else [row.get(key) for key in columns]
+        for row in batch
+    ]
+    return columns, values
+
+
+def row_envelopes(
+    source: str,
+    rows: Iterable[Dict[str, object]],
+    rows_per_message: int = 1,
+    job_id: Optional[str] = None,
+    codec: Codec = JSON_CODEC,
+    positional: bool = False,
+) -> Iterator[Envelope]:
+    """Encode rows as single-row ``{"data": row}`` envelopes or batched ``{"v": 2, "rows": [...]}`` ones.
+
+    With ``positional`` a batch is sent as ``{"v": 3, "columns": [...], "rows": [[...], ...]}``,
+    naming the columns once per message. ``job_id`` (the upload job, see ``app.jobs``) is added
+    to every envelope when given.
+    """
+    header = {"source": source, "table": "orders"}
+    if job_id is not None:
+        header["job_id"] = job_id
+    dumps = codec.dumps
+    if rows_per_message <= 1:
+        for row in rows:
+            yield Envelope(dumps({**header, "data": row}), 1)
+        return
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, rows_per_message))
+        if not batch:
+            return
+        if positional:
+            columns, values = positional_rows(batch)
+            body = dumps({"v": POSITIONAL_ENVELOPE_VERSION, **header, "columns": columns, "rows": values})
+        else:
+            body = dumps({"v": BATCH_ENVELOPE_VERSION, **header, "rows": batch})
+        yield Envelope(body, len(batch))
+
+
+def connection_parameters(settings: Settings) -> pika.ConnectionParameters:
+    return pika.ConnectionParameters(
+        host=settings.rabbitmq_host,
+        port=settings.rabbitmq_port,
+        credentials=pika.PlainCredentials(settings.rabbitmq_user, settings.rabbitmq_password),
+        heartbeat=settings.rabbitmq_heartbeat,
+        blocked_connection_timeout=settings.rabbitmq_heartbeat * 2,
+    )
+
+
+class PooledChannel:
+    """One connection plus its channel, with the exchange and lane queues already declared."""
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.properties = message_properties(get_codec(settings.message_codec))
+        self.connect()
+
+    def connect(self) -> None:
+        self.connection = pika.BlockingConnection(connection_parameters(self.settings))
+        self.channel = self.connection.channel()
+        declare_lanes(self.channel, self.settings)
+
+    def reconnect(self) -> None:
+        self.close()
+        self.connect()
+
+    def publish(self, body: bytes, routing_key: str) -> None:
+        """Publish a persistent message, reconnecting once if the connection has died."""
+        exchange = self.settings.rabbitmq_exchange
+        properties = self.properties
+        try:
+            self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+        except AMQPError:
+            LOGGER.warning("Publisher connection lost, reconnecting", exc_info=True)
+            self.reconnect()
+            self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection.is_open and self.channel.is_open
+
+    def service(self) -> bool:
+        """Process pending frames (heartbeats, closes). Returns False if the connection is dead."""
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except AMQPError:
+            return False
+        return self.is_open
+
+    def close(self) -> None:
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except AMQPError:
+            LOGGER.debug("Ignoring error while closing publisher connection", exc_info=True)
+
+
+class PublisherPool:
+    def __init__(self, settings: Settings, size: Optional[int] = None) -> None:
+        self.settings = settings
+        self.size = max(1, size or settings.publisher_pool_size)
+        self.codec = get_codec(settings.message_codec)
+        self._idle: "queue.LifoQueue[PooledChannel]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = threading.Event()
+        self._keepalive = threading.Thread(target=self._keepalive_loop, name="publisher-keepalive", daemon=True)
+        self._keepalive.start()
+
+    def _checkout(self) -> PooledChannel:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return PooledChannel(self.settings)
+            if pooled.service():
+                return pooled
+            LOGGER.info("Dropping dead publisher connection")
+            pooled.close()
+
+    @contextmanager
+    def channel(self) -> Iterator[PooledChannel]:
+        """Borrow a live channel; it is returned to the pool unless it broke while in use."""
+        if self._closed.is_set():
+            raise RuntimeError("Publisher pool is closed")
+        self._slots.acquire()
+        pooled: Optional[PooledChannel] = None
+        try:
+            pooled = self._checkout()
+            yield pooled
+        except AMQPError:
+            if pooled is not None:
+                pooled.close()
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                if pooled.is_open and not self._closed.is_set():
+                    self._idle.put(pooled)
+                else:
+                    pooled.close()
+            self._slots.release()
+
+    def publish_envelopes(self, envelopes: Iterable[Envelope], routing_key: Optional[str] = None) -> PublishResult:
+        """Fire-and-forget publish; ``published`` counts rows, not messages."""
+        routing_key = routing_key or self.settings.rabbitmq_queue
+        count = 0
+        with self.channel() as pooled:
+            for envelope in envelopes:
+                pooled.publish(envelope.body, routing_key)
+                count += envelope.rows
+        return PublishResult(published=count)
+
+    def publish_rows(
+        self,
+        source: str,
+        rows: Iterable[Dict[str, object]],
+        rows_per_message: Optional[int] = None,
+        job_id: Optional[str] = None,
+    ) -> PublishResult:
+        rows_per_message = rows_per_message or self.settings.publisher_rows_per_message
+        positional = self.settings.message_positional_rows
+        envelopes = row_envelopes(source, rows, rows_per_message, job_id, self.codec, positional)
+        result = self.publish_envelopes(envelopes, routing_key(self.settings, source))
+        PUBLISHED_ROWS.labels(source=source).inc(result.published)
+        return result
+
+    def _keepalive_loop(self) -> None:
+        interval = max(self.settings.rabbitmq_heartbeat / 2, 1)
+        while not self._closed.wait(interval):
+            alive = []
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if pooled.service():
+                    alive.append(pooled)
+                else:
+                    pooled.close()
+            for pooled in alive:
+                self._idle.put(pooled)
+
+    def close(self) -> None:
+        self._closed.set()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class _Tracker:
+    """Counts the outcome of one ``publish_bodies`` call."""
+
+    def __init__(self) -> None:
+        self.published = 0
+        self.confirmed = 0
+        self.failed = 0
+        self._settled = threading.Condition()
+
+    def add(self, rows: int) -> None:
+        with self._settled:
+            self.published += rows
+
+    def settle(self, ok: bool, rows: int) -> None:
+        with self._settled:
+            if ok:
+                self.confirmed += rows
+            else:
+                self.failed += rows
+            self._settled.notify_all()
+
+    def wait(self, timeout: float) -> bool:
+        with self._settled:
+            return self._settled.wait_for(lambda: self.confirmed + self.failed >= self.published, timeout)
+
+    def result(self) -> PublishResult:
+        """Snapshot; anything still unconfirmed is reported as failed."""
+        with self._settled:
+            unconfirmed = self.published - self.confirmed - self.failed
+            return PublishResult(self.published, self.confirmed, self.failed + unconfirmed)
+
+
+class _Message:
+    __slots__ = ("message_id", "body", "rows", "routing_key", "tracker", "attempts", "returned")
+
+    def __init__(self, message_id: str, envelope: Envelope, routing_key: str, tracker: _Tracker) -> None:
+        self.message_id = message_id
+        self.body = envelope.body
+        self.rows = envelope.rows
+        self.routing_key = routing_key
+        self.tracker = tracker
+        self.attempts = 0
+        self.returned = False
+
+
+class ConfirmingPublisher:
+    """Pipelined publishing with publisher confirms over one async connection.
+
+    Caller threads hand messages to the IO thread through a thread-safe queue;
+    a semaphore bounds how many are unconfirmed at any time. All channel work
+    happens on the IO thread, so no pika object is shared across threads.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.codec = get_codec(settings.message_codec)
+        self.window = max(1, settings.publisher_confirm_window)
+        self.max_retries = settings.publisher_max_retries
+        self.timeout = settings.publisher_confirm_timeout
+        self._slots = threading.BoundedSemaphore(self.window)
+        self._submitted: "queue.SimpleQueue[_Message]" = queue.SimpleQueue()
+        self._backlog: List[_Message] = []
+        self._outstanding: Dict[int, _Message] = {}
+        self._by_id: Dict[str, _Message] = {}
+        self._ids = itertools.count(1)
+        self._delivery_tag = 0
+        self._connection: Optional[pika.SelectConnection] = None
+        self._channel = None
+        self._ready = False
+        self._stopping = False
+        self._ioloop = IOLoop()
+        self._thread = threading.Thread(target=self._run, name="publisher-confirms", daemon=True)
+        self._thread.start()
+
+    # caller threads --------------------------------------------------------
+    def publish_envelopes(self, envelopes: Iterable[Envelope], routing_key: Optional[str] = None) -> PublishResult:
+        """Publish and wait for confirms; counts are in rows, not messages."""
+        routing_key = routing_key or self.settings.rabbitmq_queue
+        tracker = _Tracker()
+        for envelope in envelopes:
+            if not self._slots.acquire(timeout=self.timeout):
+                raise PublishError(f"No publisher confirm received for {self.timeout}s; is RabbitMQ reachable?")
+            tracker.add(envelope.rows)
+            self._submitted.put(_Message(str(next(self._ids)), envelope, routing_key, tracker))
+            self._ioloop.add_callback_threadsafe(self._drain)
+        if not tracker.wait(self.timeout):
+            LOGGER.warning("Timed out waiting for publisher confirms; counting unconfirmed messages as failed")
+        return tracker.result()
+
+    def publish_rows(
+        self,
+        source: str,
+        rows: Iterable[Dict[str, object]],
+        rows_per_message: Optional[int] = None,
+        job_id: Optional[str] = None,
+    ) -> PublishResult:
+        rows_per_message = rows_per_message or self.settings.publisher_rows_per_message
+        positional = self.settings.message_positional_rows
+        envelopes = row_envelopes(source, rows, rows_per_message, job_id, self.codec, positional)
+        result = self.publish_envelopes(envelopes, routing_key(self.settings, source))
+        PUBLISHED_ROWS.labels(source=source).inc(result.confirmed or 0)
+        return result
+
+    def close(self) -> None:
+        self._ioloop.add_callback_threadsafe(self._shutdown)
+        self._thread.join(timeout=5)
+
+    # IO thread -------------------------------------------------------------
+    def _run(self) -> None:
+        self._connect()
+        self._ioloop.start()
+        self._ioloop.close()
+
+    def _connect(self) -> None:
+        if self._stopping:
+            return
+        self._connection = pika.SelectConnection(
+            connection_parameters(self.settings),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._ioloop,
+        )
+
+    def _on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, _connection, error: BaseException) -> None:
+        LOGGER.warning("Publisher connection failed (%s), retrying", error)
+        self._ioloop.call_later(self.settings.publisher_reconnect_delay, self._connect)
+
+    def _on_connection_closed(self, _connection, reason: BaseException) -> None:
+        self._ready = False
+        self._channel = None
+        # Whatever was in flight has an unknown fate: publish it again once reconnected.
+        for tag in sorted(self._outstanding):
+            self._retry_or_fail(self._outstanding.pop(tag))
+        if self._stopping:
+            self._ioloop.stop()
+            return
+        LOGGER.warning("Publisher connection closed (%s), reconnecting", reason)
+        self._ioloop.call_later(self.settings.publisher_reconnect_delay, self._connect)
+
+    def _on_channel_open(self, channel) -> None:
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.add_on_return_callback(self._on_return)
+        declare_lanes_async(
+            channel,
+            self.settings,
+            lambda: channel.confirm_delivery(self._on_confirmation, callback=self._on_confirm_mode),
+        )
+
+    def _on_confirm_mode(self, _frame) -> None:
+        self._delivery_tag = 0
+        self._ready = True
+        self._drain()
+
+    def _on_channel_closed(self, _channel, reason: BaseException) -> None:
+        LOGGER.warning("Publisher channel closed: %s", reason)
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                self._backlog.append(self._submitted.get_nowait())
+            except queue.Empty:
+                break
+        if not self._ready:
+            return
+        backlog, self._backlog = self._backlog, []
+        for message in backlog:
+            self._send(message)
+
+    def _send(self, message: _Message) -> None:
+        message.attempts += 1
+        message.returned = False
+        self._channel.basic_publish(
+            exchange=self.settings.rabbitmq_exchange,
+            routing_key=message.routing_key,
+            body=message.body,
+            properties=message_properties(self.codec, message_id=message.message_id),
+            mandatory=True,
+        )
+        self._delivery_tag += 1
+        self._outstanding[self._delivery_tag] = message
+        self._by_id[message.message_id] = message
+
+    def _on_return(self, _channel, method, properties, _body) -> None:
+        message = self._by_id.get(properties.message_id)
+        if message is not None:
+            LOGGER.warning("Message %s returned by broker: %s", message.message_id, method.reply_text)
+            message.returned = True
+
+    def _on_confirmation(self, frame) -> None:
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = [tag for tag in self._outstanding if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._outstanding else []
+        for tag in sorted(tags):
+            message = self._outstanding.pop(tag)
+            if acked and not message.returned:
+                self._finish(message, True)
+            else:
+                self._retry_or_fail(message)
+
+    def _retry_or_fail(self, message: _Message) -> None:
+        self._by_id.pop(message.message_id, None)
+        if message.attempts <= self.max_retries:
+            self._backlog.append(message)
+            if self._ready:
+                self._drain()
+        else:
+            LOGGER.error("Giving up on message %s after %d attempts", message.message_id, message.attempts)
+            self._finish(message, False)
+
+    def _finish(self, message: _Message, ok: bool) -> None:
+        self._by_id.pop(message.message_id, None)
+        self._slots.release()
+        message.tracker.settle(ok, message.rows)
+
+    def _shutdown(self) -> None:
+        self._stopping = True
+        if self._connection is not None and not (self._connection.is_closed or self._connection.is_closing):
+            self._connection.close()
+        else:
+            self._ioloop.stop()
+
+
+Publisher = Union[PublisherPool, ConfirmingPublisher]
+
+_publisher: Optional[Publisher] = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher(settings: Optional[Settings] = None) -> Publisher:
+    """Return the process-wide publisher, creating it on first use."""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            settings = settings or get_settings()
+            _publisher = ConfirmingPublisher(settings) if settings.publisher_confirms else PublisherPool(settings)
+        return _publisher
+
+
+def close_publisher() -> None:
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.close()
+            _publisher = None
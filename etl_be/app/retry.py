@@ -0,0 +1,286 @@
+"""Bounded retries, parking and the database circuit breaker for the consumers.
+
+A message that fails on its own is never requeued in place (``<queue>`` is
+the lane queue it was consumed from, see ``app.routing``):
+
+- attempt ``n`` (1..``consumer_max_retries``) is republished to the delay queue
+  ``<queue>.retry.<delay>ms`` with ``delay = base * 2**(n - 1)``; the queue's
+  ``x-message-ttl`` is that delay and its dead-letter target is the main queue,
+  so the broker hands the message back after the backoff without anyone
+  polling (the delay is in the name so a new base delay never clashes with
+  the arguments of an existing queue); retries come back with
+  ``RETRY_PRIORITY`` so on the priority lane they yield to fresh orders;
+- once retries are exhausted, or straight away when the body cannot be
+  decoded, it goes to ``<queue>.parked`` with the reason in its headers, where
+  ``GET /parked`` shows it and ``POST /parked/replay`` sends it back.
+
+The retry count travels in the ``x-retry-count`` header. Transient database
+errors (lost connection, server restarting, too many connections; told apart
+by SQLSTATE, not exception class) are not the message's fault: the consumer
+keeps the messages unacked and pauses behind ``CircuitBreaker`` instead of
+retrying them, at most ``db_breaker_max_pauses`` times per batch before the
+batch is treated like any other failure (bisected, retried, parked).
+"""
+from __future__ import annotations
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pika
+from sqlalchemy import exc as sa_exc
+
+from .metrics import CIRCUIT_OPEN, PARKED_MESSAGES, RETRIED_MESSAGES
+from .routing import RETRY_PRIORITY
+from .utils import decode_body
+
+LOGGER = logging.getLogger("consumer.retry")
+
+RETRY_HEADER = "x-retry-count"
+ERROR_HEADER = "x-last-error"
+PARKED_AT_HEADER = "x-parked-at"
+ORIGIN_HEADER = "x-original-queue"
+_MAX_ERROR_LENGTH = 500
+
+
+class MalformedMessage(ValueError):
+    """The message body is not a valid envelope; retrying cannot help."""
+
+
+def retry_delay_ms(attempt: int, base_ms: int) -> int:
+    return base_ms * 2 ** (attempt - 1)
+
+
+def retry_queue(queue: str, attempt: int, base_ms: int) -> str:
+    return f"{queue}.retry.{retry_delay_ms(attempt, base_ms)}ms"
+
+
+def parking_queue(queue: str) -> str:
+    return f"{queue}.parked"
+
+
+def retry_queue_arguments(queue: str, attempt: int, base_ms: int) -> Dict[str, Any]:
+    return {
+        "x-message-ttl": retry_delay_ms(attempt, base_ms),
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": queue,
+    }
+
+
+def retry_queues(settings, queue: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """(name, arguments) of every delay queue of ``queue`` for the configured retry budget."""
+    base_ms = settings.consumer_retry_base_delay_ms
+    return [
+        (retry_queue(queue, attempt, base_ms), retry_queue_arguments(queue, attempt, base_ms))
+        for attempt in range(1, settings.consumer_max_retries + 1)
+    ]
+
+
+def declare_retry_topology(channel, settings, queue: str) -> None:
+    """Declare the delay queues and the parking queue of ``queue`` (pika ``BlockingChannel``)."""
+    for name, arguments in retry_queues(settings, queue):
+        channel.queue_declare(queue=name, durable=True, arguments=arguments)
+    channel.queue_declare(queue=parking_queue(queue), durable=True)
+
+
+def retry_count(headers: Optional[Dict[str, Any]]) -> int:
+    try:
+        return int((headers or {}).get(RETRY_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def describe_error(exc: BaseException) -> str:
+    return f"{type(exc).__name__}: {exc}"[:_MAX_ERROR_LENGTH]
+
+
+def next_route(
+    settings, queue: str, headers: Optional[Dict[str, Any]], exc: BaseException
+) -> Tuple[str, Dict[str, Any]]:
+    """Routing key and headers for a failed message: the next delay queue or the parking queue."""
+    attempt = retry_count(headers) + 1
+    new_headers = {**(headers or {}), RETRY_HEADER: attempt, ERROR_HEADER: describe_error(exc)}
+    if isinstance(exc, MalformedMessage) or attempt > settings.consumer_max_retries:
+        new_headers[PARKED_AT_HEADER] = datetime.now(timezone.utc).isoformat()
+        new_headers[ORIGIN_HEADER] = queue
+        return parking_queue(queue), new_headers
+    return retry_queue(queue, attempt, settings.consumer_retry_base_delay_ms), new_headers
+
+
+def log_route(queue: str, routing_key: str, headers: Dict[str, Any]) -> None:
+    if routing_key == parking_queue(queue):
+        PARKED_MESSAGES.inc()
+        LOGGER.error("Parked message after %d attempts: %s", headers[RETRY_HEADER], headers[ERROR_HEADER])
+    else:
+        RETRIED_MESSAGES.inc()
+        LOGGER.warning("Retrying message via %s: %s", routing_key, headers[ERROR_HEADER])
+
+
+def retry_or_park(
+    channel,
+    settings,
+    queue: str,
+    body: bytes,
+    headers: Optional[Dict[str, Any]],
+    exc: BaseException,
+    content_type: Optional[str] = None,
+) -> str:
+    """Republish a failed message to its next queue, keeping its content type (the caller acks the original)."""
+    routing_key, new_headers = next_route(settings, queue, headers, exc)
+    channel.basic_publish(
+        exchange="",
+        routing_key=routing_key,
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            priority=RETRY_PRIORITY,
+            headers=new_headers,
+            content_type=content_type,
+        ),
+    )
+    log_route(queue, routing_key, new_headers)
+    return routing_key
+
+
+# SQLSTATEs of an unavailable server rather than a bad statement: admin/crash shutdown, "starting up",
+# too many connections (class 08, connection exceptions, is matched by prefix).
+_TRANSIENT_SQLSTATES = {"57P01", "57P02", "57P03", "53300"}
+
+
+def is_transient_sqlstate(code: str) -> bool:
+    return code.startswith("08") or code in _TRANSIENT_SQLSTATES
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Database/network errors worth waiting out rather than counting against the message.
+
+    Postgres reports data-caused failures (division by zero, numeric overflow,
+    statement timeout, deadlock, serialization failure) as OperationalError
+    too, so a server error is judged by its SQLSTATE; only an error without
+    one (the client lost or never got a connection) is assumed transient.
+    """
+    if isinstance(exc, sa_exc.DisconnectionError):
+        return True
+    if isinstance(exc, sa_exc.DBAPIError):
+        if exc.connection_invalidated:
+            return True
+        code = getattr(exc.orig, "pgcode", None) or getattr(exc.orig, "sqlstate", None)
+        if code:
+            return is_transient_sqlstate(code)
+        return isinstance(exc, (sa_exc.OperationalError, sa_exc.InterfaceError))
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    # asyncpg, without importing it here: server errors carry .sqlstate; client-side
+    # InterfaceErrors (connection closed or lost) have none.
+    if type(exc).__module__.startswith("asyncpg"):
+        code = getattr(exc, "sqlstate", None)
+        if code:
+            return is_transient_sqlstate(code)
+        return any(cls.__name__ == "InterfaceError" for cls in type(exc).__mro__)
+    return False
+
+
+class CircuitBreaker:
+    """Pause consumption while the database is unreachable.
+
+    Each consecutive transient failure opens the breaker for twice as long
+    (``base_delay`` up to ``max_delay``); the next attempt is the half-open
+    probe, and a success closes it again.
+    """
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    @property
+    def remaining(self) -> float:
+        return max(self.open_until - time.monotonic(), 0.0)
+
+    def record_failure(self, exc: BaseException) -> float:
+        """Open the breaker; returns how long consumption should pause."""
+        self.failures += 1
+        delay = min(self.base_delay * 2 ** (self.failures - 1), self.max_delay)
+        self.open_until = time.monotonic() + delay
+        CIRCUIT_OPEN.set(1)
+        LOGGER.warning("Database unavailable (%s), pausing consumption for %.1fs", describe_error(exc), delay)
+        return delay
+
+    def record_success(self) -> None:
+        if self.failures:
+            LOGGER.info("Database reachable again, circuit closed after %d failures", self.failures)
+            CIRCUIT_OPEN.set(0)
+        self.failures = 0
+        self.open_until = 0.0
+
+
+def _parked_item(properties, body: bytes) -> Dict[str, Any]:
+    headers = dict(properties.headers or {})
+    try:
+        payload: Any = decode_body(body, properties.content_type)
+    except ValueError:
+        payload = body.decode("utf-8", errors="replace")
+    return {
+        "retry_count": retry_count(headers),
+        "error": headers.get(ERROR_HEADER),
+        "parked_at": headers.get(PARKED_AT_HEADER),
+        "message": payload,
+    }
+
+
+def peek_parked(channel, queue: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Up to ``limit`` parked messages (left in place) and the parking queue depth."""
+    parked = parking_queue(queue)
+    depth = channel.queue_declare(queue=parked, durable=True, passive=True).method.message_count
+    items: List[Dict[str, Any]] = []
+    last_tag = None
+    for _ in range(min(limit, depth)):
+        method, properties, body = channel.basic_get(parked, auto_ack=False)
+        if method is None:
+            break
+        items.append(_parked_item(properties, body))
+        last_tag = method.delivery_tag
+    if last_tag is not None:
+        channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+    return items, depth
+
+
+def replay_parked(
+    channel, queue: str, limit: int, on_replay: Optional[Callable[[bytes, Optional[str]], None]] = None
+) -> int:
+    """Move up to ``limit`` parked messages back to ``queue`` with a fresh retry budget.
+
+    ``on_replay(body, content_type)`` is called for each message once it is back on ``queue``.
+    """
+    parked = parking_queue(queue)
+    replayed = 0
+    while replayed < limit:
+        method, properties, body = channel.basic_get(parked, auto_ack=False)
+        if method is None:
+            break
+        headers = {
+            key: value
+            for key, value in (properties.headers or {}).items()
+            if key not in (RETRY_HEADER, ERROR_HEADER, PARKED_AT_HEADER, ORIGIN_HEADER)
+        }
+        channel.basic_publish(
+            exchange="",
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(
+                delivery_mode=2, priority=RETRY_PRIORITY, headers=headers or None, content_type=properties.content_type
+            ),
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        if on_replay is not None:
+            on_replay(body, properties.content_type)
+        replayed += 1
+    if replayed:
+        LOGGER.info("Replayed %d parked messages to %s", replayed, queue)
+    return replayed
@@ -0,0 +1,235 @@
+"""Order aggregates maintained as each batch commits, and the reads behind ``GET /stats``.
+
+``orders_daily_stats`` holds the count and revenue of ``orders_clean`` per
+``(order_date, source, status)``; ``orders_error_stats`` counts
+``orders_error`` per ``(source, error_reason)``. Every writer (ORM and asyncpg
+consumers, bulk loader) wraps each table's upsert in two set-based statements
+for the batch's order ids, in the same transaction:
+
+1. *retract*: subtract what those orders currently contribute,
+2. upsert the batch,
+3. *apply*: add what they contribute now.
+
+The net delta is exactly new minus old, whatever the upsert did -- a new
+order, a changed amount or status (the order moves between groups), or an
+unchanged row skipped by its content hash. The per-order advisory locks taken
+before (``db.lock_orders``) make sure no other writer changes those orders in
+between. Groups that drop to zero are kept and filtered out on read. Clean
+rows flagged as cross-source duplicates (``duplicate_of``, app/dedup.py) are
+not counted.
+
+``python -m app.rollups rebuild`` recomputes both tables from scratch; it runs
+automatically when ``create_tables`` first creates them.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select, text
+
+from .config import get_settings
+from .db import OrdersClean, OrdersDailyStats, OrdersError, OrdersErrorStats, get_engine
+from .logging_conf import configure_logging
+
+LOGGER = logging.getLogger("rollups")
+
+ROLLUP_TABLES = (OrdersDailyStats.__tablename__, OrdersErrorStats.__tablename__)
+
+# Source table -> (rollup table, group columns, "aggregate column = expression" pairs, row filter).
+ROLLUPS: Dict[str, Tuple[str, Sequence[str], Sequence[Tuple[str, str]], str]] = {
+    "orders_clean": (
+        "orders_daily_stats",
+        ("order_date", "source", "status"),
+        (("order_count", "count(*)"), ("total_amount", "sum(total_amount)")),
+        # Cross-source duplicates (app/dedup.py) are counted once, under their primary order.
+        "duplicate_of IS NULL",
+    ),
+    "orders_error": (
+        "orders_error_stats",
+        ("source", "error_reason"),
+        (("error_count", "count(*)"),),
+        "TRUE",
+    ),
+}
+
+
+def delta_sql(table: str, order_ids: str, sign: int) -> str:
+    """Add (``sign=1``) or subtract (``-1``) the rows of ``table`` whose order id is selected by ``order_ids``."""
+    rollup, keys, aggregates, condition = ROLLUPS[table]
+    # order_date is NOT NULL in orders_clean; the other keys use '' for NULL.
+    groups = [key if key == "order_date" else f"COALESCE({key}, '')" for key in keys]
+    columns = ", ".join((*keys, *(column for column, _ in aggregates)))
+    values = ", ".join((*groups, *(f"{sign} * {expression}" for _, expression in aggregates)))
+    updates = ", ".join(f"{column} = r.{column} + EXCLUDED.{column}" for column, _ in aggregates)
+    positions = ", ".join(str(i) for i in range(1, len(keys) + 1))
+    # Rows are upserted (and their row locks taken) in output order: sorting by the group keys makes
+    # every writer lock the hot rollup rows in the same order, so two batches cannot deadlock on them.
+    return (
+        f"INSERT INTO {rollup} AS r ({columns}) "
+        f"SELECT {values} FROM {table} WHERE order_id IN ({order_ids}) AND {condition} "
+        f"GROUP BY {positions} ORDER BY {positions} "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+
+
+def delta_statements(order_ids: str) -> Dict[str, Tuple[str, str]]:
+    """``(retract, apply)`` per rolled-up table, for the order ids selected by ``order_ids``."""
+    return {table: (delta_sql(table, order_ids, -1), delta_sql(table, order_ids, 1)) for table in ROLLUPS}
+
+
+# SQLAlchemy sessions (consumer_orders.write_orders).
+SESSION_DELTAS = delta_statements("SELECT unnest(CAST(:ids AS text[]))")
+
+
+def retract_from_rollups(session, table: str, order_ids: Sequence[str]) -> None:
+    if table in SESSION_DELTAS and order_ids:
+        session.execute(text(SESSION_DELTAS[table][0]), {"ids": list(order_ids)})
+
+
+def add_to_rollups(session, table: str, order_ids: Sequence[str]) -> None:
+    if table in SESSION_DELTAS and order_ids:
+        session.execute(text(SESSION_DELTAS[table][1]), {"ids": list(order_ids)})
+
+
+def rebuild(engine) -> None:
+    """Recompute both rollups from ``orders_clean`` and ``orders_error`` in one transaction."""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Waits for in-flight batches and holds new ones until the rollups are consistent again.
+            connection.execute(text("LOCK TABLE orders_clean, orders_error IN SHARE MODE"))
+        connection.execute(delete(OrdersDailyStats))
+        connection.execute(delete(OrdersErrorStats))
+        clean_keys = (
+            OrdersClean.order_date,
+            func.coalesce(OrdersClean.source, ""),
+            func.coalesce(OrdersClean.status, ""),
+        )
+        connection.execute(
+            insert(OrdersDailyStats).from_select(
+                ["order_date", "source", "status", "order_count", "total_amount"],
+                select(*clean_keys, func.count(), func.sum(OrdersClean.total_amount))
+                .where(OrdersClean.duplicate_of.is_(None))
+                .group_by(*clean_keys),
+            )
+        )
+        error_keys = (func.coalesce(OrdersError.source, ""), func.coalesce(OrdersError.error_reason, ""))
+        connection.execute(
+            insert(OrdersErrorStats).from_select(
+                ["source", "error_reason", "error_count"],
+                select(*error_keys, func.count()).group_by(*error_keys),
+            )
+        )
+    LOGGER.info("Rebuilt %s", ", ".join(ROLLUP_TABLES))
+
+
+def _amount(value) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def daily_stats(
+    engine,
+    source: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """Orders and revenue per day, source and status, oldest day first."""
+    stats = OrdersDailyStats
+    stmt = select(stats.order_date, stats.source, stats.status, stats.order_count, stats.total_amount).where(
+        stats.order_count > 0
+    )
+    if source:
+        stmt = stmt.where(stats.source == source)
+    if status:
+        stmt = stmt.where(stats.status == status)
+    if date_from:
+        stmt = stmt.where(stats.order_date >= date_from)
+    if date_to:
+        stmt = stmt.where(stats.order_date <= date_to)
+    stmt = stmt.order_by(stats.order_date, stats.source, stats.status)
+    with engine.connect() as connection:
+        rows = connection.execute(stmt).all()
+    return [
+        {
+            "order_date": row.order_date.isoformat(),
+            "source": row.source,
+            "status": row.status,
+            "orders": row.order_count,
+            "revenue": _amount(row.total_amount),
+        }
+        for row in rows
+    ]
+
+
+def source_summary(engine) -> Dict[str, Any]:
+    """Clean orders, revenue, errors and error rate per source, plus the overall totals."""
+    clean = (
+        select(
+            OrdersDailyStats.source,
+            func.sum(OrdersDailyStats.order_count),
+            func.sum(OrdersDailyStats.total_amount),
+        )
+        .where(OrdersDailyStats.order_count > 0)
+        .group_by(OrdersDailyStats.source)
+    )
+    errors = (
+        select(OrdersErrorStats.source, func.sum(OrdersErrorStats.error_count))
+        .where(OrdersErrorStats.error_count > 0)
+        .group_by(OrdersErrorStats.source)
+    )
+    with engine.connect() as connection:
+        clean_rows = connection.execute(clean).all()
+        error_rows = dict(connection.execute(errors).all())
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    for source, orders, revenue in clean_rows:
+        summary[source] = {"source": source, "orders": int(orders), "revenue": _amount(revenue), "errors": 0}
+    for source, count in error_rows.items():
+        summary.setdefault(source, {"source": source, "orders": 0, "revenue": 0.0, "errors": 0})["errors"] = int(count)
+
+    def with_rate(item: Dict[str, Any]) -> Dict[str, Any]:
+        seen = item["orders"] + item["errors"]
+        return {**item, "error_rate": round(item["errors"] / seen, 4) if seen else 0.0}
+
+    sources = [with_rate(summary[source]) for source in sorted(summary)]
+    total = with_rate(
+        {
+            "orders": sum(item["orders"] for item in sources),
+            "revenue": round(sum(item["revenue"] for item in sources), 2),
+            "errors": sum(item["errors"] for item in sources),
+        }
+    )
+    return {"sources": sources, "total": total}
+
+
+def error_reasons(engine, source: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Most frequent error reasons, optionally for one source."""
+    stats = OrdersErrorStats
+    stmt = select(stats.source, stats.error_reason, stats.error_count).where(stats.error_count > 0)
+    if source:
+        stmt = stmt.where(stats.source == source)
+    stmt = stmt.order_by(stats.error_count.desc(), stats.source, stats.error_reason).limit(limit)
+    with engine.connect() as connection:
+        rows = connection.execute(stmt).all()
+    return [{"source": row.source, "error_reason": row.error_reason, "errors": row.error_count} for row in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the order rollup tables.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    settings = get_settings()
+    configure_logging(settings=settings)
+    engine = get_engine(settings)
+    try:
+        rebuild(engine)
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
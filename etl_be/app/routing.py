@@ -0,0 +1,125 @@
+"""Per-source lanes: a direct exchange routes each order to its source's queue.
+
+Lanes are opt-in. By default (``RABBITMQ_EXCHANGE`` empty) everything goes
+to ``RABBITMQ_QUEUE`` through the default exchange, as before.
+
+With ``RABBITMQ_EXCHANGE`` set (e.g. ``orders``), rows are published with
+the source as routing key and land in ``<RABBITMQ_QUEUE>.<source>`` -- so an
+offline backfill queues up behind itself instead of in front of online
+orders. Every lane has its own worker count and prefetch, and the online lane
+is a priority queue (``x-max-priority``): fresh messages are published with
+``FRESH_PRIORITY`` and retries come back with ``RETRY_PRIORITY``, so a burst
+of retries never delays new orders. When switching lanes on, keep one
+consumer running with ``RABBITMQ_EXCHANGE=`` until ``RABBITMQ_QUEUE`` and its
+retry queues are drained (see the README).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+SOURCES = ("online", "offline")
+DEFAULT_LANE = "default"
+
+FRESH_PRIORITY = 5
+RETRY_PRIORITY = 0
+
+
+@dataclass(frozen=True)
+class Lane:
+    name: str
+    queue: str
+    workers: int
+    # 0 = two batches' worth (see consumer_orders.prefetch_count).
+    prefetch: int
+    max_priority: int = 0
+
+    @property
+    def arguments(self) -> Optional[Dict[str, int]]:
+        return {"x-max-priority": self.max_priority} if self.max_priority else None
+
+
+def lane_for(settings, name: str) -> Lane:
+    if not settings.rabbitmq_exchange:
+        return Lane(DEFAULT_LANE, settings.rabbitmq_queue, settings.consumer_workers, settings.consumer_prefetch)
+    if name not in SOURCES:
+        raise ValueError(f"unknown lane {name!r}, expected one of {', '.join(SOURCES)}")
+    if name == "online":
+        workers, prefetch, priority = (
+            settings.online_lane_workers,
+            settings.online_lane_prefetch,
+            settings.online_lane_max_priority,
+        )
+    else:
+        workers, prefetch, priority = settings.offline_lane_workers, settings.offline_lane_prefetch, 0
+    return Lane(
+        name,
+        f"{settings.rabbitmq_queue}.{name}",
+        workers or settings.consumer_workers,
+        prefetch or settings.consumer_prefetch,
+        priority,
+    )
+
+
+def all_lanes(settings) -> List[Lane]:
+    if not settings.rabbitmq_exchange:
+        return [lane_for(settings, DEFAULT_LANE)]
+    return [lane_for(settings, source) for source in SOURCES]
+
+
+def select_lanes(settings, names: Optional[Iterable[str]] = None) -> List[Lane]:
+    """Lanes a consumer subscribes to: ``names`` or ``CONSUMER_LANES`` (empty = all)."""
+    if not settings.rabbitmq_exchange:
+        return all_lanes(settings)
+    if names is None:
+        names = [name.strip() for name in settings.consumer_lanes.split(",") if name.strip()]
+    names = list(names)
+    return [lane_for(settings, name) for name in names] if names else all_lanes(settings)
+
+
+def routing_key(settings, source: str) -> str:
+    return source if settings.rabbitmq_exchange else settings.rabbitmq_queue
+
+
+def declare_lanes(channel, settings) -> None:
+    """Declare the exchange, every lane queue and its binding (pika ``BlockingChannel``)."""
+    if not settings.rabbitmq_exchange:
+        channel.queue_declare(queue=settings.rabbitmq_queue, durable=True)
+        return
+    channel.exchange_declare(exchange=settings.rabbitmq_exchange, exchange_type="direct", durable=True)
+    for lane in all_lanes(settings):
+        channel.queue_declare(queue=lane.queue, durable=True, arguments=lane.arguments)
+        channel.queue_bind(queue=lane.queue, exchange=settings.rabbitmq_exchange, routing_key=lane.name)
+
+
+def declare_lanes_async(channel, settings, callback: Callable[[], None]) -> None:
+    """``declare_lanes`` for a callback-style (``SelectConnection``) channel; ``callback`` runs when done."""
+    exchange = settings.rabbitmq_exchange
+    steps: List[Callable] = []
+    if not exchange:
+        steps.append(lambda done: channel.queue_declare(queue=settings.rabbitmq_queue, durable=True, callback=done))
+    else:
+        steps.append(
+            lambda done: channel.exchange_declare(
+                exchange=exchange, exchange_type="direct", durable=True, callback=done
+            )
+        )
+        for lane in all_lanes(settings):
+            steps.append(
+                lambda done, lane=lane: channel.queue_declare(
+                    queue=lane.queue, durable=True, arguments=lane.arguments, callback=done
+                )
+            )
+            steps.append(
+                lambda done, lane=lane: channel.queue_bind(
+                    queue=lane.queue, exchange=exchange, routing_key=lane.name, callback=done
+                )
+            )
+
+    def next_step(_frame=None) -> None:
+        if steps:
+            steps.pop(0)(next_step)
+        else:
+            callback()
+
+    next_step()
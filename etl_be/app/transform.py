@@ -1,32 +1,23 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, Mapping, Optional, Tuple
 
-CANONICAL_COLUMNS = [
-    "order_id",
-    "source",
-    "order_date",
-    "customer_id",
-    "customer_name",
-    "total_amount",
-    "status",
-]
+from .mappings import CANONICAL_COLUMNS, source_mapping
+
+# Compiled once at import instead of on every re.sub call.
+# Digits, or anything that is not a word char, space, Vietnamese letter or hyphen.
+_NAME_JUNK_RE = re.compile(r'\d|[^\w\s\u00C0-\u1EF9-]', re.UNICODE)
+AMOUNT_JUNK_RE = re.compile(r'[^\d.]')
 
 
 def normalize_order(source: str, row: Dict[str, str]) -> Dict[str, str]:
-    """Map CSV-specific column names into the canonical schema."""
-    return {
-        "order_id": row.get("order_id") or row.get("id") or row.get("orderId") or "",
-        "source": source,
-        "order_date": row.get("order_date") or row.get("date") or "",
-        "customer_id": row.get("customer_id") or row.get("cust_id") or "",
-        "customer_name": row.get("customer_name") or row.get("name") or "",
-        "total_amount": row.get("total_amount") or row.get("amount") or row.get("total") or "0",
-        "status": row.get("status") or row.get("order_status") or "PENDING",
-    }
+    """Map CSV-specific column names into the canonical schema (per-source mapping, see ``app/mappings.py``)."""
+    return source_mapping(source).normalize(source, row)
 
 
+@lru_cache(maxsize=8192)
 def clean_customer_name(name: str) -> str | None:
     """
     Clean and fix customer name according to rules:
@@ -36,32 +27,18 @@ def clean_customer_name(name: str) -> str | None:
     - Trim whitespace
     - Limit to 50 characters
     Returns None if cannot be fixed.
+    Results are memoized: the same customer names recur across orders.
     """
     if not name:
         return None
     
-    # Remove digits
-    cleaned = re.sub(r'\d', '', name)
-    
-    # Remove special characters but keep Vietnamese characters, spaces, and hyphens
-    # Allow Vietnamese unicode range: \u00C0-\u1EF9
-    cleaned = re.sub(r'[^\w\s\u00C0-\u1EF9-]', '', cleaned, flags=re.UNICODE)
+    # Remove digits and special characters (keep Vietnamese \u00C0-\u1EF9, spaces, hyphens)
+    cleaned = _NAME_JUNK_RE.sub('', name)
     
-    # Normalize whitespace
-    cleaned = ' '.join(cleaned.split())
+    # Normalize whitespace and capitalize first letter of each word, rest lowercase
+    cleaned = ' '.join(word[0].upper() + word[1:].lower() for word in cleaned.split())
     
-    # Capitalize first letter of each word
-    # Handle Vietnamese names properly
-    words = cleaned.split()
-    capitalized_words = []
-    for word in words:
-        if word:
-            # Capitalize first character, keep rest lowercase
-            capitalized_words.append(word[0].upper() + word[1:].lower())
-    cleaned = ' '.join(capitalized_words)
-    
-    # Trim and limit length
-    cleaned = cleaned.strip()
+    # Limit length
     if len(cleaned) > 50:
         cleaned = cleaned[:50].rstrip()
     
@@ -82,7 +59,7 @@ def clean_total_amount(amount: str) -> str | None:
         return None
     
     # Remove currency symbols, commas, spaces
-    cleaned = re.sub(r'[^\d.]', '', str(amount))
+    cleaned = AMOUNT_JUNK_RE.sub('', str(amount))
     
     # Try to convert to float
     try:
@@ -113,6 +90,23 @@ def clean_status(status: str) -> str | None:
     return status.strip().upper()
 
 
+def clean_order_id(order_id: str) -> str | None:
+    """Remove extra whitespace around order_id."""
+    if not order_id:
+        return None
+    return order_id.strip()
+
+
+# Field -> cleaner, applied in this order in a single pass over the record.
+FIELD_CLEANERS: Tuple[Tuple[str, Callable[[str], Optional[str]]], ...] = (
+    ("customer_name", clean_customer_name),
+    ("total_amount", clean_total_amount),
+    ("order_date", clean_order_date),
+    ("status", clean_status),
+    ("order_id", clean_order_id),
+)
+
+
 def clean_and_fix_errors(record: Dict[str, str]) -> Tuple[Dict[str, str], bool]:
     """
     Tự động sửa lỗi nếu có thể (Nếu chỉnh sửa được thì thực hiện).
@@ -128,53 +122,26 @@ def clean_and_fix_errors(record: Dict[str, str]) -> Tuple[Dict[str, str], bool]:
     cleaned = record.copy()
     was_fixed = False
     
-    # Clean customer_name
-    if "customer_name" in cleaned:
-        original = cleaned["customer_name"]
-        fixed = clean_customer_name(original)
-        if fixed is not None and fixed != original:
-            cleaned["customer_name"] = fixed
-            was_fixed = True
-        elif fixed is not None:
-            cleaned["customer_name"] = fixed
-    
-    # Clean total_amount
-    if "total_amount" in cleaned:
-        original = cleaned["total_amount"]
-        fixed = clean_total_amount(original)
-        if fixed is not None and fixed != original:
-            cleaned["total_amount"] = fixed
-            was_fixed = True
-        elif fixed is not None:
-            cleaned["total_amount"] = fixed
-    
-    # Clean order_date
-    if "order_date" in cleaned:
-        original = cleaned["order_date"]
-        fixed = clean_order_date(original)
-        if fixed is not None and fixed != original:
-            cleaned["order_date"] = fixed
-            was_fixed = True
-        elif fixed is not None:
-            cleaned["order_date"] = fixed
-    
-    # Clean status
-    if "status" in cleaned:
-        original = cleaned["status"]
-        fixed = clean_status(original)
-        if fixed is not None and fixed != original:
-            cleaned["status"] = fixed
-            was_fixed = True
-        elif fixed is not None:
-            cleaned["status"] = fixed
-    
-    # Clean order_id - remove extra whitespace
-    if "order_id" in cleaned and cleaned["order_id"]:
-        original = cleaned["order_id"]
-        fixed = original.strip()
-        if fixed != original:
-            cleaned["order_id"] = fixed
-            was_fixed = True
+    for field, cleaner in FIELD_CLEANERS:
+        if field not in cleaned:
+            continue
+        original = cleaned[field]
+        fixed = cleaner(original)
+        if fixed is not None:
+            cleaned[field] = fixed
+            if fixed != original:
+                was_fixed = True
     
     return cleaned, was_fixed
 
+
+def enrich_customer(record: Dict[str, str], customers: Mapping[str, str]) -> Tuple[Dict[str, str], bool]:
+    """Replace customer_name with the reference name of a known customer_id.
+
+    ``customers`` maps customer_id -> cleaned reference name (see app/customers.py);
+    unknown ids are left as they are. Returns the record and whether it changed.
+    """
+    name = customers.get(record.get("customer_id", "").strip())
+    if name is None or name == record.get("customer_name"):
+        return record, False
+    return {**record, "customer_name": name}, True
@@ -0,0 +1,234 @@
+"""Incremental multipart/CSV parsing for uploads.
+
+The request body is fed to a streaming multipart parser as it arrives; the
+bytes of the ``file`` part go through an incremental UTF-8 decoder into a
+bounded ``asyncio.Queue``, and a worker thread turns them into CSV rows and
+hands them to a consumer (publishing or bulk loading) while the rest of the
+upload is still in flight. Memory stays bounded by the queue size regardless
+of file size: a full queue suspends the feed until the worker catches up.
+
+Rows are handed on as they are parsed, so when the upload breaks part-way (a
+byte that is not UTF-8, a dropped connection) the complete rows before the
+break have already been published or loaded. The row iterator then simply
+ends there, the consumer returns its result for those rows, and that result
+travels on the raised ``UploadFormatError`` as ``partial`` so the caller can
+report it instead of pretending nothing was sent.
+
+With a ``source`` the header is checked against that source's column mapping
+(``app/mappings.py``) before the first row is handed on; a header missing a
+required column fails the upload with ``UploadHeaderError``. Rows keep their
+CSV column names either way: they are mapped once, by the consumer or the bulk
+loader, like the rows the producer scripts publish.
+"""
+from __future__ import annotations
+
+import asyncio
+import codecs
+import csv
+import re
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from .mappings import HeaderError, source_mapping
+
+T = TypeVar("T")
+
+# Same record separators csv sees when a file is opened with newline="".
+_LINE_RE = re.compile(r"[^\r\n]*(?:\r\n|\n|\r(?!\Z))")
+_END = object()
+_ABORT = object()
+
+
+class UploadFormatError(ValueError):
+    """The request is not a usable multipart CSV upload."""
+
+    # What ``consume`` returned for the rows handed on before the upload broke (None: nothing was).
+    partial: object = None
+
+
+class UploadDecodeError(UploadFormatError):
+    def __init__(self, line: int) -> None:
+        super().__init__(f"Upload must be UTF-8 encoded CSV (invalid byte on line {line})")
+        self.line = line
+
+
+class UploadHeaderError(UploadFormatError):
+    """The CSV header lacks columns the source mapping requires."""
+
+
+class StreamingCsvUpload:
+    """Parse one multipart upload and pipe the rows of its file field into ``consume``."""
+
+    def __init__(
+        self,
+        content_type: str,
+        field_name: str = "file",
+        max_buffered_chunks: int = 16,
+        source: Optional[str] = None,
+    ) -> None:
+        mime, params = parse_options_header(content_type or "")
+        if mime != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadFormatError("Request must be multipart/form-data with a CSV file")
+        self._boundary = params[b"boundary"]
+        self._field_name = field_name.encode("latin-1")
+        self._queue: "asyncio.Queue[object]" = asyncio.Queue(maxsize=max_buffered_chunks)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._lines_seen = 0
+        self._found_file = False
+        self._source = source
+        # Header columns the source mapping does not use (known once the header has been read).
+        self.unknown_columns: List[str] = []
+
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._in_file = False
+        self._pieces: List[bytes] = []
+
+    # multipart callbacks -------------------------------------------------
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+        self._in_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        self._in_file = not self._found_file and options.get(b"name") == self._field_name
+        self._found_file = self._found_file or self._in_file
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._pieces.append(bytes(data[start:end]))
+
+    def _on_part_end(self) -> None:
+        self._in_file = False
+
+    # producer side (event loop) -------------------------------------------
+    def _decode(self, data: bytes, final: bool = False) -> str:
+        try:
+            text = self._decoder.decode(data, final)
+        except UnicodeDecodeError as exc:
+            raise UploadDecodeError(self._lines_seen + exc.object[: exc.start].count(b"\n") + 1) from exc
+        self._lines_seen += data.count(b"\n")
+        return text
+
+    async def _put(self, item: object, consumer: "asyncio.Future") -> None:
+        """Queue ``item``, waiting for room unless the consumer has stopped reading."""
+        if not self._queue.full():
+            self._queue.put_nowait(item)
+            return
+        put = asyncio.ensure_future(self._queue.put(item))
+        await asyncio.wait((put, consumer), return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+
+    async def _feed(self, stream: AsyncIterator[bytes], consumer: "asyncio.Future") -> None:
+        parser = MultipartParser(
+            self._boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+        async for chunk in stream:
+            if consumer.done():
+                return
+            if not chunk:
+                continue
+            parser.write(chunk)
+            for piece in self._pieces:
+                text = self._decode(piece)
+                if text:
+                    await self._put(text, consumer)
+            self._pieces.clear()
+        parser.finalize()
+        if not self._found_file:
+            raise UploadFormatError(f"Multipart field '{self._field_name.decode('latin-1')}' is required")
+        tail = self._decode(b"", final=True)
+        if tail:
+            await self._put(tail, consumer)
+
+    # consumer side (worker thread) ----------------------------------------
+    def _get(self) -> object:
+        assert self._loop is not None
+        return asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop).result()
+
+    def _lines(self) -> Iterator[str]:
+        pending = ""
+        while True:
+            item = self._get()
+            if item is _END:
+                break
+            if item is _ABORT:
+                # The stream broke: drop the unfinished line, keep what was complete.
+                return
+            pending += item
+            lines = _LINE_RE.findall(pending)
+            if lines:
+                pending = pending[sum(map(len, lines)):]
+                yield from lines
+        if pending:
+            yield pending
+
+    def rows(self) -> Iterator[Dict[str, str]]:
+        if self._source is None:
+            return iter(csv.DictReader(self._lines()))
+        return self._checked_rows(self._source)
+
+    def _checked_rows(self, source: str) -> Iterator[Dict[str, str]]:
+        reader = csv.DictReader(self._lines())
+        header = reader.fieldnames
+        if header is None:
+            return
+        try:
+            mapper = source_mapping(source).compile(source, header)
+        except HeaderError as exc:
+            raise UploadHeaderError(str(exc)) from exc
+        self.unknown_columns = mapper.unknown
+        yield from reader
+
+    async def process(self, stream: AsyncIterator[bytes], consume: Callable[[Iterator[Dict[str, str]]], T]) -> T:
+        """Feed ``stream`` into the parser while ``consume(rows)`` runs in a worker thread.
+
+        If the stream fails, the rows end at the last complete line before the
+        failure; an ``UploadFormatError`` then carries ``consume``'s result for
+        them as ``partial``.
+        """
+        self._loop = asyncio.get_running_loop()
+        consumer = asyncio.ensure_future(run_in_threadpool(consume, self.rows()))
+        try:
+            await self._feed(stream, consumer)
+        except BaseException as exc:
+            await self._put(_ABORT, consumer)
+            try:
+                partial = await consumer
+            except Exception:
+                partial = None  # the feed error is the one worth reporting
+            if isinstance(exc, UploadFormatError):
+                exc.partial = partial
+            raise
+        await self._put(_END, consumer)
+        return await consumer
@@ -2,8 +2,19 @@ from __future__ import annotations
 
 import csv
 import json
+from functools import partial
 from pathlib import Path
-from typing import Dict, Iterable
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+try:  # optional: several times faster than the stdlib json module
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # optional: needed only for MESSAGE_CODEC=msgpack
+    import msgpack
+except ImportError:
+    msgpack = None
 
 
 def ensure_csv(path: Path, headers: Iterable[str]) -> None:
@@ -21,10 +32,90 @@ def append_row(path: Path, headers: Iterable[str], row: Dict[str, object]) -> No
         writer.writerow(row)
 
 
-def json_dumps(data: Dict[str, object]) -> bytes:
+def _stdlib_dumps(data: object) -> bytes:
     return json.dumps(data, ensure_ascii=False).encode("utf-8")
 
 
-def json_loads(body: bytes) -> Dict[str, object]:
+def _stdlib_loads(body: bytes) -> object:
     return json.loads(body.decode("utf-8"))
 
+
+if orjson is not None:
+
+    def json_dumps(data: Dict[str, object]) -> bytes:
+        try:
+            return orjson.dumps(data)
+        except TypeError:  # e.g. integers beyond 64 bits, which the stdlib encoder still handles
+            return _stdlib_dumps(data)
+
+    def json_loads(body: bytes) -> Dict[str, object]:
+        return orjson.loads(body)
+
+else:
+    json_dumps = _stdlib_dumps
+    json_loads = _stdlib_loads
+
+
+class Codec(NamedTuple):
+    """Serialization of queue messages; ``content_type`` goes into the AMQP properties."""
+
+    name: str
+    content_type: str
+    dumps: Callable[[object], bytes]
+    loads: Callable[[bytes], object]
+
+
+JSON_CODEC = Codec("json", "application/json", json_dumps, json_loads)
+CODECS: Dict[str, Codec] = {"json": JSON_CODEC}
+
+if msgpack is not None:
+
+    def _msgpack_loads(body: bytes) -> object:
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as exc:  # msgpack raises several unrelated types for bad input
+            raise ValueError(f"invalid msgpack: {exc}") from exc
+
+    CODECS["msgpack"] = Codec(
+        "msgpack", "application/msgpack", partial(msgpack.packb, use_bin_type=True), _msgpack_loads
+    )
+
+_BY_CONTENT_TYPE = {codec.content_type: codec for codec in CODECS.values()}
+
+
+def get_codec(name: str) -> Codec:
+    """The codec called ``name`` (``MESSAGE_CODEC``); ValueError if unknown or its package is missing."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        hint = " (pip install msgpack)" if name == "msgpack" else ""
+        raise ValueError(f"unknown message codec {name!r}{hint}; available: {', '.join(CODECS)}") from None
+
+
+def sniff_codec(body: bytes) -> Codec:
+    """Codec of an encoded envelope from its first byte: a msgpack map or array never starts like JSON."""
+    first = body[:1]
+    if first and (0x80 <= first[0] <= 0x9F or 0xDC <= first[0] <= 0xDF):
+        return CODECS.get("msgpack", JSON_CODEC)
+    return JSON_CODEC
+
+
+def codec_for(content_type: Optional[str], body: bytes) -> Codec:
+    """Codec named by a message's ``content_type``; only a message without one (published before
+    codecs existed) is sniffed. ValueError for a content type no installed codec handles."""
+    if not content_type:
+        return sniff_codec(body)
+    mime = content_type.split(";", 1)[0].strip().lower()
+    try:
+        return _BY_CONTENT_TYPE[mime]
+    except KeyError:
+        hint = " (pip install msgpack)" if mime == "application/msgpack" else ""
+        raise ValueError(f"unsupported content type {content_type!r}{hint}") from None
+
+
+def decode_body(body: bytes, content_type: Optional[str] = None) -> object:
+    """Decode a message with the codec its ``content_type`` names (see ``codec_for``).
+
+    Raises ValueError for a body the codec cannot read.
+    """
+    return codec_for(content_type, body).loads(body)
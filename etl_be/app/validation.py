@@ -1,11 +1,48 @@
 from __future__ import annotations
 
+import re
 from abc import ABC, abstractmethod
-from datetime import datetime
-from typing import Dict, List, Tuple
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 ACCEPTED_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
 
+# Zero-padded shapes handled without strptime; anything else goes through the formats above.
+_ISO_DATE_RE = re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2})")
+_DMY_DATE_RE = re.compile(r"([0-9]{2})[/-]([0-9]{2})[/-]([0-9]{4})")
+
+
+@lru_cache(maxsize=4096)
+def parse_order_date(value: str) -> Optional[str]:
+    """Return the ISO form of ``value`` (already stripped) or None if no accepted format matches.
+
+    The accepted formats are mutually exclusive, so trying the one suggested
+    by the string's shape first gives the same answer as trying them in order.
+    """
+    match = _ISO_DATE_RE.fullmatch(value)
+    if match is None:
+        match = _DMY_DATE_RE.fullmatch(value)
+        # The separators must agree: DD/MM/YYYY or DD-MM-YYYY, never mixed.
+        if match is not None and value[2] == value[5]:
+            day, month, year = match.groups()
+        else:
+            match = None
+    else:
+        year, month, day = match.groups()
+    if match is not None:
+        try:
+            return date(int(year), int(month), int(day)).isoformat()
+        except ValueError:
+            return None
+
+    for fmt in ACCEPTED_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
 
 class ValidationStrategy(ABC):
     """Base class for validation strategies"""
@@ -33,7 +70,7 @@ class CustomerNameStrategy(ValidationStrategy):
         name = (record.get("customer_name") or "").strip()
         if not name:
             errors.append("customer_name missing")
-        elif any(char.isdigit() for char in name):
+        elif not name.replace(" ", "").isalpha() and any(char.isdigit() for char in name):
             errors.append("customer_name has digits")
         elif len(name) > 50:
             errors.append("customer_name too long")
@@ -60,14 +97,14 @@ class OrderDateStrategy(ValidationStrategy):
     
     def validate(self, record: Dict[str, str]) -> List[str]:
         date_value = record.get("order_date", "")
-        for fmt in ACCEPTED_DATE_FORMATS:
-            try:
-                parsed = datetime.strptime(date_value.strip(), fmt)
-                record["order_date"] = parsed.date().isoformat()
-                return []
-            except (ValueError, AttributeError):
-                continue
-        return ["order_date invalid format"]
+        try:
+            parsed = parse_order_date(date_value.strip())
+        except AttributeError:
+            parsed = None
+        if parsed is None:
+            return ["order_date invalid format"]
+        record["order_date"] = parsed
+        return []
 
 
 class StatusStrategy(ValidationStrategy):
@@ -100,8 +137,11 @@ class OrderValidator:
         return len(errors) == 0, errors
 
 
+# Strategies are stateless, so one validator built at import serves every record.
+DEFAULT_VALIDATOR = OrderValidator()
+
+
 def validate_order(record: Dict[str, str]) -> Tuple[bool, List[str]]:
     """Legacy function for backward compatibility"""
-    validator = OrderValidator()
-    return validator.validate(record)
+    return DEFAULT_VALIDATOR.validate(record)
 
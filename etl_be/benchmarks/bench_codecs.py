@@ -0,0 +1,79 @@
+"""Compare message codecs: bytes per message and encode/decode time (no broker).
+
+Every codec in ``utils.CODECS`` (plus the stdlib json encoder for reference) is
+run with dict rows and with positional rows, over the same generated orders.
+Decoding goes through ``consumer_orders.decode_envelope``, as the consumers do.
+
+    python -m benchmarks.bench_codecs --rows 200000 --rows-per-message 100
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import List
+
+from app.consumer_orders import decode_envelope
+from app.publisher import row_envelopes
+from app.utils import CODECS, Codec
+
+from benchmarks.bench_validation import make_rows
+
+# What utils.json_dumps/json_loads did before orjson.
+STDLIB_JSON = Codec(
+    "json-stdlib",
+    "application/json",
+    lambda data: json.dumps(data, ensure_ascii=False).encode("utf-8"),
+    lambda body: json.loads(body.decode("utf-8")),
+)
+
+
+def _timed(function) -> float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def measure(codec: Codec, rows: List[dict], rows_per_message: int, positional: bool, repeat: int) -> dict:
+    bodies: List[bytes] = []
+
+    def encode() -> None:
+        envelopes = row_envelopes("online", rows, rows_per_message, "job-1", codec, positional)
+        bodies[:] = [envelope.body for envelope in envelopes]
+
+    def decode() -> None:
+        for body in bodies:
+            decode_envelope(body, codec.content_type)
+
+    encoded = min(_timed(encode) for _ in range(repeat))
+    decoded = min(_timed(decode) for _ in range(repeat))
+    return {
+        "bytes_per_message": sum(map(len, bodies)) / len(bodies),
+        "encode_us_per_row": encoded / len(rows) * 1e6,
+        "decode_us_per_row": decoded / len(rows) * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--rows-per-message", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    codecs = [STDLIB_JSON, *CODECS.values()]
+    print(f"{args.rows} rows, {args.rows_per_message} rows per message")
+    print(f"{'codec':<14}{'rows':<12}{'bytes/msg':>12}{'encode us/row':>16}{'decode us/row':>16}")
+    for codec in codecs:
+        for positional in (False, True):
+            result = measure(codec, rows, args.rows_per_message, positional, args.repeat)
+            print(
+                f"{codec.name:<14}{'positional' if positional else 'dict':<12}"
+                f"{result['bytes_per_message']:>12,.0f}"
+                f"{result['encode_us_per_row']:>16.2f}{result['decode_us_per_row']:>16.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
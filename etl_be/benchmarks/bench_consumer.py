@@ -0,0 +1,108 @@
+"""Compare consumer throughput of the blocking and async engines.
+
+Needs the docker-compose RabbitMQ and Postgres. For each engine a fresh batch
+of uniquely keyed orders is published to a dedicated queue, the engine is
+started, and the clock runs until every order has landed in ``orders``.
+
+    python -m benchmarks.bench_consumer --messages 20000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app.config import get_settings
+from app.consumer_async import consume
+from app.consumer_orders import run_consumer
+from app.db import create_tables, get_engine
+from app.publisher import PublisherPool
+from app.rollups import delta_statements
+
+BENCH_ORDERS = "SELECT order_id FROM orders WHERE order_id LIKE 'BENCH-%'"
+
+
+def _rows(prefix: str, count: int):
+    for i in range(count):
+        yield {
+            "order_id": f"{prefix}-{i}",
+            "order_date": "2025-11-01",
+            "customer_id": f"C-{i % 500}",
+            "customer_name": "nguyen van a" if i % 7 else "Pham 4 D",
+            "total_amount": f"{(i % 300) + 1}.50",
+            "status": "paid",
+        }
+
+
+def _wait_for(engine, prefix: str, count: int, timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        with engine.connect() as connection:
+            done = connection.execute(
+                text("SELECT count(*) FROM orders WHERE order_id LIKE :prefix"), {"prefix": f"{prefix}-%"}
+            ).scalar_one()
+        if done >= count:
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    raise TimeoutError(f"{prefix}: only {done}/{count} orders processed")
+
+
+def bench(engine_name: str, settings, db_engine, count: int, timeout: float) -> float:
+    prefix = f"BENCH-{engine_name}-{uuid.uuid4().hex[:8]}"
+    publisher = PublisherPool(settings, size=1)
+    publisher.publish_rows("online", _rows(prefix, count))
+    publisher.close()
+
+    if engine_name == "blocking":
+        stop = threading.Event()
+        worker = threading.Thread(target=run_consumer, args=(settings, stop), daemon=True)
+        worker.start()
+        try:
+            return _wait_for(db_engine, prefix, count, timeout)
+        finally:
+            stop.set()
+            worker.join()
+
+    loop = asyncio.new_event_loop()
+    stop_async = asyncio.Event()
+    worker = threading.Thread(target=loop.run_until_complete, args=(consume(settings, stop_async),), daemon=True)
+    worker.start()
+    try:
+        return _wait_for(db_engine, prefix, count, timeout)
+    finally:
+        loop.call_soon_threadsafe(stop_async.set)
+        worker.join()
+        loop.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--engines", default="blocking,async")
+    args = parser.parse_args()
+
+    settings = dataclasses.replace(get_settings(), rabbitmq_queue="orders_bench", rabbitmq_exchange="")
+    db_engine = get_engine(settings)
+    create_tables(db_engine)
+    try:
+        for engine_name in args.engines.split(","):
+            elapsed = bench(engine_name, settings, db_engine, args.messages, args.timeout)
+            print(f"{engine_name:>8}: {args.messages} msgs in {elapsed:.2f}s -> {args.messages / elapsed:,.0f} msg/s")
+    finally:
+        with db_engine.begin() as connection:
+            # Take the benchmark orders out of the rollups before deleting them, so GET /stats stays in step.
+            for retract, _ in delta_statements(BENCH_ORDERS).values():
+                connection.execute(text(retract))
+            for table in ("orders", "orders_clean", "orders_error"):
+                connection.execute(text(f"DELETE FROM {table} WHERE order_id LIKE 'BENCH-%'"))
+        db_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
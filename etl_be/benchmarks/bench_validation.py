@@ -0,0 +1,135 @@
+"""Micro-benchmark for the clean + validate hot path (no broker or database).
+
+    python -m benchmarks.bench_validation --rows 200000
+    python -m benchmarks.bench_validation --rows 200000 --frame     # clean_and_validate_frame
+    python -m benchmarks.bench_validation --rows 200000 --baseline  # rules as before precompiling
+    python -m benchmarks.bench_validation --rows 200000 --compare   # all three, with speedups
+
+The baseline keeps today's normalize step but cleans and validates the way
+the code did before the rules were precompiled: a new ``OrderValidator`` per
+row, dates tried against every format with ``strptime``, no name cache and
+``re.sub`` with pattern strings.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from app.batch_transform import clean_and_validate_frame
+from app.transform import FIELD_CLEANERS, clean_and_fix_errors, clean_customer_name, normalize_order
+from app.validation import ACCEPTED_DATE_FORMATS, OrderDateStrategy, OrderValidator, validate_order
+
+NAMES = ["nguyen van a", "Le Thi Nga", "Tran  Van B!!", "Pham 4 D", "  hoàng  thị  c ", "X" * 60, ""]
+AMOUNTS = ["150.5", "99.9", "1,200", "$45", "-10", "abc", "0"]
+STATUSES = ["paid", "SHIPPED", " done ", ""]
+
+
+def make_rows(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        day = rng.randint(1, 28)
+        month = rng.randint(1, 12)
+        date = rng.choice(
+            [f"2025-{month:02d}-{day:02d}", f"{day:02d}/{month:02d}/2025", f"{day:02d}-{month:02d}-2025", "2025/13/40"]
+        )
+        rows.append(
+            {
+                "order_id": f"ON-{i}",
+                "order_date": date,
+                "customer_id": f"C-{i % 1000}",
+                "customer_name": rng.choice(NAMES),
+                "total_amount": rng.choice(AMOUNTS),
+                "status": rng.choice(STATUSES),
+            }
+        )
+    return rows
+
+
+class StrptimeDateStrategy(OrderDateStrategy):
+    """``OrderDateStrategy`` without the shape fast path and cache."""
+
+    def validate(self, record: Dict[str, str]) -> List[str]:
+        for fmt in ACCEPTED_DATE_FORMATS:
+            try:
+                record["order_date"] = datetime.strptime(record.get("order_date", "").strip(), fmt).date().isoformat()
+                return []
+            except (ValueError, AttributeError):
+                continue
+        return ["order_date invalid format"]
+
+
+def uncompiled_total_amount(amount: str) -> Optional[str]:
+    if not amount:
+        return None
+    try:
+        value = float(re.sub(r"[^\d.]", "", str(amount)))
+    except ValueError:
+        return None
+    return str(value) if value > 0 else None
+
+
+BASELINE_OVERRIDES = {"customer_name": clean_customer_name.__wrapped__, "total_amount": uncompiled_total_amount}
+BASELINE_CLEANERS = tuple((field, BASELINE_OVERRIDES.get(field, cleaner)) for field, cleaner in FIELD_CLEANERS)
+
+
+def run_baseline(rows: list) -> float:
+    started = time.perf_counter()
+    for row in rows:
+        record = normalize_order("online", row)
+        for field, cleaner in BASELINE_CLEANERS:
+            fixed = cleaner(record[field])
+            if fixed is not None:
+                record[field] = fixed
+        validator = OrderValidator()
+        validator.strategies[3] = StrptimeDateStrategy()
+        validator.validate(record)
+    return time.perf_counter() - started
+
+
+def run(rows: list) -> float:
+    started = time.perf_counter()
+    for row in rows:
+        record, _ = clean_and_fix_errors(normalize_order("online", row))
+        validate_order(record)
+    return time.perf_counter() - started
+
+
+def run_frame(rows: list) -> float:
+    frame = pd.DataFrame(rows)
+    started = time.perf_counter()
+    clean_and_validate_frame(frame, "online")
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--frame", action="store_true", help="benchmark the vectorized DataFrame path")
+    mode.add_argument("--baseline", action="store_true", help="benchmark the rules as before precompiling")
+    mode.add_argument("--compare", action="store_true", help="run baseline, per-row and frame paths")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    if args.compare:
+        runners = {"baseline": run_baseline, "rows": run, "frame": run_frame}
+    else:
+        runners = {"frame": run_frame} if args.frame else {"baseline": run_baseline} if args.baseline else {"rows": run}
+    baseline = None
+    for name, runner in runners.items():
+        best = min(runner(rows) for _ in range(args.repeat))
+        speedup = f" ({baseline / best:.1f}x baseline)" if baseline else ""
+        baseline = baseline or best
+        print(f"{name:>8}: {args.rows} rows in {best:.3f}s -> {args.rows / best:,.0f} rows/s{speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import random
+
+import pandas as pd
+
+from app.batch_transform import clean_and_validate_frame
+from app.pipeline import process_order
+
+NAMES = ["le thi nga", "  Tran  Van B ", "Ng0uyen 7", "@@@", "", "x" * 60, "Đỗ   mỸ lInh", "anne-marie", "12345"]
+AMOUNTS = ["120.5", " 1,200 ", "$45", "-10", "0", "abc", "", "1.2.3", ".5", "7.", "1e3", "  ", "00012", "99999999999999999"]
+DATES = ["2025-11-01", " 01/11/2025 ", "01-11-2025", "01/11-2025", "2025-13-01", "1/2/2025", "", "nope", "31/02/2025"]
+STATUSES = ["paid", " done ", "", "  ", "Pending"]
+IDS = ["ON-1", " ON-2 ", "", "  ", "OF-3"]
+LAYOUTS = [
+    ("order_id", "order_date", "customer_id", "customer_name", "total_amount", "status"),
+    ("id", "date", "cust_id", "name", "total", "order_status"),
+    ("orderId", "date", "customer_id", "name", "amount", "status"),
+]
+
+
+def _random_rows(rng, count):
+    rows = []
+    for _ in range(count):
+        columns = rng.choice(LAYOUTS)
+        values = [rng.choice(IDS), rng.choice(DATES), "C-1", rng.choice(NAMES), rng.choice(AMOUNTS), rng.choice(STATUSES)]
+        # Occasionally drop a column entirely so the fallback chains and defaults are exercised.
+        rows.append({column: value for column, value in zip(columns, values) if rng.random() > 0.1})
+    return rows
+
+
+# Values outside the shapes the column ops handle, which must fall back to the row functions.
+ODD_NAMES = [
+    "hoa\u0300ng thi\u0323", "anne_marie", "x\u00b2 y", "\u0130stanbul", "a\u00a0b", "\u01c6ango", "\u0663\u0664 an"
+]
+ODD_AMOUNTS = ["inf", "nan", "-0", "1_000", "\u0663\u0664", "1" * 25, "0.1" * 3, ".", "1.", " -5 ", "\u0663.5"]
+ODD_DATES = ["0001-01-01", "9999-12-31", "2025-1-5", "29/02/2024", "29/02/2023", "\u0662025-01-01", "01/02-2025"]
+
+
+def _assert_matches_rows(rows, source="online"):
+    frame = pd.DataFrame(rows).fillna("")
+    clean_df, error_df = clean_and_validate_frame(frame, source)
+
+    assert len(clean_df) + len(error_df) == len(rows)
+    for index, row in enumerate(rows):
+        expected = process_order(source, row)
+        target = clean_df if expected.is_valid else error_df
+        assert index in target.index
+        actual = target.loc[index]
+        for column, value in expected.record.items():
+            assert actual[column] == value, (row, column)
+        assert bool(actual["was_fixed"]) == expected.was_fixed, row
+        if not expected.is_valid:
+            assert actual["error_reason"] == expected.error_reason, row
+
+
+def test_frame_matches_row_by_row_pipeline():
+    _assert_matches_rows(_random_rows(random.Random(10), 3000))
+
+
+def test_frame_matches_row_by_row_pipeline_on_odd_values():
+    rng = random.Random(11)
+    rows = [
+        {
+            "order_id": rng.choice(IDS),
+            "order_date": rng.choice(DATES + ODD_DATES),
+            "customer_name": rng.choice(NAMES + ODD_NAMES),
+            "total_amount": rng.choice(AMOUNTS + ODD_AMOUNTS),
+            "status": rng.choice(STATUSES + ["\u00df", "\u00a0"]),
+        }
+        for _ in range(2000)
+    ]
+    _assert_matches_rows(rows)
+
+
+def test_frame_keeps_index_and_reports_reasons():
+    frame = pd.DataFrame(
+        {"order_id": ["A", ""], "customer_name": ["an", "42"], "total_amount": ["10", "0"],
+         "order_date": ["01/02/2025", "x"], "status": ["paid", "paid"]},
+        index=[7, 8],
+    )
+    clean_df, error_df = clean_and_validate_frame(frame, "offline")
+    assert list(clean_df.index) == [7]
+    assert clean_df.loc[7, "order_date"] == "2025-02-01"
+    assert clean_df.loc[7, "total_amount"] == "10.0"
+    assert error_df.loc[8, "error_reason"] == (
+        "order_id missing; customer_name has digits; total_amount must be > 0; order_date invalid format"
+    )
@@ -0,0 +1,31 @@
+from app.cache import ResponseCache
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=10)
+    etag = cache.etag()
+    cache.put("a", b"A", etag)
+    cache.put("b", b"B", etag)
+    assert cache.get("a").body == b"A"  # "a" is now most recently used
+    cache.put("c", b"C", etag)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_invalidate_bumps_etag_and_drops_stale_results():
+    cache = ResponseCache()
+    before = cache.etag()
+    cache.put("page", b"old", before)
+    cache.invalidate([{"source": "online", "clean": 1, "error": 0}])
+    assert cache.get("page") is None
+    assert cache.etag() != before
+
+    # A query that started before the invalidation must not repopulate the cache.
+    cache.put("page", b"old", before)
+    assert cache.get("page") is None
+    assert ResponseCache().etag() != ResponseCache().etag()
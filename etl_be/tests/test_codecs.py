@@ -0,0 +1,73 @@
+import pytest
+
+from app.consumer_orders import decode_envelope
+from app.publisher import row_envelopes
+from app.retry import MalformedMessage
+from app.transform import normalize_order
+from app.utils import CODECS, JSON_CODEC, codec_for, decode_body, get_codec, json_dumps, sniff_codec
+
+ROWS = [
+    {"order_id": "ON-1", "order_date": "2025-11-01", "customer_name": "Nguyễn An", "total_amount": "12.5"},
+    {"id": "ON-2", "date": "2025-11-02", "amount": 7, "status": "paid"},
+    {"order_id": "ON-3"},
+]
+
+
+def test_json_round_trip_keeps_unicode_and_big_integers():
+    data = {"name": "Trần Bình", "big": 2**70, "rows": [1, None, "x"]}
+    assert decode_body(json_dumps(data)) == data
+    assert sniff_codec(json_dumps(data)) is JSON_CODEC
+    with pytest.raises(ValueError):
+        get_codec("yaml")
+
+
+def test_positional_envelopes_decode_like_dict_envelopes():
+    dict_body, = (envelope.body for envelope in row_envelopes("online", ROWS, 10, "job-1"))
+    positional_body, = (envelope.body for envelope in row_envelopes("online", ROWS, 10, "job-1", positional=True))
+    source, job_id, rows = decode_envelope(positional_body)
+    assert (source, job_id) == ("online", "job-1")
+    assert [normalize_order(source, row) for row in rows] == [normalize_order(source, row) for row in ROWS]
+    assert decode_envelope(dict_body)[2] == ROWS
+
+    # Rows sharing one header name their columns once per message.
+    uniform = [{**ROWS[0], "order_id": f"ON-{index}"} for index in range(10)]
+    dict_body, = (envelope.body for envelope in row_envelopes("online", uniform, 10))
+    positional_body, = (envelope.body for envelope in row_envelopes("online", uniform, 10, positional=True))
+    assert len(positional_body) < len(dict_body) * 0.6
+    assert decode_envelope(positional_body)[2] == uniform
+
+
+def test_msgpack_envelopes_are_sniffed_and_decoded():
+    pytest.importorskip("msgpack")
+    codec = get_codec("msgpack")
+    for positional in (False, True):
+        body, = (envelope.body for envelope in row_envelopes("offline", ROWS, 10, None, codec, positional))
+        assert sniff_codec(body) is codec
+        assert decode_envelope(body) == decode_envelope(body, codec.content_type)
+        source, job_id, rows = decode_envelope(body, codec.content_type)
+        assert (source, job_id) == ("offline", None)
+        assert [normalize_order(source, row) for row in rows] == [normalize_order(source, row) for row in ROWS]
+
+
+def test_undecodable_bodies_are_malformed():
+    for body in (b"\xff\x00not json", b"[1, 2]", b'{"v": 3, "rows": [["a"]]}'):
+        with pytest.raises(MalformedMessage):
+            decode_envelope(body)
+
+
+def test_content_type_decides_the_codec_and_only_legacy_messages_are_sniffed():
+    body = json_dumps({"source": "online", "data": ROWS[0]})
+    assert codec_for("application/json; charset=utf-8", body) is JSON_CODEC
+    assert codec_for(None, body) is JSON_CODEC
+    assert decode_envelope(body, "application/json")[2] == [ROWS[0]]
+
+    # A declared content type is trusted over the body's first byte, and an unknown one is not guessed at.
+    for content_type in ("text/plain", "application/x-protobuf"):
+        with pytest.raises(MalformedMessage):
+            decode_envelope(body, content_type)
+    if "msgpack" in CODECS:
+        with pytest.raises(MalformedMessage):
+            decode_envelope(body, "application/msgpack")
+    else:
+        with pytest.raises(ValueError, match="pip install msgpack"):
+            codec_for("application/msgpack", body)
@@ -0,0 +1,65 @@
+import random
+
+import pandas as pd
+from prometheus_client import REGISTRY
+from sqlalchemy.dialects import postgresql
+
+from app.batch_transform import clean_and_validate_frame, frame_hashes, normalize_frame
+from app.content_hash import ERROR_HASHED_COLUMNS, RecentHashes
+from app.db import CLEAN_UPDATE_COLUMNS, OrdersClean, upsert_statement
+from app.pipeline import process_order
+
+from test_batch_transform import _random_rows
+
+
+def _skipped(table, check):
+    return REGISTRY.get_sample_value("etl_unchanged_rows_total", {"table": table, "check": check}) or 0.0
+
+
+def test_hash_ignores_job_and_tracks_content():
+    row = {"order_id": "ON-1", "order_date": "2025-11-01", "customer_name": "an", "total_amount": "5", "status": "paid"}
+    first, replay = process_order("online", row), process_order("online", row)
+    replay.job_id = "another-upload"
+    assert first.clean_values()["content_hash"] == replay.clean_values()["content_hash"]
+    assert first.raw_values()["content_hash"] == replay.raw_values()["content_hash"]
+    changed = process_order("online", {**row, "total_amount": "6"})
+    assert changed.clean_values()["content_hash"] != first.clean_values()["content_hash"]
+
+
+def test_bulk_hashes_match_consumer_hashes():
+    source = "offline"
+    rows = _random_rows(random.Random(7), 300)
+    frame = pd.DataFrame(rows, dtype=object)
+    clean_df, error_df = clean_and_validate_frame(frame, source)
+    raw = frame_hashes(normalize_frame(frame, source))
+    clean = frame_hashes(clean_df)
+    error = frame_hashes(error_df, ERROR_HASHED_COLUMNS)
+    for index, row in enumerate(rows):
+        order = process_order(source, row)
+        assert order.raw_values()["content_hash"] == raw[index]
+        if order.is_valid:
+            assert order.clean_values()["content_hash"] == clean[index]
+        else:
+            assert order.error_values()["content_hash"] == error[index]
+
+
+def test_upsert_only_updates_changed_rows():
+    statement = upsert_statement(OrdersClean, [{"order_id": "a"}], CLEAN_UPDATE_COLUMNS)
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "WHERE orders_clean.content_hash IS DISTINCT FROM excluded.content_hash" in sql
+
+
+def test_recent_hashes_skip_committed_rows_and_evict():
+    recent = RecentHashes(size=2)
+    rows = [{"order_id": "a", "content_hash": "1"}, {"order_id": "b", "content_hash": "1"}]
+    before = _skipped("orders", "cache")
+    assert recent.changed("orders", rows) == rows
+    recent.remember("orders", rows)
+    assert recent.changed("orders", rows + [{"order_id": "b", "content_hash": "2"}]) == [
+        {"order_id": "b", "content_hash": "2"}
+    ]
+    assert _skipped("orders", "cache") == before + 2
+    # Same order id in another table is a different entry; the oldest one is evicted.
+    recent.remember("orders_clean", [{"order_id": "a", "content_hash": "1"}])
+    assert len(recent) == 2
+    assert recent.changed("orders", rows[:1]) == rows[:1]
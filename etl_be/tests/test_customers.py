@@ -0,0 +1,102 @@
+import json
+import random
+
+import pandas as pd
+
+from app.batch_transform import clean_and_validate_frame
+from app.consumer_orders import decode_batch
+from app.customers import CustomerCache, change_payloads, reference_name
+from app.pipeline import process_order
+from app.publisher import row_envelopes
+
+from test_batch_transform import _random_rows
+
+CUSTOMERS = {"C-1": "Le Thi Nga", "C-2": "Tran Van B"}
+ROW = {"order_id": "ON-1", "order_date": "2025-11-01", "customer_id": "C-1", "total_amount": "5", "status": "paid"}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_enrich_fills_and_replaces_names_of_known_customers():
+    missing_name = process_order("online", ROW, customers=CUSTOMERS)
+    assert missing_name.is_valid and missing_name.was_fixed
+    assert missing_name.record["customer_name"] == "Le Thi Nga"
+    unknown = process_order("online", {**ROW, "customer_id": "C-9"}, customers=CUSTOMERS)
+    assert unknown.errors == ["customer_name missing"]
+    same = process_order("online", {**ROW, "customer_id": " C-2 ", "customer_name": "tran van b"}, customers=CUSTOMERS)
+    assert same.record["customer_name"] == "Tran Van B"
+
+
+def test_cache_serves_hits_remembers_unknown_ids_and_expires():
+    clock = Clock()
+    cache = CustomerCache(size=10, ttl=60, clock=clock)
+    found, missing, generation = cache.cached(["C-1", "C-9"])
+    assert (found, sorted(missing)) == ({}, ["C-1", "C-9"])
+    cache.store(missing, {"C-1": "Le Thi Nga"}, generation)
+    found, missing, _ = cache.cached(["C-1", "C-9"])
+    assert (found, missing) == ({"C-1": "Le Thi Nga"}, [])
+    clock.now = 61
+    assert cache.cached(["C-1"])[1] == ["C-1"]
+
+
+def test_cache_evicts_and_invalidates():
+    cache = CustomerCache(size=2, ttl=60)
+    cache.store(["A", "B", "C"], {"A": "An", "B": "Binh", "C": "Chi"}, cache.generation)
+    assert len(cache) == 2 and cache.cached(["A"])[1] == ["A"]
+
+    # A lookup that raced a change notification does not store its stale result.
+    _, missing, generation = cache.cached(["D"])
+    cache.invalidate([{"customer_ids": ["B"]}])
+    cache.store(missing, {"D": "Dung"}, generation)
+    assert cache.cached(["B", "C", "D"])[1] == ["B", "D"]
+    cache.invalidate(None)
+    assert len(cache) == 0
+
+
+def test_batch_reads_the_misses_of_all_messages_with_one_query():
+    cache = CustomerCache(size=100, ttl=60)
+    calls = []
+
+    def fetch(ids):
+        calls.append(sorted(ids))
+        return [(key, name) for key, name in {"C-1": "le thi  nga", "C-2": "Tran Van B"}.items() if key in ids]
+
+    first = list(row_envelopes("online", [ROW, {**ROW, "order_id": "ON-2", "customer_id": "C-2"}], 2))
+    offline = {key: value for key, value in ROW.items() if key != "customer_id"}
+    second = list(row_envelopes("offline", [{**offline, "order_id": "OF-1", "cust_id": "C-3"}], 1))
+    orders = decode_batch([(e.body, None) for e in first + second], cache, fetch)
+    assert calls == [["C-1", "C-2", "C-3"]]
+    assert [order.record["customer_name"] for order in orders] == ["Le Thi Nga", "Tran Van B", ""]
+
+    decode_batch([(e.body, None) for e in first], cache, fetch)
+    assert len(calls) == 1
+    assert decode_batch([(e.body, None) for e in first], None, fetch)[0].errors == ["customer_name missing"]
+
+
+def test_frame_enrichment_matches_row_by_row_pipeline():
+    rng = random.Random(22)
+    rows = _random_rows(rng, 1500)
+    for row in rows:
+        row["customer_id"] = rng.choice(["C-1", " C-2", "C-3", ""])
+    customers = {key: reference_name(name) for key, name in {"C-1": "le thi nga", "C-2": "Ann2 Lee"}.items()}
+    clean_df, error_df = clean_and_validate_frame(pd.DataFrame(rows).fillna(""), "online", customers)
+    for index, row in enumerate(rows):
+        expected = process_order("online", row, customers=customers)
+        target = clean_df if expected.is_valid else error_df
+        assert target.loc[index, "customer_name"] == expected.record["customer_name"], row
+        assert bool(target.loc[index, "was_fixed"]) == expected.was_fixed, row
+        if not expected.is_valid:
+            assert target.loc[index, "error_reason"] == expected.error_reason, row
+
+
+def test_change_payloads_stay_under_the_notify_limit():
+    payloads = change_payloads([f"CUSTOMER-{i:05d}" for i in range(2000)])
+    assert len(payloads) > 1
+    assert all(len(payload) <= 7900 for payload in payloads)
+    assert sum(len(json.loads(payload)["customer_ids"]) for payload in payloads) == 2000
@@ -0,0 +1,118 @@
+import random
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import create_engine, insert
+
+from app.batch_transform import clean_and_validate_frame, frame_match_keys
+from app.bulk_load import _chunk_duplicates
+from app.db import OrdersClean, create_tables
+from app.dedup import RecentKeys, flag_duplicates, match_key
+from app.pipeline import process_order
+from app.rollups import daily_stats, rebuild
+
+from test_batch_transform import _random_rows
+from test_customers import Clock
+
+ONLINE = {
+    "order_id": "ON-1",
+    "order_date": "01/11/2025",
+    "customer_name": "le thi  nga",
+    "total_amount": "5",
+    "status": "paid",
+}
+OFFLINE = {"order_id": "OF-7", "order_date": "2025-11-01", "customer_name": "Le Thi Nga", "total_amount": "5.00"}
+
+
+def _rows(*orders):
+    return [{key: order.clean_values()[key] for key in ("order_id", "source", "match_key")} for order in orders]
+
+
+def test_match_key_normalizes_both_feeds():
+    online, offline = process_order("online", ONLINE), process_order("offline", OFFLINE)
+    assert online.is_valid and offline.is_valid
+    assert online.clean_values()["match_key"] == offline.clean_values()["match_key"]
+    other_day = process_order("offline", {**OFFLINE, "order_date": "2025-11-02"})
+    assert other_day.clean_values()["match_key"] != online.clean_values()["match_key"]
+    assert match_key({"order_date": "2025-11-01", "total_amount": "5"}) is None
+
+
+def test_flags_only_orders_from_another_source():
+    index = RecentKeys(window=3600, size=100)
+    calls = []
+
+    def fetch(keys):
+        calls.append(sorted(keys))
+        return []
+
+    online = process_order("online", ONLINE)
+    rows = _rows(online, process_order("offline", OFFLINE), process_order("online", {**ONLINE, "order_id": "ON-2"}))
+    primaries = flag_duplicates(index, rows, fetch)
+    assert [row.get("duplicate_of") for row in rows] == [None, "ON-1", None]
+    assert primaries == [(rows[0]["match_key"], "ON-1", "online")]
+    assert calls == [[rows[0]["match_key"]]]
+
+    # Once committed, the primary is served from memory; its own replay is not a duplicate.
+    index.remember(primaries)
+    replay = _rows(online, process_order("offline", {**OFFLINE, "order_id": "OF-8"}))
+    assert flag_duplicates(index, replay, fetch) == []
+    assert [row.get("duplicate_of") for row in replay] == [None, "ON-1"]
+    assert len(calls) == 1
+
+
+def test_primaries_from_the_table_are_remembered_and_expire():
+    clock = Clock()
+    index = RecentKeys(window=60, size=100, clock=clock)
+    rows = _rows(process_order("offline", OFFLINE))
+    key = rows[0]["match_key"]
+    assert flag_duplicates(index, rows, lambda keys: [(key, "ON-1", "online")]) == []
+    assert rows[0]["duplicate_of"] == "ON-1"
+    assert index.primaries([key]) == ({key: ("ON-1", "online")}, [])
+    clock.now = 61
+    assert index.primaries([key]) == ({}, [key])
+
+    small = RecentKeys(window=60, size=2)
+    small.remember([("a", "ON-1", "online"), ("b", "ON-2", "online"), ("c", "ON-3", "online")])
+    assert len(small) == 2 and small.primaries(["a"])[1] == ["a"]
+
+
+def test_frame_keys_and_flags_match_the_consumer():
+    rng = random.Random(23)
+    rows = _random_rows(rng, 1000)
+    clean_df, _ = clean_and_validate_frame(pd.DataFrame(rows).fillna(""), "online")
+    keys = frame_match_keys(clean_df)
+    for position, row in enumerate(rows):
+        order = process_order("online", row)
+        if order.is_valid:
+            assert keys[position] == order.clean_values()["match_key"], row
+
+    # The table already holds an offline order with the first key.
+    stored = keys.dropna().iloc[0]
+
+    class Cursor:
+        def execute(self, sql, params):
+            self.params = params
+
+        def fetchall(self):
+            return [(stored, "OF-1", "offline")] if stored in self.params["keys"] else []
+
+    duplicate_of, primaries = _chunk_duplicates(Cursor(), RecentKeys(3600, 1000), clean_df.assign(match_key=keys))
+    assert set(duplicate_of.dropna()) == {"OF-1"}
+    assert duplicate_of.notna().sum() == (keys == stored).sum()
+    assert len(primaries) == keys.dropna().nunique() - 1
+
+
+def test_rollups_leave_duplicates_out(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dedup.db'}")
+    create_tables(engine)
+    order = {"order_date": date(2025, 11, 1), "customer_name": "an", "total_amount": 5, "status": "PAID"}
+    with engine.begin() as connection:
+        connection.execute(
+            insert(OrdersClean),
+            [
+                {**order, "order_id": "ON-1", "source": "online", "duplicate_of": None},
+                {**order, "order_id": "OF-7", "source": "offline", "duplicate_of": "ON-1"},
+            ],
+        )
+    rebuild(engine)
+    assert [(item["source"], item["orders"]) for item in daily_stats(engine)] == [("online", 1)]
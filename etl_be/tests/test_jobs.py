@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from app.consumer_orders import decode_message
+from app.db import create_tables
+from app.jobs import (
+    create_job,
+    finish_publishing,
+    get_job,
+    job_counts,
+    job_report,
+    parked_rows,
+    record_parked,
+    record_progress,
+    record_replayed,
+)
+from app.publisher import row_envelopes
+
+ROW = {"order_id": "ON-1", "order_date": "2025-01-01", "customer_name": "an", "total_amount": "5", "status": "paid"}
+
+
+def _job(**overrides):
+    started = datetime(2025, 1, 1, 12, 0, 0)
+    job = {
+        "id": "job-1",
+        "source": "online",
+        "mode": "queue",
+        "status": "published",
+        "published": 1000,
+        "processed": 250,
+        "clean": 200,
+        "error": 50,
+        "fixed": 10,
+        "created_at": started,
+        "published_at": started + timedelta(seconds=1),
+        "updated_at": started + timedelta(seconds=5),
+    }
+    job.update(overrides)
+    return job
+
+
+def test_job_id_travels_from_envelope_to_counts():
+    envelopes = list(row_envelopes("online", [ROW, {**ROW, "order_id": ""}], rows_per_message=2, job_id="job-1"))
+    assert json.loads(envelopes[0].body)["job_id"] == "job-1"
+
+    orders = decode_message(envelopes[0].body)
+    assert {order.job_id for order in orders} == {"job-1"}
+    assert orders[0].clean_values()["job_id"] == "job-1"
+    counts = job_counts(orders)["job-1"]
+    assert (counts["processed"], counts["clean"], counts["error"], counts["fixed"]) == (2, 1, 1, 2)
+
+
+def test_job_report_progress_rate_and_eta():
+    now = datetime(2025, 1, 1, 12, 0, 10)
+    report = job_report(_job(), now)
+    assert report["state"] == "processing"
+    assert report["progress"] == 0.25
+    assert report["rows_per_second"] == 25.0
+    assert report["eta_seconds"] == 30.0
+
+    done = job_report(_job(processed=1000), now)
+    assert done["state"] == "done" and done["eta_seconds"] is None
+    assert done["rows_per_second"] == 200.0  # measured up to the last batch, not "now"
+
+    publishing = job_report(_job(status="publishing", published=300, published_at=None), now)
+    assert publishing["progress"] is None and publishing["eta_seconds"] is None
+
+
+def test_job_with_parked_rows_finishes_with_errors():
+    now = datetime(2025, 1, 1, 12, 0, 10)
+    report = job_report(_job(processed=990, parked=10), now)
+    assert report["state"] == "done_with_errors"
+    assert report["progress"] == 1.0 and report["eta_seconds"] is None
+
+    waiting = job_report(_job(processed=900, parked=10), now)
+    assert waiting["state"] == "processing" and waiting["progress"] == 0.91
+
+
+def test_progress_rows_add_up_and_replay_unparks(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    create_tables(engine)
+    job_id = create_job(engine, "online", "queue")
+    first, second = row_envelopes("online", [ROW, {**ROW, "order_id": ""}, ROW], rows_per_message=2, job_id=job_id)
+    finish_publishing(engine, job_id, 3)
+
+    with Session(engine) as session:
+        record_progress(session, decode_message(first.body))
+        session.commit()
+    with engine.begin() as connection:
+        record_parked(connection, parked_rows([(second.body, None), (b"not json", None)]))
+    job = get_job(engine, job_id)
+    assert (job["state"], job["processed"], job["error"], job["parked"]) == ("done_with_errors", 2, 1, 1)
+
+    record_replayed(engine, [(second.body, None)])
+    job = get_job(engine, job_id)
+    assert (job["state"], job["parked"]) == ("processing", 0)
+
+
+def test_create_tables_adds_job_id_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (id INTEGER PRIMARY KEY, order_id VARCHAR(50) NOT NULL UNIQUE)"))
+    create_tables(engine)
+    assert "job_id" in {column["name"] for column in inspect(engine).get_columns("orders")}
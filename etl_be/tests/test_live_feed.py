@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+
+from app.db import Base, OrdersClean, OrdersError
+from app.live_feed import MAX_GAPS, FeedPosition, LiveFeed
+
+
+def _order(i):
+    return {
+        "order_id": f"ON-{i}",
+        "source": "online",
+        "order_date": date(2025, 1, 1),
+        "customer_name": "An",
+        "total_amount": 5,
+        "status": "PAID",
+    }
+
+
+def test_burst_of_commits_becomes_one_frame(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'feed.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(OrdersClean), [_order(0)])  # committed before the feed starts
+
+    async def scenario():
+        feed = LiveFeed(engine, coalesce_ms=50)
+        await feed.start()
+        frames = feed.subscribe()
+        hello = await frames.__anext__()
+        assert hello.startswith(b"event: hello")
+
+        for i in (1, 2):
+            with engine.begin() as connection:
+                connection.execute(insert(OrdersClean), [_order(i)])
+            # Notifications arrive on the listener thread.
+            listener = threading.Thread(target=feed.on_change, args=([{"source": "online", "clean": 1, "error": 0}],))
+            listener.start()
+            listener.join()
+        with engine.begin() as connection:
+            connection.execute(insert(OrdersError), [{**_order(3), "error_reason": "x"}])
+        feed.on_change([{"source": "online", "clean": 0, "error": 1}])
+
+        frame = await asyncio.wait_for(frames.__anext__(), 2)
+        await frames.aclose()
+        await feed.stop()
+        return frame
+
+    frame = asyncio.run(scenario())
+    event, data = frame.decode().strip().split("\n")
+    assert event == "event: orders"
+    payload = json.loads(data[len("data: "):])
+    assert [item["order_id"] for item in payload["clean"]] == ["ON-2", "ON-1"]
+    assert [item["order_id"] for item in payload["error"]] == ["ON-3"]
+    assert payload["counts"] == {"online": {"clean": 2, "error": 1}}
+    assert payload["totals"] == payload["counts"]
+
+
+def _payloads(frames):
+    return [json.loads(frame.decode().strip().split("\n")[1][len("data: "):]) for frame in frames]
+
+
+def test_late_commits_and_large_bursts_are_not_lost(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'feed.db'}")
+    Base.metadata.create_all(engine)
+
+    def commit(*ids):
+        with engine.begin() as connection:
+            connection.execute(insert(OrdersClean), [{**_order(i), "id": i} for i in ids])
+
+    async def next_frames(frames, count):
+        return [await asyncio.wait_for(frames.__anext__(), 2) for _ in range(count)]
+
+    async def scenario():
+        feed = LiveFeed(engine, coalesce_ms=10, max_rows=2)
+        await feed.start()
+        frames = feed.subscribe()
+        await frames.__anext__()  # hello
+
+        # Id 2 is still in flight when 1 and 3 commit; it commits after 3 was sent.
+        commit(1, 3)
+        feed.on_change([])
+        first = await next_frames(frames, 1)
+        commit(2)
+        feed.on_change([])
+        late = await next_frames(frames, 1)
+
+        # A burst of five rows with max_rows=2 is sent as three frames, oldest first.
+        commit(4, 5, 6, 7, 8)
+        feed.on_change([])
+        burst = await next_frames(frames, 3)
+        await frames.aclose()
+        await feed.stop()
+        return first, late, burst
+
+    first, late, burst = asyncio.run(scenario())
+    assert [item["order_id"] for item in _payloads(first)[0]["clean"]] == ["ON-3", "ON-1"]
+    assert [item["order_id"] for item in _payloads(late)[0]["clean"]] == ["ON-2"]
+    assert [[item["order_id"] for item in payload["clean"]] for payload in _payloads(burst)] == [
+        ["ON-5", "ON-4"],
+        ["ON-7", "ON-6"],
+        ["ON-8"],
+    ]
+
+
+def test_gaps_expire_quickly_and_are_capped():
+    position = FeedPosition(0, gap_seconds=5)
+    position.advance([3], now=0.0)
+    assert [gap[:2] for gap in position.gaps] == [[1, 2]]
+    position.expire(now=4.9)
+    assert position.gaps
+    position.expire(now=5.0)
+    assert position.gaps == []
+
+    # Every other id skipped: only the newest MAX_GAPS ranges are looked up again.
+    position.advance(list(range(5, 5 + 4 * MAX_GAPS, 2)), now=10.0)
+    position.advance([position.last_id + 2], now=11.0)
+    position.expire(now=11.0)
+    assert len(position.gaps) == MAX_GAPS
+    assert position.gaps[-1][:2] == [position.last_id - 1, position.last_id - 1]
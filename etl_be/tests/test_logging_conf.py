@@ -0,0 +1,37 @@
+import json
+import logging
+
+from app.logging_conf import JsonFormatter, SamplingFilter, parse_sampling
+
+
+def _record(level=logging.INFO, **extra):
+    record = logging.LogRecord("consumer.orders.rows", level, __file__, 1, "Accepted order %s", ("ON-1",), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    entry = json.loads(JsonFormatter().format(_record(order_id="ON-1", source="online")))
+    assert entry["message"] == "Accepted order ON-1"
+    assert entry["level"] == "INFO" and entry["logger"] == "consumer.orders.rows"
+    assert (entry["order_id"], entry["source"]) == ("ON-1", "online")
+
+
+def test_sampling_keeps_share_and_summarizes_the_rest(caplog):
+    sampling = SamplingFilter("consumer.orders.rows", rate=0.1, summary_interval=3600)
+    kept = sum(sampling.filter(_record(logging.WARNING if i % 2 else logging.INFO)) for i in range(100))
+    assert kept == 10
+
+    with caplog.at_level(logging.INFO, logger="logging.sampling"):
+        sampling.flush()
+    (summary,) = caplog.records
+    assert summary.seen == 100 and sum(summary.suppressed.values()) == 90
+    assert set(summary.suppressed) == {"INFO", "WARNING"}
+
+
+def test_rate_limit_and_spec_parsing():
+    per_logger, limited = parse_sampling("producer.rows=0, consumer.orders.rows=5/s", summary_interval=60)
+    assert (per_logger.name, per_logger.rate) == ("producer.rows", 0.0)
+    assert not any(per_logger.filter(_record()) for _ in range(10))
+    assert limited.per_second == 5
+    assert sum(limited.filter(_record()) for _ in range(50)) == 5
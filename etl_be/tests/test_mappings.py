@@ -0,0 +1,129 @@
+import asyncio
+import json
+import random
+
+import pandas as pd
+import pytest
+
+from app import mappings
+from app.batch_transform import clean_and_validate_frame
+from app.mappings import DEFAULT_MAPPINGS_FILE, MAX_COMPILED, HeaderError, MappingConfigError, RowMapper, load_mappings
+from app.pipeline import process_order
+from app.transform import normalize_order
+from app.upload_stream import StreamingCsvUpload, UploadHeaderError
+
+from test_batch_transform import _random_rows
+from test_upload_stream import CONTENT_TYPE, _body, _chunks
+
+
+def _chain(source, row):
+    """The hard-coded fallback chains the default mapping replaces."""
+    return {
+        "order_id": row.get("order_id") or row.get("id") or row.get("orderId") or "",
+        "source": source,
+        "order_date": row.get("order_date") or row.get("date") or "",
+        "customer_id": row.get("customer_id") or row.get("cust_id") or "",
+        "customer_name": row.get("customer_name") or row.get("name") or "",
+        "total_amount": row.get("total_amount") or row.get("amount") or row.get("total") or "",
+        "status": row.get("status") or row.get("order_status") or "PENDING",
+    }
+
+
+def _write(tmp_path, config):
+    path = tmp_path / "mappings.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return path
+
+
+def test_default_mapping_matches_the_fallback_chains():
+    rows = _random_rows(random.Random(24), 2000)
+    rows += [{"id": "OF-1", "order_id": "", "amount": 0, "total": "5"}, {"orderId": None}]
+    for row in rows:
+        assert normalize_order("offline", row) == _chain("offline", row), row
+
+    # The rows of one message share a compiled mapper until their key set changes.
+    mapper = RowMapper("online")
+    batch = [{"id": "OF-1", "order_id": "", "date": "2025-11-01", "total": "5"}, {"orderId": "ON-2"}]
+    batch += [{"orderId": "ON-3", "status": "paid"}, {"status": "paid", "orderId": "ON-4"}]
+    assert [mapper(row) for row in batch] == [_chain("online", row) for row in batch]
+
+
+def test_header_check_reports_missing_and_unknown_columns(tmp_path):
+    path = _write(
+        tmp_path,
+        {
+            "default": json.loads(DEFAULT_MAPPINGS_FILE.read_text(encoding="utf-8"))["default"],
+            "partner": {"fields": {"order_id": {"columns": ["order_no"], "required": True}}, "ignore": ["note"]},
+        },
+    )
+    partner = load_mappings(path)["partner"]
+    mapper = partner.compile("partner", ["order_no", "date", "amount", "note", "channel"])
+    assert mapper.unknown == ["channel"]
+    assert partner.normalize("partner", {"order_no": "P-1", "date": "2025-11-01"})["order_id"] == "P-1"
+
+    with pytest.raises(HeaderError) as exc_info:
+        partner.compile("partner", ["order_id", "name"])
+    assert exc_info.value.missing == ["order_id", "order_date", "total_amount"]
+    assert "order_no" in str(exc_info.value)
+
+
+def test_malformed_config_is_rejected(tmp_path):
+    with pytest.raises(MappingConfigError):
+        load_mappings(_write(tmp_path, {"online": {}}))
+    default = json.loads(DEFAULT_MAPPINGS_FILE.read_text(encoding="utf-8"))["default"]
+    with pytest.raises(MappingConfigError):
+        load_mappings(_write(tmp_path, {"default": default, "x": {"fields": {"discount": {"columns": ["d"]}}}}))
+    with pytest.raises(MappingConfigError):
+        load_mappings(_write(tmp_path, {"default": {"fields": {"order_id": {"columns": []}}}}))
+
+
+def test_upload_checks_the_header_before_any_row_is_consumed():
+    consumed = []
+
+    def consume(rows):
+        for row in rows:
+            consumed.append(row)
+        return consumed
+
+    upload = StreamingCsvUpload(CONTENT_TYPE, source="offline")
+    payload = b"id,date,name,total,extra\nOF-1,2025-11-01,An,5,x\n"
+    rows = asyncio.run(upload.process(_chunks(_body(payload), 7), consume))
+    # Rows are handed on with their CSV column names; the consumer or bulk loader maps them.
+    assert rows == [{"id": "OF-1", "date": "2025-11-01", "name": "An", "total": "5", "extra": "x"}]
+    assert upload.unknown_columns == ["extra"]
+
+    consumed.clear()
+    upload = StreamingCsvUpload(CONTENT_TYPE, source="offline")
+    with pytest.raises(UploadHeaderError):
+        asyncio.run(upload.process(_chunks(_body(b"id,name\nOF-1,An\n"), 7), consume))
+    assert consumed == []
+
+
+def test_remapped_source_is_mapped_once_end_to_end(tmp_path, monkeypatch):
+    default = json.loads(DEFAULT_MAPPINGS_FILE.read_text(encoding="utf-8"))["default"]
+    path = _write(tmp_path, {"default": default, "online": {"fields": {"order_id": {"columns": ["order_no"]}}}})
+    monkeypatch.setattr(mappings, "_registry", load_mappings(path))
+
+    upload = StreamingCsvUpload(CONTENT_TYPE, source="online")
+    payload = b"order_no,date,name,total\nON-9,2025-11-01,An,5\nON-10,2025-11-02,Binh,7\n"
+    rows = asyncio.run(upload.process(_chunks(_body(payload), 7), list))
+    assert upload.unknown_columns == []
+
+    # Consumer path: what the upload publishes goes through process_order.
+    orders = [process_order("online", row) for row in rows]
+    assert [order.errors for order in orders] == [[], []]
+    assert [order.record["order_id"] for order in orders] == ["ON-9", "ON-10"]
+
+    # Bulk path: the same rows as a chunk.
+    clean_df, error_df = clean_and_validate_frame(pd.DataFrame(rows), "online")
+    assert error_df.empty
+    assert clean_df["order_id"].tolist() == ["ON-9", "ON-10"]
+
+
+def test_compiled_mappers_are_evicted_least_recently_used_first():
+    mapping = load_mappings(DEFAULT_MAPPINGS_FILE)["default"]
+    hot = mapping.mapper("online", ["order_id", "date"])
+    for index in range(MAX_COMPILED + 10):
+        mapping.mapper("online", ["order_id", f"extra{index}"])
+        assert mapping.mapper("online", ["order_id", "date"]) is hot
+    assert len(mapping._compiled) == MAX_COMPILED
@@ -0,0 +1,28 @@
+from prometheus_client import REGISTRY
+
+from app.consumer_orders import decode_message
+from app.metrics import record_orders
+from app.publisher import row_envelopes
+
+ROW = {"order_id": "ON-1", "order_date": "2025-01-01", "customer_name": "an", "total_amount": "5", "status": "paid"}
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stages_are_observed_once_per_message():
+    before = {stage: _sample("etl_stage_seconds_count", stage=stage) for stage in ("decode", "normalize", "validate")}
+    (envelope,) = row_envelopes("metrics-test", [ROW] * 50, rows_per_message=50)
+    decode_message(envelope.body)
+    for stage, count in before.items():
+        assert _sample("etl_stage_seconds_count", stage=stage) == count + 1
+    assert _sample("etl_stage_seconds_sum", stage="normalize") > 0
+
+
+def test_record_orders_counts_outcomes_per_source():
+    (envelope,) = row_envelopes("metrics-count", [ROW, {**ROW, "order_id": ""}, {**ROW, "total_amount": "5k"}], 3)
+    record_orders(decode_message(envelope.body))
+    assert _sample("etl_clean_rows_total", source="metrics-count") == 2
+    assert _sample("etl_error_rows_total", source="metrics-count") == 1
+    assert _sample("etl_fixed_rows_total", source="metrics-count") >= 1
@@ -0,0 +1,72 @@
+from datetime import date
+
+from sqlalchemy.dialects import postgresql
+
+from app import partitions
+from app.partitions import add_months, ensure_partitions, partition_name, table_ddl, upsert_sql
+
+
+class FakeResult:
+    def __init__(self, value=None, rows=()):
+        self.value, self.rows = value, rows
+
+    def scalar(self):
+        return self.value
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeConnection:
+    """Answers the catalog queries of ``ensure_partitions`` and records everything else."""
+
+    def __init__(self, existing=(), waiting=()):
+        self.existing = set(existing)
+        self.waiting = waiting
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if "pg_partitioned_table" in sql:
+            return FakeResult(True)
+        if "to_regclass(:name) IS NOT NULL" in sql:
+            return FakeResult(params["name"] in self.existing)
+        if "date_trunc" in sql:
+            return FakeResult(rows=[(month,) for month in self.waiting] if "orders_clean_default" in sql else [])
+        self.statements.append(sql)
+        return FakeResult()
+
+
+def test_month_arithmetic_and_names():
+    assert add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert partition_name("orders_clean", date(2026, 2, 1)) == "orders_clean_p202602"
+
+
+def test_partitioned_ddl_keys_on_the_partition_column():
+    ddl = table_ddl("orders_clean", postgresql.dialect())
+    assert ddl.endswith("PRIMARY KEY (id, order_date)) PARTITION BY RANGE (order_date)")
+    assert "id INTEGER NOT NULL DEFAULT nextval('orders_clean_id_seq')" in ddl
+    raw_ddl = table_ddl("orders", postgresql.dialect())
+    assert "created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL" in raw_ddl
+
+
+def test_ensure_creates_missing_months_and_drains_default():
+    connection = FakeConnection(existing={"orders_p202511"}, waiting=[date(2024, 3, 1)])
+    created = ensure_partitions(connection, months_ahead=1, today=date(2025, 11, 17))
+    assert "orders_p202511" not in created
+    assert {"orders_p202512", "orders_clean_p202403", "orders_clean_p202511", "orders_error_p202512"} <= set(created)
+    statements = "\n".join(connection.statements)
+    assert "ATTACH PARTITION orders_clean_p202403 FOR VALUES FROM ('2024-03-01') TO ('2024-04-01')" in statements
+    assert "DELETE FROM orders_clean_default" in statements and "INSERT INTO orders_clean_p202403" in statements
+
+
+def test_upsert_replaces_only_changed_rows():
+    sql = upsert_sql("orders", ["order_id", "content_hash"], "SELECT 1")
+    assert "DELETE FROM orders AS t USING incoming AS i" in sql
+    assert "t.content_hash IS DISTINCT FROM i.content_hash" in sql
+    assert sql.endswith("WHERE t.order_id = i.order_id AND t.content_hash = i.content_hash)")
+    assert partitions.casts_for("orders_clean", ["order_id", "order_date", "total_amount"]) == {
+        "order_date": "DATE",
+        "total_amount": "NUMERIC(10, 2)",
+    }
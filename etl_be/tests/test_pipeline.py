@@ -0,0 +1,42 @@
+from datetime import date
+
+from app.pipeline import process_order, process_row
+
+
+def test_process_order_accepts_and_builds_clean_values():
+    row = {
+        "order_id": " ON-1 ",
+        "order_date": "01/11/2025",
+        "customer_id": "C-1",
+        "customer_name": "le thi nga",
+        "total_amount": "120.5",
+        "status": "paid",
+    }
+    order = process_order("online", row)
+    assert order.is_valid
+    assert order.was_fixed
+    assert order.raw["order_id"] == " ON-1 "
+    values = order.clean_values()
+    assert values["order_id"] == "ON-1"
+    assert values["order_date"] == date(2025, 11, 1)
+    assert values["customer_name"] == "Le Thi Nga"
+    assert values["total_amount"] == 120.5
+    assert values["status"] == "PAID"
+
+
+def test_process_order_rejects_with_error_reason():
+    row = {"id": "OF-9", "date": "32/13/2025", "name": "", "total": "-5", "order_status": "DONE"}
+    order = process_order("offline", row)
+    assert not order.is_valid
+    values = order.error_values()
+    assert values["order_id"] == "OF-9"
+    assert "customer_name missing" in values["error_reason"]
+    assert "order_date invalid format" in values["error_reason"]
+
+
+def test_process_row_turns_broken_row_into_error_outcome():
+    order = process_row("online", {"order_id": "ON-7", "customer_name": 123, "order_date": 20251101})
+    assert not order.is_valid
+    assert order.order_id == "ON-7"
+    assert order.raw["order_date"] == "20251101"
+    assert order.error_reason.startswith("row could not be processed: ")
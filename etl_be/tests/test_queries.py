@@ -0,0 +1,70 @@
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+from app.db import Base, OrdersClean, OrdersError
+from app.queries import (
+    InvalidCursor,
+    OrderFilters,
+    csv_chunks,
+    decode_cursor,
+    encode_cursor,
+    fetch_page,
+    ndjson_chunks,
+    stream_rows,
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    rows = [
+        {
+            "order_id": f"ON-{i}",
+            "source": "online" if i % 2 else "offline",
+            "order_date": date(2025, 1, 1 + i),
+            "customer_id": "C-1",
+            "customer_name": "Le Thi Nga",
+            "total_amount": 10 + i,
+            "status": "PAID",
+        }
+        for i in range(7)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(OrdersClean), rows)
+    return engine
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    assert decode_cursor(encode_cursor(42)) == 42
+    for bad in ("", "not-a-cursor", encode_cursor(1)[:-1] + "!"):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(bad)
+
+
+def test_keyset_pages_walk_newest_first_without_overlap(engine):
+    seen, cursor = [], None
+    while True:
+        items, cursor = fetch_page(engine, OrdersClean, OrderFilters(), 3, cursor)
+        seen.extend(item["order_id"] for item in items)
+        if cursor is None:
+            break
+    assert seen == [f"ON-{i}" for i in reversed(range(7))]
+
+    items, cursor = fetch_page(
+        engine, OrdersClean, OrderFilters(source="online", date_from=date(2025, 1, 3), date_to=date(2025, 1, 6)), 10
+    )
+    assert [item["order_id"] for item in items] == ["ON-5", "ON-3"]
+    assert items[0]["order_date"] == "2025-01-06" and items[0]["total_amount"] == 15.0
+    assert cursor is None
+
+
+def test_export_formats(engine):
+    lines = b"".join(ndjson_chunks(stream_rows(engine, OrdersClean, OrderFilters(status="PAID"), 2))).splitlines()
+    assert len(lines) == 7 and json.loads(lines[0])["order_id"] == "ON-6"
+
+    text = b"".join(csv_chunks(stream_rows(engine, OrdersError, OrderFilters(), 2), ["order_id", "error_reason"]))
+    assert text == b"order_id,error_reason\n"
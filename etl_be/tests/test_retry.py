@@ -0,0 +1,138 @@
+import dataclasses
+
+from sqlalchemy.exc import OperationalError
+
+from app import consumer_orders
+from app.config import Settings
+from app.consumer_orders import decode_message, settle_batch
+from app.retry import RETRY_HEADER, MalformedMessage, is_transient, next_route, parking_queue
+
+SETTINGS = dataclasses.replace(
+    Settings(),
+    rabbitmq_queue="orders_raw",
+    consumer_max_retries=2,
+    consumer_retry_base_delay_ms=1000,
+    db_breaker_base_delay=0.01,
+    db_breaker_max_delay=0.01,
+)
+JSON = "application/json"
+
+
+class FakeConnection:
+    def sleep(self, seconds):
+        pass
+
+
+class FakeChannel:
+    def __init__(self):
+        self.connection = FakeConnection()
+        self.acked, self.nacked, self.published, self.properties = [], [], [], []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acked.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        self.nacked.append((delivery_tag, multiple, requeue))
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties.headers))
+        self.properties.append(properties)
+
+
+def test_retry_route_backs_off_then_parks():
+    error = RuntimeError("constraint violated")
+    first, headers = next_route(SETTINGS, "orders_raw", None, error)
+    assert first == "orders_raw.retry.1000ms" and headers[RETRY_HEADER] == 1
+    second, headers = next_route(SETTINGS, "orders_raw", headers, error)
+    assert second == "orders_raw.retry.2000ms"
+    parked, headers = next_route(SETTINGS, "orders_raw", headers, error)
+    assert parked == parking_queue("orders_raw") and headers["x-last-error"] == "RuntimeError: constraint violated"
+
+    assert next_route(SETTINGS, "orders_raw", None, MalformedMessage("not json"))[0] == "orders_raw.parked"
+
+
+def test_bad_body_is_malformed():
+    for body in (b"{not json", b"[1, 2]", b'{"rows": 5}'):
+        try:
+            decode_message(body)
+        except MalformedMessage:
+            continue
+        raise AssertionError(body)
+
+
+def test_poison_message_is_retried_and_the_rest_acked(monkeypatch):
+    def handle_batch(messages, settings, SessionLocal):
+        if any(body == b"poison" for body, _ in messages):
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(consumer_orders, "handle_batch", handle_batch)
+    channel = FakeChannel()
+    batch = [(1, b"ok", None, JSON), (2, b"poison", None, JSON), (3, b"ok", None, JSON)]
+    settle_batch(channel, batch, SETTINGS, None)
+    assert channel.published == [("orders_raw.retry.1000ms", b"poison", channel.published[0][2])]
+    assert channel.properties[0].content_type == JSON
+    assert sorted(tag for tag, _ in channel.acked) == [1, 2, 3] and not channel.nacked
+
+
+def test_transient_db_error_holds_the_batch_until_the_database_is_back(monkeypatch):
+    calls = []
+
+    def handle_batch(messages, settings, SessionLocal):
+        calls.append(messages)
+        if len(calls) < 3:
+            raise OperationalError("SELECT 1", {}, Exception("server closed the connection"))
+
+    monkeypatch.setattr(consumer_orders, "handle_batch", handle_batch)
+    channel = FakeChannel()
+    settle_batch(channel, [(1, b"a", None, None), (2, b"b", None, None)], SETTINGS, None)
+    assert len(calls) == 3 and all(len(messages) == 2 for messages in calls)  # never bisected or retried per message
+    assert channel.acked == [(2, True)] and not channel.published and not channel.nacked
+
+
+class PgError(Exception):
+    """Stands in for a psycopg2 error carrying a SQLSTATE."""
+
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def _operational(pgcode):
+    return OperationalError("UPDATE orders_daily_stats ...", {}, PgError(pgcode))
+
+
+def test_operational_errors_are_classified_by_sqlstate():
+    for code in ("08006", "57P01", "57P03", "53300"):
+        assert is_transient(_operational(code)), code
+    # Division by zero, numeric overflow, statement timeout, deadlock, serialization failure.
+    for code in ("22012", "22003", "57014", "40P01", "40001"):
+        assert not is_transient(_operational(code)), code
+
+
+def test_data_caused_operational_error_is_retried_not_held(monkeypatch):
+    def handle_batch(messages, settings, SessionLocal):
+        if any(body == b"poison" for body, _ in messages):
+            raise _operational("22012")
+
+    monkeypatch.setattr(consumer_orders, "handle_batch", handle_batch)
+    channel = FakeChannel()
+    settle_batch(channel, [(1, b"ok", None, JSON), (2, b"poison", None, JSON)], SETTINGS, None)
+    assert [(queue, body) for queue, body, _ in channel.published] == [("orders_raw.retry.1000ms", b"poison")]
+    assert sorted(tag for tag, _ in channel.acked) == [1, 2] and not channel.nacked
+
+
+def test_breaker_pauses_are_capped_per_batch(monkeypatch):
+    calls = []
+
+    def handle_batch(messages, settings, SessionLocal):
+        calls.append(messages)
+        raise OperationalError("SELECT 1", {}, Exception("server closed the connection"))
+
+    monkeypatch.setattr(consumer_orders, "handle_batch", handle_batch)
+    channel = FakeChannel()
+    settings = dataclasses.replace(SETTINGS, db_breaker_max_pauses=3)
+    settle_batch(channel, [(1, b"a", None, None), (2, b"b", None, None)], settings, None)
+    # Four tries of the whole batch, then one try per half, each going to its retry queue.
+    assert [len(messages) for messages in calls] == [2, 2, 2, 2, 1, 1]
+    assert [body for _, body, _ in channel.published] == [b"a", b"b"]
+    assert sorted(tag for tag, _ in channel.acked) == [1, 2] and not channel.nacked
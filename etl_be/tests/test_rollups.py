@@ -0,0 +1,89 @@
+from datetime import date
+
+from sqlalchemy import create_engine, insert, text, update
+
+from app.db import OrdersClean, OrdersError, create_tables
+from app.rollups import ROLLUPS, daily_stats, delta_sql, delta_statements, error_reasons, rebuild, source_summary
+
+BATCH = "SELECT order_id FROM batch_ids"
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}")
+    create_tables(engine)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE batch_ids (order_id TEXT)"))
+    return engine
+
+
+def _clean(order_id, amount, status="PAID", day=date(2025, 11, 1), source="online"):
+    return {
+        "order_id": order_id,
+        "source": source,
+        "order_date": day,
+        "customer_name": "an",
+        "total_amount": amount,
+        "status": status,
+    }
+
+
+def _write(engine, table, rows, change):
+    """What the writers do: retract the batch's orders, change them, add them back."""
+    retract, add = delta_statements(BATCH)[table]
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM batch_ids"))
+        ids = [{"order_id": row["order_id"]} for row in rows]
+        connection.execute(text("INSERT INTO batch_ids VALUES (:order_id)"), ids)
+        connection.execute(text(retract))
+        change(connection)
+        connection.execute(text(add))
+
+
+def test_deltas_follow_inserts_and_changed_orders(tmp_path):
+    engine = _engine(tmp_path)
+    rows = [_clean("ON-1", 10), _clean("ON-2", 5), _clean("OFF-1", 7, source="offline")]
+    _write(engine, "orders_clean", rows, lambda c: c.execute(insert(OrdersClean), rows))
+
+    # ON-1 changes amount, ON-2 changes status; the replay of OFF-1 changes nothing.
+    changed = [_clean("ON-1", 12), _clean("ON-2", 5, status="CANCELLED"), rows[2]]
+
+    def upsert(connection):
+        for row in changed:
+            connection.execute(update(OrdersClean).where(OrdersClean.order_id == row["order_id"]).values(**row))
+
+    _write(engine, "orders_clean", changed, upsert)
+    assert daily_stats(engine, source="online") == [
+        {"order_date": "2025-11-01", "source": "online", "status": "CANCELLED", "orders": 1, "revenue": 5.0},
+        {"order_date": "2025-11-01", "source": "online", "status": "PAID", "orders": 1, "revenue": 12.0},
+    ]
+    assert daily_stats(engine, date_from=date(2025, 11, 2)) == []
+
+    errors = [{"order_id": f"E-{i}", "source": "offline", "error_reason": "invalid date"} for i in range(3)]
+    _write(engine, "orders_error", errors, lambda c: c.execute(insert(OrdersError), errors))
+    summary = source_summary(engine)
+    assert summary["sources"][0] == {"source": "offline", "orders": 1, "revenue": 7.0, "errors": 3, "error_rate": 0.75}
+    assert summary["total"] == {"orders": 3, "revenue": 24.0, "errors": 3, "error_rate": 0.5}
+    assert error_reasons(engine) == [{"source": "offline", "error_reason": "invalid date", "errors": 3}]
+
+    # A rebuild from the stored rows lands on the same numbers.
+    before = daily_stats(engine)
+    rebuild(engine)
+    assert daily_stats(engine) == before
+    assert source_summary(engine) == summary
+
+
+def test_create_tables_fills_new_rollups_from_existing_rows(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'existing.db'}")
+    OrdersClean.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(OrdersClean), [_clean("ON-1", 10), _clean("ON-2", 2.5, status=None)])
+    create_tables(engine)
+    assert [(item["status"], item["revenue"]) for item in daily_stats(engine)] == [("", 2.5), ("PAID", 10.0)]
+
+
+def test_deltas_lock_rollup_rows_in_group_key_order():
+    for table, (_, keys, _, _) in ROLLUPS.items():
+        positions = ", ".join(str(i) for i in range(1, len(keys) + 1))
+        for sign in (-1, 1):
+            sql = delta_sql(table, BATCH, sign)
+            assert f"GROUP BY {positions} ORDER BY {positions} ON CONFLICT" in sql
@@ -0,0 +1,48 @@
+import dataclasses
+
+import pytest
+
+from app.config import Settings
+from app.consumer_orders import prefetch_count
+from app.routing import all_lanes, lane_for, routing_key, select_lanes
+
+SETTINGS = dataclasses.replace(
+    Settings(),
+    rabbitmq_queue="orders_raw",
+    rabbitmq_exchange="orders",
+    consumer_lanes="",
+    consumer_workers=1,
+    consumer_prefetch=0,
+    consumer_batch_size=100,
+    online_lane_workers=4,
+    online_lane_prefetch=20,
+    online_lane_max_priority=10,
+    offline_lane_workers=0,
+    offline_lane_prefetch=0,
+)
+
+
+def test_lanes_get_own_queue_workers_and_prefetch():
+    online, offline = all_lanes(SETTINGS)
+    assert (online.queue, online.workers, online.prefetch) == ("orders_raw.online", 4, 20)
+    assert online.arguments == {"x-max-priority": 10}
+    # Unset lane values fall back to the global consumer settings.
+    assert (offline.queue, offline.workers, offline.prefetch, offline.arguments) == ("orders_raw.offline", 1, 0, None)
+    assert prefetch_count(SETTINGS, online) == 20
+    assert prefetch_count(SETTINGS, offline) == 200
+
+
+def test_select_lanes_and_routing_keys():
+    assert [lane.name for lane in select_lanes(SETTINGS)] == ["online", "offline"]
+    assert [lane.name for lane in select_lanes(dataclasses.replace(SETTINGS, consumer_lanes="offline"))] == ["offline"]
+    assert [lane.name for lane in select_lanes(SETTINGS, ["online"])] == ["online"]
+    assert routing_key(SETTINGS, "offline") == "offline"
+    with pytest.raises(ValueError):
+        lane_for(SETTINGS, "batch")
+
+
+def test_without_exchange_everything_uses_the_single_queue():
+    legacy = dataclasses.replace(SETTINGS, rabbitmq_exchange="")
+    (lane,) = select_lanes(legacy, ["online"])
+    assert lane.queue == "orders_raw" and lane.arguments is None
+    assert routing_key(legacy, "online") == "orders_raw"
@@ -31,3 +31,29 @@ def test_validate_order_failure():
     assert "customer_name has digits" in errors
     assert any("order_date" in err for err in errors)
 
+
+
+def test_validate_order_date_formats():
+    base = {
+        "order_id": "OF-1",
+        "customer_id": "C1",
+        "customer_name": "Le Thi Nga",
+        "total_amount": "10",
+        "status": "DONE",
+    }
+    cases = {
+        "2025-11-01": "2025-11-01",
+        "01/11/2025": "2025-11-01",
+        "01-11-2025": "2025-11-01",
+        "1/11/2025": "2025-11-01",
+        " 2025-11-01 ": "2025-11-01",
+    }
+    for raw, expected in cases.items():
+        record = {**base, "order_date": raw}
+        valid, _ = validate_order(record)
+        assert valid, raw
+        assert record["order_date"] == expected
+    for raw in ("2025-02-30", "01/11-2025", "2025/11/01", ""):
+        valid, errors = validate_order({**base, "order_date": raw})
+        assert not valid
+        assert errors == ["order_date invalid format"]
@@ -4,6 +4,7 @@ import {
   getOrdersClean,
   getOrdersError,
   OrderItem,
+  subscribeOrders,
 } from "./api";
 import UploadCard from "./components/UploadCard";
 import OrdersTable from "./components/OrdersTable";
@@ -58,6 +59,21 @@ const App: React.FC = () => {
     }
   }, [activeTab]);
 
+  // Đơn mới được đẩy từ server (SSE) thay vì phải bấm tải lại.
+  useEffect(() => {
+    if (activeTab !== "dashboard") {
+      return;
+    }
+    return subscribeOrders((frame) => {
+      if (frame.clean.length) {
+        setCleanOrders((prev) => [...frame.clean, ...prev].slice(0, 100));
+      }
+      if (frame.error.length) {
+        setErrorOrders((prev) => [...frame.error, ...prev].slice(0, 100));
+      }
+    });
+  }, [activeTab]);
+
   return (
     <div className="app">
       <header className="app-header">
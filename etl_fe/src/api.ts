@@ -6,6 +6,21 @@ const api = axios.create({
 
 export interface UploadResponse {
   published: number;
+  job_id: string;
+}
+
+export interface UploadJob {
+  job_id: string;
+  state: "publishing" | "processing" | "done" | "done_with_errors" | "failed";
+  published: number;
+  processed: number;
+  clean: number;
+  error: number;
+  fixed: number;
+  parked: number;
+  progress: number | null;
+  rows_per_second: number | null;
+  eta_seconds: number | null;
 }
 
 export interface OrderItem {
@@ -16,6 +31,7 @@ export interface OrderItem {
   customer_name: string;
   total_amount: number;
   status: string;
+  job_id?: string | null;
   created_at: string | null;
   error_reason?: string;
 }
@@ -23,6 +39,16 @@ export interface OrderItem {
 export interface OrdersResponse {
   items: OrderItem[];
   count: number;
+  next_cursor?: string | null;
+}
+
+export type SourceCounts = Record<string, { clean: number; error: number }>;
+
+export interface LiveFrame {
+  clean: OrderItem[];
+  error: OrderItem[];
+  counts: SourceCounts;
+  totals: SourceCounts;
 }
 
 export async function uploadCsv(
@@ -37,6 +63,11 @@ export async function uploadCsv(
   return data;
 }
 
+export async function getJob(jobId: string): Promise<UploadJob> {
+  const { data } = await api.get<UploadJob>(`/jobs/${jobId}`);
+  return data;
+}
+
 export async function getOrdersClean(limit = 100): Promise<OrdersResponse> {
   const { data } = await api.get<OrdersResponse>("/orders/clean", {
     params: { limit },
@@ -51,6 +82,15 @@ export async function getOrdersError(limit = 100): Promise<OrdersResponse> {
   return data;
 }
 
+// Server-Sent Events from GET /orders/live; returns a function that closes the stream.
+export function subscribeOrders(onFrame: (frame: LiveFrame) => void): () => void {
+  const source = new EventSource("/api/orders/live");
+  source.addEventListener("orders", (event) => {
+    onFrame(JSON.parse((event as MessageEvent<string>).data) as LiveFrame);
+  });
+  return () => source.close();
+}
+
 export async function checkHealth(): Promise<boolean> {
   try {
     const { data } = await api.get<{ status: string }>("/health");
@@ -1,5 +1,5 @@
-import React, { useState } from "react";
-import { uploadCsv } from "../api";
+import React, { useEffect, useState } from "react";
+import { getJob, uploadCsv, UploadJob } from "../api";
 
 interface Props {
   source: "online" | "offline";
@@ -12,6 +12,42 @@ const UploadCard: React.FC<Props> = ({ source, title, description }) => {
   const [isLoading, setIsLoading] = useState(false);
   const [message, setMessage] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [jobId, setJobId] = useState<string | null>(null);
+  const [job, setJob] = useState<UploadJob | null>(null);
+
+  // Theo dõi tiến độ xử lý của lần upload cho tới khi consumer xử lý xong.
+  useEffect(() => {
+    if (!jobId) {
+      return;
+    }
+    let stopped = false;
+    const poll = async () => {
+      try {
+        const current = await getJob(jobId);
+        if (stopped) {
+          return;
+        }
+        setJob(current);
+        if (
+          current.state === "done" ||
+          current.state === "done_with_errors" ||
+          current.state === "failed"
+        ) {
+          return;
+        }
+      } catch {
+        // Thử lại ở lần poll sau.
+      }
+      if (!stopped) {
+        timer = window.setTimeout(poll, 1000);
+      }
+    };
+    let timer = window.setTimeout(poll, 0);
+    return () => {
+      stopped = true;
+      window.clearTimeout(timer);
+    };
+  }, [jobId]);
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setMessage(null);
@@ -28,9 +64,11 @@ const UploadCard: React.FC<Props> = ({ source, title, description }) => {
     setIsLoading(true);
     setMessage(null);
     setError(null);
+    setJob(null);
     try {
       const res = await uploadCsv(source, file);
       setMessage(`Đã publish ${res.published} dòng lên hàng đợi.`);
+      setJobId(res.job_id);
     } catch (err: any) {
       const detail = err?.response?.data?.detail ?? "Không thể upload file.";
       setError(detail);
@@ -60,6 +98,16 @@ const UploadCard: React.FC<Props> = ({ source, title, description }) => {
         </button>
       </div>
       {message && <p className="status success">{message}</p>}
+      {job && (
+        <p className="status">
+          Đã xử lý {job.processed}/{job.published} dòng ({job.clean} sạch, {job.error} lỗi)
+          {job.rows_per_second !== null && ` · ${job.rows_per_second} dòng/s`}
+          {job.eta_seconds !== null && ` · còn khoảng ${Math.ceil(job.eta_seconds)} s`}
+          {job.parked > 0 && ` · ${job.parked} dòng bị park`}
+          {job.state === "done" && " · hoàn tất"}
+          {job.state === "done_with_errors" && " · hoàn tất (có message bị park)"}
+        </p>
+      )}
       {error && <p className="status error">{error}</p>}
     </div>
   );